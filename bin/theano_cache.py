@@ -30,7 +30,13 @@ def print_help(exit_status):
     print('Type "theano-cache unlock" to unlock the cache directory')
     print('Type "theano-cache cleanup" to delete keys in the old '
           'format/code version')
+    print('Type "theano-cache reindex" to rebuild the index of the cache '
+          'directory')
     print('Type "theano-cache purge" to force deletion of the cache directory')
+    print('Type "theano-cache probes" to list the cached results of the '
+          'compiler and BLAS probes')
+    print('Type "theano-cache probes clear" to forget them, so that the '
+          'next process runs the probes again')
     print('Type "theano-cache basecompiledir" '
           'to print the parent of the cache directory')
     print('Type "theano-cache basecompiledir list" '
@@ -74,6 +80,9 @@ def main():
             theano.gof.compiledir.cleanup()
             cache = get_module_cache(init_args=dict(do_refresh=False))
             cache.clear_old()
+        elif sys.argv[1] == 'reindex':
+            cache = get_module_cache(init_args=dict(do_refresh=False))
+            cache.refresh(full_scan=True)
         elif sys.argv[1] == 'unlock':
             theano.gof.compilelock.force_unlock()
             print('Lock successfully removed!')
@@ -82,6 +91,13 @@ def main():
         elif sys.argv[1] == 'basecompiledir':
             # Simply print the base_compiledir
             print(theano.config.base_compiledir)
+        elif sys.argv[1] == 'probes':
+            cache = theano.gof.cmodule.get_probe_cache()
+            print('%d cached probe results in %s' % (len(cache.results),
+                                                     cache.path))
+            names = sorted(name for name, result in cache.results.values())
+            for name in sorted(set(names)):
+                print('  %s: %d' % (name, names.count(name)))
         else:
             print_help(exit_status=1)
     elif len(sys.argv) == 3 and sys.argv[1] == 'basecompiledir':
@@ -91,6 +107,11 @@ def main():
             theano.gof.compiledir.basecompiledir_purge()
         else:
             print_help(exit_status=1)
+    elif len(sys.argv) == 3 and sys.argv[1] == 'probes':
+        if sys.argv[2] == 'clear':
+            theano.gof.cmodule.get_probe_cache().clear()
+        else:
+            print_help(exit_status=1)
     else:
         print_help(exit_status=1)
 
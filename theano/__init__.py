@@ -112,7 +112,7 @@ from theano.compile import (
     SymbolicOutput, Out,
     Mode,
     predefined_modes, predefined_linkers, predefined_optimizers,
-    FunctionMaker, function, function_dump,
+    FunctionMaker, function, function_dump, function_family,
     OpFromGraph,
     ProfileStats,
     Param, shared, as_op)
@@ -138,15 +138,17 @@ from theano.updates import OrderedUpdates
 
 from theano.gradient import Rop, Lop, grad, subgraph_grad
 
-# This need to be before the init of GPU, as it add config variable
-# needed during that phase.
-import theano.tests
-if hasattr(theano.tests, "TheanoNoseTester"):
-    test = theano.tests.TheanoNoseTester().test
-else:
-    def test():
+
+def test(*args, **kwargs):
+    """Run the Theano test suite, see `theano.tests.main.TheanoNoseTester`.
+
+    theano.tests is only imported here, to keep it out of `import theano`.
+    """
+    import theano.tests
+    if not hasattr(theano.tests, "TheanoNoseTester"):
         raise ImportError("The nose module is not installed."
                           " It is needed for Theano tests.")
+    return theano.tests.TheanoNoseTester().test(*args, **kwargs)
 
 if (config.device.startswith('cuda') or
         config.device.startswith('opencl') or
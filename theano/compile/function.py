@@ -11,9 +11,10 @@ import re
 
 from six import string_types
 from theano.compile.function_module import orig_function
-from theano.compile.pfunc import pfunc
+from theano.compile.io import In
+from theano.compile.pfunc import pfunc, rebuild_collect_shared
 import warnings
-from theano import compat
+from theano import compat, gof
 
 __docformat__ = "restructuredtext en"
 _logger = logging.getLogger('theano.compile.function')
@@ -316,3 +317,307 @@ def function(inputs, outputs=None, mode=None, updates=None, givens=None,
                    profile=profile,
                    output_keys=output_keys)
     return fn
+
+
+class FunctionFamilyMember(object):
+    """
+    A member of a :class:`FunctionFamily`.
+
+    Calling it computes only the outputs and the updates of this member in
+    the merged function of the family, and applies these updates.
+
+    Attributes
+    ----------
+    name
+        The name of the member in the family.
+    family : FunctionFamily
+        The family it belongs to.
+    inputs : list of Variables
+        The inputs it takes, in order.
+
+    """
+
+    def __init__(self, family, name, inputs, input_idx, output_idx,
+                 updates, unpack_single, return_none):
+        self.family = family
+        self.name = name
+        self.inputs = inputs
+        self.input_idx = input_idx
+        self.output_idx = output_idx
+        # list of (shared variable, index of its new value)
+        self.updates = updates
+        self.unpack_single = unpack_single
+        self.return_none = return_none
+        # Compiled on its own when the merged function can not compute a
+        # subset of its outputs.
+        self.fn = None
+
+    def __call__(self, *args):
+        if len(args) != len(self.inputs):
+            raise TypeError("%s takes %i arguments (%i given)" % (
+                self.name, len(self.inputs), len(args)))
+        if self.fn is not None:
+            return self.fn(*args)
+        full_args = [None] * len(self.family.inputs)
+        for j, arg in zip(self.input_idx, args):
+            full_args[j] = arg
+        return self.family._call([self], full_args)[0]
+
+    def _pack(self, values):
+        if self.return_none:
+            return None
+        outputs = [values[i] for i in self.output_idx]
+        if self.unpack_single:
+            return outputs[0]
+        return outputs
+
+    def __repr__(self):
+        return "FunctionFamilyMember(%r)" % (self.name,)
+
+
+class FunctionFamily(object):
+    """
+    Several functions compiled into one merged function.
+
+    Returned by :func:`function_family`. The members are the callable
+    :class:`FunctionFamilyMember` objects, accessed by name with
+    ``family[name]``. Calling the family itself computes several members
+    in a single call of the merged function, so that the computations
+    they have in common are only done once.
+
+    Attributes
+    ----------
+    function : Function
+        The merged function. Its outputs are the outputs of all the members
+        followed by the new values of their shared variables, and it does
+        not apply any update itself.
+    inputs : list of Variables
+        The union of the inputs of the members, in order of appearance. They
+        are the arguments of the family when it is called.
+    members : OrderedDict
+        The members of the family, by name.
+
+    """
+
+    def __init__(self, function, inputs):
+        self.function = function
+        self.inputs = inputs
+        self.members = compat.OrderedDict()
+        vm = function.fn
+        self.partial_eval = (
+            isinstance(vm, gof.vm.Stack) or
+            isinstance(vm, getattr(gof.vm, 'CVM', ())))
+
+    def __getitem__(self, name):
+        return self.members[name]
+
+    def __iter__(self):
+        return iter(self.members.values())
+
+    def __len__(self):
+        return len(self.members)
+
+    def __call__(self, *args, **kwargs):
+        """
+        Compute several members in one call.
+
+        Parameters
+        ----------
+        args
+            The values of all the inputs of the family, in the order of
+            ``family.inputs``.
+        members : list of names, optional
+            The members to compute, all of them by default.
+
+        Returns
+        -------
+        list
+            What each of the members returns, in the order of ``members``.
+
+        """
+        names = kwargs.pop('members', None)
+        if kwargs:
+            raise TypeError("Unexpected keyword arguments: %s" %
+                            ", ".join(sorted(kwargs)))
+        if len(args) != len(self.inputs):
+            raise TypeError("The family takes %i arguments (%i given)" % (
+                len(self.inputs), len(args)))
+        if names is None:
+            members = list(self.members.values())
+        else:
+            members = [self.members[n] for n in names]
+        if any(m.fn is not None for m in members):
+            return [m(*[args[j] for j in m.input_idx]) for m in members]
+        return self._call(members, list(args))
+
+    def _call(self, members, args):
+        subset = []
+        updates = compat.OrderedDict()
+        for m in members:
+            subset.extend(m.output_idx)
+            for var, idx in m.updates:
+                if updates.get(var, idx) != idx:
+                    raise ValueError(
+                        "Several of the members called together update the "
+                        "shared variable %s" % var)
+                updates[var] = idx
+                subset.append(idx)
+        subset = sorted(set(subset))
+        if self.partial_eval:
+            outputs = self.function(*args, output_subset=subset)
+            values = dict(zip(subset, outputs))
+        else:
+            values = dict(enumerate(self.function(*args)))
+        for var, idx in updates.items():
+            var.container.data = values[idx]
+        return [m._pack(values) for m in members]
+
+    def __repr__(self):
+        return "FunctionFamily(%s)" % ", ".join(
+            repr(n) for n in self.members)
+
+
+def function_family(members, mode=None, no_default_updates=False,
+                    name=None, rebuild_strict=True, allow_input_downcast=None,
+                    profile=None, on_unused_input=None):
+    """
+    Compile several functions of the same inputs into one merged function.
+
+    Functions called one after the other on the same inputs and shared
+    variables, like the training, validation and monitoring functions of a
+    model, usually recompute the same subexpressions. `function_family`
+    builds a single graph holding the outputs and the updates of all of
+    them, so that the optimizations, and `MergeOptimizer` in particular,
+    see and share their common parts. Each member is then a cheap view on
+    the merged function, computing only its own outputs and updates by
+    passing ``output_subset`` to it.
+
+    Parameters
+    ----------
+    members : OrderedDict or list of (name, dict) pairs
+        For each member, its name and the keyword arguments ``inputs``,
+        ``outputs``, ``updates``, ``givens`` and ``no_default_updates``
+        it would be given to :func:`function`.
+    mode, name, rebuild_strict, allow_input_downcast, profile, on_unused_input
+        As in :func:`function`, for the merged function.
+    no_default_updates
+        As in :func:`function`, the default for the members that do not
+        specify it.
+
+    Returns
+    -------
+    :class:`FunctionFamily`
+
+    Notes
+    -----
+    The inputs of a member that are not used by the other members it is
+    called with are not computed, which needs a linker evaluating only
+    part of the graph: the VM linkers of the default modes do it, and a
+    ``VM_Linker`` using the Python VMs is given ``allow_partial_eval=True``
+    for the merged function. With the other linkers, the members are
+    compiled separately.
+
+    """
+    from theano.compile.mode import get_mode
+    from theano.compile.sharedvalue import SharedVariable
+
+    if hasattr(members, 'items'):
+        members = list(members.items())
+    mode = get_mode(mode)
+    linker = mode.linker
+    if (isinstance(linker, gof.vm.VM_Linker) and
+            not linker.use_cloop and not linker.allow_partial_eval):
+        mode = mode.clone()
+        mode.linker.allow_partial_eval = True
+
+    inputs = []
+    input_vars = []
+    outputs = []
+    specs = []
+    for m_name, kwargs in members:
+        kwargs = dict(kwargs)
+        m_inputs = list(kwargs.pop('inputs', []))
+        m_outputs = kwargs.pop('outputs', None)
+        m_updates = kwargs.pop('updates', None)
+        givens = kwargs.pop('givens', None)
+        m_no_default_updates = kwargs.pop('no_default_updates',
+                                          no_default_updates)
+        if kwargs:
+            raise TypeError("Unexpected arguments for member %s: %s" % (
+                m_name, ", ".join(sorted(kwargs))))
+        m_vars = [i.variable if isinstance(i, In) else i for i in m_inputs]
+        input_idx = []
+        for i, var in zip(m_inputs, m_vars):
+            if var not in input_vars:
+                input_vars.append(var)
+                inputs.append(i)
+            input_idx.append(input_vars.index(var))
+
+        unpack_single = not isinstance(m_outputs, (list, tuple))
+        return_none = m_outputs is None
+        if m_outputs is None:
+            m_outputs = []
+        elif unpack_single:
+            m_outputs = [m_outputs]
+        _, cloned_outputs, other = rebuild_collect_shared(
+            list(m_outputs), m_vars, replace=givens, updates=m_updates,
+            rebuild_strict=rebuild_strict,
+            no_default_updates=m_no_default_updates)
+        update_expr = other[2]
+        new_values = [other[1][var] for var, _ in update_expr]
+
+        # Each member must only depend on its own inputs, as it would
+        # when compiled on its own.
+        for var in gof.graph.inputs(
+                [getattr(o, 'variable', o) for o in cloned_outputs] +
+                new_values):
+            if not (var in m_vars or isinstance(var, SharedVariable) or
+                    isinstance(var, gof.Constant)):
+                raise gof.MissingInputError(
+                    "Input of member %s missing from its inputs" % m_name,
+                    variable=var)
+
+        output_idx = list(range(len(outputs), len(outputs) +
+                                len(cloned_outputs)))
+        outputs.extend(cloned_outputs)
+        specs.append(dict(
+            name=m_name, inputs=m_inputs, input_idx=input_idx,
+            output_idx=output_idx, update_vars=[v for v, _ in update_expr],
+            new_values=new_values, unpack_single=unpack_single,
+            return_none=return_none,
+            kwargs=dict(outputs=None if return_none else
+                        m_outputs[0] if unpack_single else m_outputs,
+                        updates=m_updates, givens=givens,
+                        no_default_updates=m_no_default_updates)))
+
+    # The new values of the shared variables come after all the outputs.
+    for spec in specs:
+        start = len(outputs)
+        outputs.extend(spec['new_values'])
+        spec['updates'] = list(zip(spec['update_vars'],
+                                   range(start, len(outputs))))
+
+    fn = pfunc(params=inputs, outputs=outputs, mode=mode,
+               no_default_updates=True, name=name,
+               rebuild_strict=rebuild_strict,
+               allow_input_downcast=allow_input_downcast,
+               profile=profile, on_unused_input=on_unused_input)
+    family = FunctionFamily(fn, input_vars)
+    for spec in specs:
+        member = FunctionFamilyMember(
+            family, spec['name'],
+            [input_vars[j] for j in spec['input_idx']], spec['input_idx'],
+            spec['output_idx'], spec['updates'], spec['unpack_single'],
+            spec['return_none'])
+        if not family.partial_eval:
+            member.fn = function(spec['inputs'], mode=mode,
+                                 rebuild_strict=rebuild_strict,
+                                 allow_input_downcast=allow_input_downcast,
+                                 on_unused_input=on_unused_input,
+                                 **spec['kwargs'])
+        family.members[spec['name']] = member
+    if not family.partial_eval:
+        _logger.warning(
+            "The linker of the mode does not evaluate part of the graph, "
+            "the members of the family were compiled separately.")
+    return family
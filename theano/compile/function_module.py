@@ -8,7 +8,6 @@ import copy
 from six import string_types, iteritems, iterkeys
 from six.moves import xrange
 import six.moves.copyreg as copyreg
-import six.moves.cPickle as pickle
 from itertools import chain
 import time
 import warnings
@@ -22,7 +21,6 @@ import theano.compile.profiling
 from theano.compile.io import (
     In, SymbolicInput, SymbolicOutput)
 from theano.compile.ops import deep_copy_op, view_op
-from theano.gof.graph import is_same_graph
 from theano.gof.op import ops_with_inner_function
 
 import logging
@@ -200,6 +198,8 @@ def std_fgraph(input_specs, output_specs, accept_inplace=False):
     # If named nodes are replaced, keep the name
     for feature in std_fgraph.features:
         fgraph.attach_feature(feature())
+    if config.optimizer_incremental_toposort:
+        fgraph.attach_feature(gof.IncrementalToposort())
     return fgraph, list(map(SymbolicOutput, updates))
 
 
@@ -762,22 +762,41 @@ class Function(object):
             and processed. To disable the updates, you should use the ``copy``
             method with ``delete_updates=True``.
 
+            Keyword argument ``out`` gives preallocated ndarrays in which the
+            outputs are returned: a list with one buffer (or None) for each
+            output of the function, a dict if the outputs of the function are
+            a dict, or a single buffer for a function with one output. The
+            buffers must have the type of their output (dtype and number of
+            dimensions) and its shape. When the buffer is C-contiguous and
+            the op that computes the output reuses its output storage, like
+            the deep copy of the outputs does, the op writes the result into
+            the buffer directly, otherwise the result is copied into it. A
+            ValueError is raised if a buffer does not have the shape of its
+            output, after the op may have resized it. The buffers must not
+            share memory with each other. A buffer that shares memory with an
+            input, or whose output is an input or a view of one, is filled
+            by a copy after the call. The buffers are returned in place of
+            the outputs. ``out`` can not be used with ``output_subset``.
+
         Returns
         -------
         list
             List of outputs on indices/keys from ``output_subset`` or all of them,
             if ``output_subset`` is not passed.
         """
-        def restore_defaults():
-            for i, (required, refeed, value) in enumerate(self.defaults):
-                if refeed:
-                    if isinstance(value, gof.Container):
-                        value = value.storage[0]
-                    self[i] = value
+        restore_defaults = self._restore_defaults
         profile = self.profile
         t0 = time.time()
 
         output_subset = kwargs.pop('output_subset', None)
+        out = kwargs.pop('out', None)
+        if out is not None:
+            if output_subset is not None:
+                raise TypeError("The out and output_subset arguments can "
+                                "not be used together")
+            buffers = self._output_buffers(out)
+            # The ops can resize the buffers of the wrong shape
+            buffer_shapes = [buf.shape for i, buf in buffers]
         if output_subset is not None and self.output_keys is not None:
             output_subset =\
                 [self.output_keys.index(key) for key in output_subset]
@@ -813,22 +832,7 @@ class Function(object):
                             allow_downcast=s.allow_downcast)
 
                     except Exception as e:
-                        function_name = "theano function"
-                        argument_name = "argument"
-                        if self.name:
-                            function_name += ' with name "' + self.name + '"'
-                        if hasattr(arg, 'name') and arg.name:
-                            argument_name += ' with name "' + arg.name + '"'
-                        where = theano.gof.utils.get_variable_trace_string(
-                            self.maker.inputs[i].variable)
-                        if len(e.args) == 1:
-                            e.args = ("Bad input " + argument_name + " to " +
-                                      function_name + " at index %d (0-based). %s"
-                                      % (i, where) + e.args[0],)
-                        else:
-                            e.args = ("Bad input " + argument_name + " to " +
-                                      function_name + " at index %d (0-based). %s"
-                                      % (i, where),) + e.args
+                        self._add_input_info(e, i, arg)
                         restore_defaults()
                         raise
                 s.provided += 1
@@ -842,38 +846,7 @@ class Function(object):
         if (not self.trust_input and
             # The getattr is only needed for old pickle
                 getattr(self, '_check_for_aliased_inputs', True)):
-            # Collect aliased inputs among the storage space
-            args_share_memory = []
-            for i in xrange(len(self.input_storage)):
-                i_var = self.maker.inputs[i].variable
-                i_val = self.input_storage[i].storage[0]
-                if hasattr(i_var.type, 'may_share_memory'):
-                    is_aliased = False
-                    for j in xrange(len(args_share_memory)):
-
-                        group_j = izip(
-                            [self.maker.inputs[k].variable for k
-                             in args_share_memory[j]],
-                            [self.input_storage[k].storage[0] for k
-                             in args_share_memory[j]])
-                        if any([(var.type is i_var.type and
-                                 var.type.may_share_memory(val, i_val))
-                                for (var, val) in group_j]):
-
-                            is_aliased = True
-                            args_share_memory[j].append(i)
-                            break
-
-                    if not is_aliased:
-                        args_share_memory.append([i])
-
-            # Check for groups of more than one argument that share memory
-            for group in args_share_memory:
-                if len(group) > 1:
-                    # copy all but the first
-                    for j in group[1:]:
-                        self.input_storage[j].storage[0] = copy.copy(
-                            self.input_storage[j].storage[0])
+            self._copy_aliased_inputs()
 
         # Check if inputs are missing, or if inputs were set more than once, or
         # if we tried to provide inputs that are supposed to be implicit.
@@ -896,28 +869,42 @@ class Function(object):
                         % getattr(self.inv_finder[c], 'variable',
                                   self.inv_finder[c]))
 
+        # Put the output buffers of the caller in the storage of the outputs
+        # and keep the VM from clearing them, so that the ops that reuse
+        # their output storage (like DeepCopyOp) write into them.
+        pre_call_clear = None
+        if out is not None:
+            pre_call_clear = getattr(self.fn, 'pre_call_clear', None)
+        if pre_call_clear is not None:
+            # The ops may expect the storage they reuse to be like the one
+            # they allocate.
+            direct = self._direct_buffers(buffers)
+            cleared = list(pre_call_clear)
+            cells = [self.output_storage[i].storage for i, buf in direct]
+            pre_call_clear[:] = [c for c in cleared
+                                 if not any(c is cell for cell in cells)]
+            for cell, (i, buf) in zip(cells, direct):
+                cell[0] = buf
+
         # Do the actual work
+        timed = True
+        if profile and profile.sampling:
+            timed = profile.sample_call()
+            self.fn.time_thunks = timed and profile.flag_time_thunks
         t0_fn = time.time()
         try:
             outputs =\
                 self.fn() if output_subset is None else\
                 self.fn(output_subset=output_subset)
         except Exception:
+            if pre_call_clear is not None:
+                for cell in cells:
+                    cell[0] = None
             restore_defaults()
-            if hasattr(self.fn, 'position_of_error'):
-                # this is a new vm-provided function or c linker
-                # they need this because the exception manipulation
-                # done by raise_with_op is not implemented in C.
-                thunk = None
-                if hasattr(self.fn, 'thunks'):
-                    thunk = self.fn.thunks[self.fn.position_of_error]
-                gof.link.raise_with_op(
-                    node=self.fn.nodes[self.fn.position_of_error],
-                    thunk=thunk,
-                    storage_map=getattr(self.fn, 'storage_map', None))
-            else:
-                # old-style linkers raise their own exceptions
-                raise
+            self._raise_fn_error()
+        finally:
+            if pre_call_clear is not None:
+                pre_call_clear[:] = cleared
 
         dt_fn = time.time() - t0_fn
         self.maker.mode.fn_time += dt_fn
@@ -928,6 +915,25 @@ class Function(object):
         if outputs is None:
             outputs = [x.data for x in self.output_storage]
         assert len(outputs) == len(self.output_storage)
+        if pre_call_clear is not None:
+            for cell in cells:
+                cell[0] = None
+
+        if out is not None:
+            # Check the shapes before the updates are applied, so that a
+            # call that fails here leaves the shared variables unchanged.
+            for (i, buf), shape in zip(buffers, buffer_shapes):
+                if np.shape(outputs[i]) != shape:
+                    restore_defaults()
+                    raise ValueError(
+                        "The buffer of output %d has shape %s, but the "
+                        "output has shape %s" %
+                        (i, shape, np.shape(outputs[i])))
+            # Copy the outputs that were not computed in their buffer
+            for i, buf in buffers:
+                if outputs[i] is not buf:
+                    buf[...] = outputs[i]
+                    outputs[i] = buf
 
         # Remove internal references to required inputs.
         # These cannot be re-used anyway.
@@ -957,6 +963,7 @@ class Function(object):
 
         # Put default values back in the storage
         restore_defaults()
+
         #
         # NOTE: This logic needs to be replicated in
         #       scan.
@@ -969,11 +976,390 @@ class Function(object):
         if profile:
             profile.fct_callcount += 1
             profile.fct_call_time += dt_call
-            if hasattr(self.fn, 'update_profile'):
-                self.fn.update_profile(profile)
+            if timed:
+                profile.sampled_callcount += 1
+                if hasattr(self.fn, 'update_profile'):
+                    self.fn.update_profile(profile)
             if profile.ignore_first_call:
                 profile.reset()
                 profile.ignore_first_call = False
+        return self._pack_outputs(outputs, output_subset)
+
+    def call_iter(self, args_iter, output_subset=None):
+        """
+        Evaluates the function on each tuple of positional arguments.
+
+        This is a generator that gives the same results as
+        ``(self(*args) for args in args_iter)``, but the bookkeeping of
+        `__call__` that does not depend on the value of the arguments is
+        done once for all the calls: the check of the missing and implicit
+        inputs, the lookup of the input, output and update containers and
+        the profiling. The input containers are reused from one call to the
+        next.
+
+        Parameters
+        ----------
+        args_iter : iterable
+            Iterable of tuples of positional arguments. Keyword arguments
+            are not supported.
+        output_subset : list
+            As for `__call__`, the same for all the calls.
+
+        Yields
+        ------
+        The outputs of each call, as returned by `__call__`.
+
+        """
+        profile = self.profile
+        t0 = time.time()
+
+        if output_subset is not None and self.output_keys is not None:
+            output_subset =\
+                [self.output_keys.index(key) for key in output_subset]
+
+        fn = self.fn
+        input_storage = self.input_storage
+        trust_input = self.trust_input
+        check_aliased = (not trust_input and
+                         getattr(self, '_check_for_aliased_inputs', True))
+        cells = [c.storage for c in input_storage]
+        filters = [(c.type.filter, c.strict, c.allow_downcast)
+                   for c in input_storage]
+        refeed = [i for i, (required, refeed, value)
+                  in enumerate(self.defaults) if refeed]
+        if getattr(fn, 'allow_gc', False):
+            gc_outputs = [c.storage for c, v in
+                          zip(self.output_storage, self.maker.fgraph.outputs)
+                          if v.owner is not None]
+        else:
+            gc_outputs = []
+        need_update_inputs = getattr(fn, 'need_update_inputs', True)
+        if need_update_inputs:
+            # In the order in which `__call__` pops the updates
+            updated = [storage for input, storage in
+                       reversed(list(zip(self.maker.expanded_inputs,
+                                         input_storage)))
+                       if input.update is not None]
+        n_returned_outputs = self.n_returned_outputs
+        # Number of positional arguments already checked
+        checked_n_args = set()
+
+        # With sampled profiling, all the calls are timed or none.
+        timed = True
+        if profile and profile.sampling:
+            timed = profile.sample_call()
+            fn.time_thunks = timed and profile.flag_time_thunks
+        n_calls = 0
+        fn_time = 0
+        try:
+            for args in args_iter:
+                if len(args) not in checked_n_args:
+                    self._check_positional_args(len(args))
+                    checked_n_args.add(len(args))
+
+                if trust_input:
+                    for cell, arg in izip(cells, args):
+                        cell[0] = arg
+                else:
+                    i = 0
+                    for arg in args:
+                        if arg is None:
+                            cells[i][0] = arg
+                        else:
+                            filter, strict, allow_downcast = filters[i]
+                            try:
+                                cells[i][0] = filter(
+                                    arg, strict=strict,
+                                    allow_downcast=allow_downcast)
+                            except Exception as e:
+                                self._add_input_info(e, i, arg)
+                                raise
+                        i += 1
+                    if check_aliased:
+                        self._copy_aliased_inputs()
+
+                t0_fn = time.time()
+                try:
+                    outputs =\
+                        fn() if output_subset is None else\
+                        fn(output_subset=output_subset)
+                except Exception:
+                    self._raise_fn_error()
+                fn_time += time.time() - t0_fn
+
+                if outputs is None:
+                    outputs = [x.data for x in self.output_storage]
+                for cell in gc_outputs:
+                    cell[0] = None
+                if need_update_inputs:
+                    for storage in updated:
+                        storage.data = outputs.pop()
+                else:
+                    outputs = outputs[:n_returned_outputs]
+                for i in refeed:
+                    self._restore_default(i)
+
+                n_calls += 1
+                yield self._pack_outputs(outputs, output_subset)
+        finally:
+            self._restore_defaults()
+            # Remove internal references to required inputs.
+            for c in input_storage:
+                if c.required:
+                    c.storage[0] = None
+
+            dt_call = time.time() - t0
+            theano.compile.profiling.total_fct_exec_time += dt_call
+            self.maker.mode.fn_time += fn_time
+            self.maker.mode.call_time += dt_call
+            if profile and n_calls:
+                profile.vm_call_time += fn_time
+                profile.fct_callcount += n_calls
+                profile.fct_call_time += dt_call
+                if timed:
+                    profile.sampled_callcount += n_calls
+                    if hasattr(fn, 'update_profile'):
+                        fn.update_profile(profile)
+                if profile.ignore_first_call:
+                    profile.reset()
+                    profile.ignore_first_call = False
+
+    def call_many(self, args_list, output_subset=None, stack=False):
+        """
+        Evaluates the function on each tuple of positional arguments.
+
+        See `call_iter`, which this method consumes.
+
+        Parameters
+        ----------
+        args_list : iterable
+            Iterable of tuples of positional arguments.
+        output_subset : list
+            As for `__call__`, the same for all the calls.
+        stack : bool
+            If True, each output is returned once, as the ndarray that
+            stacks the values of that output for all the calls along a new
+            leading axis. The outputs must then be ndarrays of the same
+            shape in all the calls.
+
+        Returns
+        -------
+        list
+            The outputs of each call, as returned by `__call__`, or the
+            stacked outputs if `stack` is True, in the structure that
+            `__call__` returns.
+
+        """
+        results = list(self.call_iter(args_list, output_subset))
+        if not stack or self.return_none:
+            return results
+        if not results:
+            raise ValueError("Cannot stack the outputs of zero calls")
+
+        def stack_values(values):
+            return np.concatenate([np.asarray(v)[np.newaxis]
+                                   for v in values])
+        if isinstance(results[0], dict):
+            return dict((key, stack_values([r[key] for r in results]))
+                        for key in results[0])
+        elif isinstance(results[0], list):
+            return [stack_values([r[j] for r in results])
+                    for j in xrange(len(results[0]))]
+        else:
+            return stack_values(results)
+
+    def _output_buffers(self, out):
+        """
+        Check the `out` argument of `__call__` and return the list of
+        (index of the output, buffer) that it gives.
+
+        """
+        if isinstance(out, dict):
+            if self.output_keys is None:
+                raise TypeError("out can only be a dict when the outputs "
+                                "of the function are a dict")
+            unknown = set(out) - set(self.output_keys)
+            if unknown:
+                raise TypeError("Unknown outputs in out: %s" %
+                                ', '.join(map(str, unknown)))
+            out = [out.get(key) for key in self.output_keys]
+        elif not isinstance(out, (list, tuple)):
+            out = [out]
+        if len(out) != self.n_returned_outputs:
+            raise ValueError("out must have one buffer (or None) for each "
+                             "of the %d outputs of the function, got %d" %
+                             (self.n_returned_outputs, len(out)))
+        buffers = []
+        for i, buf in enumerate(out):
+            if buf is None:
+                continue
+            o_type = self.maker.fgraph.outputs[i].type
+            if (not isinstance(buf, np.ndarray) or
+                    not buf.flags.writeable or
+                    not o_type.is_valid_value(buf)):
+                raise TypeError("The buffer of output %d must be a "
+                                "writeable ndarray of type %s" % (i, o_type))
+            for j, other in buffers:
+                if np.may_share_memory(buf, other):
+                    raise ValueError("The buffers of outputs %d and %d "
+                                     "share memory" % (j, i))
+            buffers.append((i, buf))
+        return buffers
+
+    def _direct_buffers(self, buffers):
+        """
+        Return the (index of the output, buffer) of `buffers` that can be
+        put in the storage of their output before the call.
+
+        The storage of an output that is an input of the graph, or a view
+        of one, is the storage of that input: a buffer put there would
+        overwrite the input and be cleared with it after the call. A buffer
+        that shares memory with an input would be written while the input
+        is read. These outputs are computed and copied into their buffer.
+
+        """
+        fgraph = self.maker.fgraph
+        values = [c.storage[0] for c in self.input_storage
+                  if isinstance(c.storage[0], np.ndarray)]
+        direct = []
+        for i, buf in buffers:
+            if not (buf.flags.c_contiguous and buf.flags.aligned):
+                continue
+            var = fgraph.outputs[i]
+            if var.owner is None or var in fgraph.inputs:
+                continue
+            idx = var.owner.outputs.index(var)
+            op = var.owner.op
+            if (idx in getattr(op, 'view_map', {}) or
+                    idx in getattr(op, 'destroy_map', {})):
+                continue
+            if any(np.may_share_memory(buf, v) for v in values):
+                continue
+            direct.append((i, buf))
+        return direct
+
+    def _restore_default(self, i):
+        value = self.defaults[i][2]
+        if isinstance(value, gof.Container):
+            value = value.storage[0]
+        self[i] = value
+
+    def _restore_defaults(self):
+        """
+        Put back the default values that are refed after each call.
+
+        """
+        for i, (required, refeed, value) in enumerate(self.defaults):
+            if refeed:
+                self._restore_default(i)
+
+    def _add_input_info(self, e, i, arg):
+        """
+        Add the position and the name of the bad input `arg` to the message
+        of the exception `e` raised by its filter.
+
+        """
+        function_name = "theano function"
+        argument_name = "argument"
+        if self.name:
+            function_name += ' with name "' + self.name + '"'
+        if hasattr(arg, 'name') and arg.name:
+            argument_name += ' with name "' + arg.name + '"'
+        where = theano.gof.utils.get_variable_trace_string(
+            self.maker.inputs[i].variable)
+        if len(e.args) == 1:
+            e.args = ("Bad input " + argument_name + " to " +
+                      function_name + " at index %d (0-based). %s"
+                      % (i, where) + e.args[0],)
+        else:
+            e.args = ("Bad input " + argument_name + " to " +
+                      function_name + " at index %d (0-based). %s"
+                      % (i, where),) + e.args
+
+    def _check_positional_args(self, n_args):
+        """
+        Check that calls with `n_args` positional arguments provide all the
+        required inputs and no implicit one.
+
+        """
+        if n_args > len(self.input_storage):
+            raise TypeError("Too many parameter passed to theano function")
+        for i, c in enumerate(self.input_storage):
+            if c.required and i >= n_args:
+                raise TypeError("Missing required input: %s" %
+                                getattr(self.inv_finder[c], 'variable',
+                                        self.inv_finder[c]))
+            if c.implicit and i < n_args:
+                raise TypeError(
+                    'Tried to provide value for implicit input: %s'
+                    % getattr(self.inv_finder[c], 'variable',
+                              self.inv_finder[c]))
+
+    def _copy_aliased_inputs(self):
+        """
+        Copy the inputs that share memory with a previous input.
+
+        """
+        # Collect aliased inputs among the storage space
+        args_share_memory = []
+        for i in xrange(len(self.input_storage)):
+            i_var = self.maker.inputs[i].variable
+            i_val = self.input_storage[i].storage[0]
+            if hasattr(i_var.type, 'may_share_memory'):
+                is_aliased = False
+                for j in xrange(len(args_share_memory)):
+
+                    group_j = izip(
+                        [self.maker.inputs[k].variable for k
+                         in args_share_memory[j]],
+                        [self.input_storage[k].storage[0] for k
+                         in args_share_memory[j]])
+                    if any([(var.type is i_var.type and
+                             var.type.may_share_memory(val, i_val))
+                            for (var, val) in group_j]):
+
+                        is_aliased = True
+                        args_share_memory[j].append(i)
+                        break
+
+                if not is_aliased:
+                    args_share_memory.append([i])
+
+        # Check for groups of more than one argument that share memory
+        for group in args_share_memory:
+            if len(group) > 1:
+                # copy all but the first
+                for j in group[1:]:
+                    self.input_storage[j].storage[0] = copy.copy(
+                        self.input_storage[j].storage[0])
+
+    def _raise_fn_error(self):
+        """
+        Reraise the exception raised by self.fn, with information on the
+        node that caused it.
+
+        """
+        if hasattr(self.fn, 'position_of_error'):
+            # this is a new vm-provided function or c linker
+            # they need this because the exception manipulation
+            # done by raise_with_op is not implemented in C.
+            thunk = None
+            if hasattr(self.fn, 'thunks'):
+                thunk = self.fn.thunks[self.fn.position_of_error]
+            gof.link.raise_with_op(
+                node=self.fn.nodes[self.fn.position_of_error],
+                thunk=thunk,
+                storage_map=getattr(self.fn, 'storage_map', None))
+        else:
+            # old-style linkers raise their own exceptions
+            raise
+
+    def _pack_outputs(self, outputs, output_subset):
+        """
+        Return the computed `outputs` in the structure that `__call__`
+        returns.
+
+        """
         if self.return_none:
             return None
         elif self.unpack_single and len(outputs) == 1 and\
@@ -1259,170 +1645,42 @@ class FunctionMaker(object):
             raise TypeError("Unknown output type: %s (%s)", type(output),
                             output)
 
-    def optimize_graph_with_cache(self, optimizer, inputs, outputs):
-        # This function is not finished
-        from theano.gof.compilelock import get_lock, release_lock
-        import os.path
-
-        graph_db_file = os.path.join(theano.config.compiledir,
-                                     'optimized_graphs.pkl')
-
-        # the inputs, outputs, and size of the graph to be optimized
-        inputs_new = [inp.variable for inp in inputs]
-        outputs_new = [out.variable for out in outputs]
-        size_new = len(self.fgraph.apply_nodes)
-        get_lock()
-        # Beginning of cache optimizations.
-        # Could be refactored in different functions.
-
-        def load_graph_db():
-            if os.path.isfile(graph_db_file):
-                print('graph_db already exists')
+    def optimize_graph_with_cache(self, optimizer, inputs, mode,
+                                  accept_inplace=False):
+        """
+        Optimize `self.fgraph`, reusing a previously optimized version of
+        the same graph from the on-disk cache when there is one.
+
+        On a hit, `self.fgraph` is replaced by the cached optimized graph,
+        `self.optimized_graph_from_cache` is set to True and None is
+        returned. On a miss, the graph is optimized in place, stored in the
+        cache and the optimizer profile is returned.
+
+        """
+        from theano.compile import optcache
+
+        cache = optcache.get_optimized_graph_cache()
+        try:
+            key = optcache.graph_key(self.fgraph, inputs, mode,
+                                     accept_inplace)
+        except optcache.UncacheableGraph as e:
+            _logger.debug('Not using the optimization cache: %s', e)
+            return optimizer(self.fgraph)
+
+        found = cache.load(key, self.fgraph)
+        if self.profile:
+            if found is None:
+                self.profile.optimizer_cache_misses += 1
             else:
-                # create graph_db
-                with open(graph_db_file, 'wb') as f:
-                    print('create new graph_db in %s' % graph_db_file)
-            # load the graph_db dictionary
-            try:
-                with open(graph_db_file, 'rb') as f:
-                    # Temporary hack to allow
-                    # theano.scan_module.tests.test_scan.T_Scan to
-                    # finish. Should be changed in definitive version.
-                    tmp = theano.config.unpickle_function
-                    theano.config.unpickle_function = False
-                    graph_db = pickle.load(f)
-                print('graph_db loaded and it is not empty')
-            except EOFError as e:
-                # the file has nothing in it
-                print(e)
-                print('graph_db loaded and it is empty')
-                graph_db = {}
-            finally:
-                theano.config.unpickle_function = tmp
-
-            return graph_db
-
-        def find_same_graph_in_db(graph_db):
-            # If found_graph_in_db is None, then need to optimize.
-            # Otherwise, return the graph found.
-            found_graph_in_db = None
-            # The sole purpose of this loop is to set 'need_optimize' by
-            # going through graph_db, looking for graph that has the same
-            # computation performed.
-            for graph_old, graph_optimized in iteritems(graph_db):
-                inputs_old = graph_old.inputs
-                outputs_old = graph_old.outputs
-                size_old = len(graph_old.apply_nodes)
-                # Some heuristics to check is the same graphs have
-                # already been optimized before.
-                if len(inputs_new) != len(inputs_old):
-                    # If the inputs are of different size,
-                    # two graphs are for sure different
-                    print('need to optimize, because input size is different')
-                    continue
-                elif len(outputs_new) != len(outputs_old):
-                    # If the inputs are of different size,
-                    # two graphs are for sure different
-                    print('need to optimize, because output size is different')
-                    continue
-                elif not all(input_new.type == input_old.type
-                             for input_new, input_old in
-                             zip(inputs_new, inputs_old)):
-                    print('need to optimize, because inputs are of different '
-                          'types')
-                    continue
-                elif not all(output_new.type == output_old.type
-                             for output_new, output_old in
-                             zip(outputs_new, outputs_old)):
-                    print('need to optimize, because outputs are of different '
-                          'types')
-                    continue
-                elif not size_old == size_new:
-                    print('need to optimize, because numbers of nodes in graph'
-                          ' are different')
-                    continue
-                else:
-                    flags = []
-                    for i, (output_new, output_old) in enumerate(
-                            zip(outputs_new, outputs_old)):
-                        print('loop through outputs node for both graphs')
-                        graph_old.variables = set(gof.graph.variables(
-                            graph_old.inputs, graph_old.outputs))
-
-                        # using clone allowed to avoid a lot of errors
-                        # deep copy seemed to had.
-                        f2 = graph_old.clone(check_integrity=False)
-                        t1 = output_new
-                        t2 = f2.outputs[i]
-
-                        # Used to remove "already used by another graph error
-                        def removeAllFgraph(remove):
-                            if hasattr(remove, 'fgraph'):
-                                del remove.fgraph
-                            if hasattr(remove, 'owner'):
-                                if remove.owner is None:
-                                    pass
-                                else:
-                                    if hasattr(remove.owner, 'fgraph'):
-                                        del remove.owner.fgraph
-                                    if hasattr(remove.owner, 'inputs'):
-                                        remove.owner.inputs = [removeAllFgraph(
-                                            i) for i in remove.owner.inputs]
-                                        for o in remove.owner.outputs:
-                                            if hasattr(o, 'fgraph'):
-                                                del o.fgraph
-                            return remove
-
-                        t2 = removeAllFgraph(t2)
-
-                        givens = dict(izip(gof.graph.inputs([t1]),
-                                           gof.graph.inputs([t2])))
-
-                        temp = dict(izip(gof.graph.inputs([t1]),
-                                         gof.graph.inputs([t2])))
-
-                        # hack to remove inconstent entry in givens
-                        # seems to work that but source of inconsistency
-                        # could be worth investigating.
-                        for key, value in iteritems(temp):
-                            if key.type != value.type:
-                                del givens[key]
-
-                        flag = is_same_graph(t1, t2, givens=givens)
-
-                        flags.append(flag)
-
-                    is_same = all(flags)
-                    if is_same:
-                        # found the match
-                        print('found a match, no need to optimize')
-                        found_graph_in_db = graph_optimized
-                        break
-            return found_graph_in_db
-
-        graph_db = load_graph_db()
-        print('loaded graph_db from %s, size=%d' % (graph_db_file,
-                                                    len(graph_db)))
-        found_graph = find_same_graph_in_db(graph_db)
-        if found_graph:
-            self.fgraph = found_graph
-            optimizer_profile = None
-        else:
-            # this is a brand new graph, optimize it, save it to graph_db
-            print('graph not found in graph_db, optimizing the graph')
-            self.fgraph.variables = set(gof.graph.variables(
-                self.fgraph.inputs, self.fgraph.outputs))
-            # check_integrity parameters was added to ignore
-            # "excess cached variables" errors. Works that way
-            # but once again the error couldbe worth
-            # investigating.
-            before_opt = self.fgraph.clone(check_integrity=False)
-            optimizer_profile = optimizer(self.fgraph)
-            graph_db.update({before_opt: self.fgraph})
-            with open(graph_db_file, 'wb') as f:
-                pickle.dump(graph_db, f, -1)
-            print('new graph saved into graph_db')
-        release_lock()
+                self.profile.optimizer_cache_hits += 1
+        if found is not None:
+            found.profile = self.fgraph.profile
+            self.fgraph = found
+            self.optimized_graph_from_cache = True
+            return None
+
+        optimizer_profile = optimizer(self.fgraph)
+        cache.store(key, self.fgraph)
         return optimizer_profile
 
     def __init__(self, inputs, outputs,
@@ -1506,15 +1764,18 @@ class FunctionMaker(object):
                     theano.config.compute_test_value_opt
                 theano.config.traceback.limit = theano.config.traceback.compile_limit
                 start_optimizer = time.time()
+                start_lock_wait = self._lock_wait()
 
                 # In case there is an error during optimization.
                 optimizer_profile = None
                 opt_time = None
+                self.optimized_graph_from_cache = False
 
                 # now optimize the graph
                 if theano.config.cache_optimizations:
                     optimizer_profile = self.optimize_graph_with_cache(
-                        optimizer, inputs, outputs)
+                        optimizer, inputs, mode, accept_inplace)
+                    fgraph = self.fgraph
                 else:
                     optimizer_profile = optimizer(fgraph)
 
@@ -1535,12 +1796,19 @@ class FunctionMaker(object):
                 theano.compile.profiling.total_graph_opt_time += opt_time
                 if profile:
                     if (optimizer_profile is None and
+                            not self.optimized_graph_from_cache and
                             hasattr(optimizer, 'pre_profile')):
                         optimizer_profile = optimizer.pre_profile
                     profile.optimizer_time += opt_time
+                    self._profile_lock_wait(start_lock_wait)
                     if theano.config.profile_optimizer:
-                        profile.optimizer_profile = (optimizer,
-                                                     optimizer_profile)
+                        if self.optimized_graph_from_cache:
+                            # The optimizer did not run, the hit is
+                            # counted in profile.optimizer_cache_hits.
+                            profile.optimizer_profile = None
+                        else:
+                            profile.optimizer_profile = (optimizer,
+                                                         optimizer_profile)
                 # IF False, if mean the profile for that function was explicitly disabled
                 elif theano.config.profile_optimizer and profile is not False:
                     warnings.warn((
@@ -1631,6 +1899,21 @@ class FunctionMaker(object):
                                      "'%s'.\nValid values are 'raise', "
                                      "'warn', and 'ignore'." % on_unused_input)
 
+    @staticmethod
+    def _lock_wait():
+        compilelock = theano.gof.compilelock
+        return compilelock.lock_wait_time, compilelock.lock_wait_count
+
+    def _profile_lock_wait(self, start):
+        """
+        Add to the profile the compile lock waits since `start`, a value
+        returned by `_lock_wait`.
+
+        """
+        end = self._lock_wait()
+        self.profile.compile_lock_wait_time += end[0] - start[0]
+        self.profile.compile_lock_wait_count += end[1] - start[1]
+
     def create(self, input_storage=None, trustme=False, storage_map=None):
         """
         Create a function.
@@ -1708,6 +1991,7 @@ class FunctionMaker(object):
         # Get a function instance
         start_linker = time.time()
         start_import_time = theano.gof.cmodule.import_time
+        start_lock_wait = self._lock_wait()
         limit_orig = theano.config.traceback.limit
         try:
             theano.config.traceback.limit = theano.config.traceback.compile_limit
@@ -1726,6 +2010,7 @@ class FunctionMaker(object):
             _fn.time_thunks = self.profile.flag_time_thunks
             import_time = theano.gof.cmodule.import_time - start_import_time
             self.profile.import_time += import_time
+            self._profile_lock_wait(start_lock_wait)
 
         fn = self.function_builder(_fn, _i, _o, self.indices, self.outputs,
                                    defaults, self.unpack_single,
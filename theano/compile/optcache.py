@@ -0,0 +1,400 @@
+"""
+Persistent on-disk cache of optimized graphs.
+
+When `config.cache_optimizations` is True, `FunctionMaker` looks up the
+unoptimized FunctionGraph in this cache before running the optimizer.
+
+Entries are content addressed: the key is a sha256 of a canonical
+structural description of the graph (the types of the inputs, the Ops
+and the way they are connected, the constants) together with the
+optimizer query, the Theano flags and the library versions. Each entry
+is stored in its own file under `compiledir/optimized_graphs`, so a
+lookup is a single `open` and no global lock is needed. Files are
+written to a temporary name and renamed, so concurrent processes never
+observe a partially written entry. The cache is bounded in number of
+entries and in total size; the least recently used entries (by file
+modification time, refreshed on each hit) are evicted first.
+
+"""
+from __future__ import absolute_import, print_function, division
+
+import hashlib
+import logging
+import os
+import sys
+import tempfile
+import time
+
+import numpy as np
+import six.moves.cPickle as pickle
+from six import BytesIO, string_types
+
+import theano
+from theano import config, gof
+
+_logger = logging.getLogger('theano.compile.optcache')
+
+# Flags that have no influence on the result of the optimization. They
+# are left out of the key so that toggling them does not invalidate
+# the cache.
+_config_ignored = ('cache_optimizations', 'profile', 'profiling',
+                   'print_global_stats', 'base_compiledir', 'compiledir',
+                   'compiledir_format', 'compile.', 'cmodule.', 'nocleanup')
+
+
+class UncacheableGraph(Exception):
+    """
+    Raised when a graph (or the mode used to optimize it) can not be
+    given a stable key.
+
+    """
+
+    pass
+
+
+def _dumps(obj):
+    return pickle.dumps(obj, 2)
+
+
+def _config_signature():
+    opts = sorted([cv for cv in theano.configparser._config_var_list
+                   if not cv.fullname.startswith(_config_ignored)],
+                  key=lambda cv: cv.fullname)
+    return '\n'.join(['%s = %s' % (cv.fullname, cv.__get__(True, None))
+                      for cv in opts])
+
+
+def optimizer_signature(mode):
+    """
+    Return a string describing the optimizer of `mode`.
+
+    Only optimizers given as a `Query` on `optdb` (or the name of a
+    predefined one) can be described in a way that is stable across
+    processes. Other optimizers raise `UncacheableGraph`.
+
+    """
+    opt = getattr(mode, 'provided_optimizer', None)
+    if isinstance(opt, string_types):
+        return '%s:%s' % (type(mode).__name__, opt)
+    if isinstance(opt, gof.Query) and not opt.extra_optimizations:
+        return '%s:%s' % (type(mode).__name__, opt)
+    raise UncacheableGraph('optimizer %s has no stable description' % opt)
+
+
+def graph_key(fgraph, input_specs, mode, accept_inplace=False):
+    """
+    Return the hexadecimal key of an unoptimized FunctionGraph.
+
+    Parameters
+    ----------
+    fgraph : FunctionGraph
+        The graph, as built by `std_fgraph`, before optimization.
+    input_specs : list of SymbolicInput
+        The inputs of the function, in the order of `fgraph.inputs`.
+    mode : Mode
+        The mode whose optimizer will be applied.
+    accept_inplace : bool
+        Forwarded from `FunctionMaker`.
+
+    Raises
+    ------
+    UncacheableGraph
+        If a part of the graph can not be serialized deterministically.
+
+    """
+    h = hashlib.sha256()
+
+    def feed(*parts):
+        for p in parts:
+            if not isinstance(p, bytes):
+                p = str(p).encode('utf-8')
+            # Prefix every part with its length so that the concatenation
+            # is unambiguous.
+            h.update(('%d:' % len(p)).encode('ascii'))
+            h.update(p)
+
+    # Equal Ops and Types are interchangeable, so serialize each only once.
+    serialized = {}
+
+    def dumps(obj):
+        try:
+            return serialized[obj]
+        except KeyError:
+            pass
+        except TypeError:
+            # Unhashable, serialize it every time.
+            return _dumps(obj)
+        try:
+            s = _dumps(obj)
+        except Exception as e:
+            raise UncacheableGraph('can not serialize %s: %s' % (obj, e))
+        serialized[obj] = s
+        return s
+
+    feed('theano', theano.__version__, 'python', sys.version_info[:2],
+         'numpy', np.__version__)
+    feed('optimizer', optimizer_signature(mode), 'accept_inplace',
+         accept_inplace)
+    feed('config', _config_signature())
+
+    ids = {}
+    if len(input_specs) != len(fgraph.inputs):
+        raise UncacheableGraph('input specs do not match the graph inputs')
+    for i, (spec, var) in enumerate(zip(input_specs, fgraph.inputs)):
+        ids[var] = 'i%d' % i
+        feed('input', dumps(var.type), spec.mutable, spec.borrow,
+             isinstance(var, theano.compile.SharedVariable),
+             spec.update is not None)
+
+    def ref(var):
+        if var not in ids:
+            if not isinstance(var, gof.Constant):
+                raise UncacheableGraph('orphan variable %s' % var)
+            ids[var] = 'c%d' % len(ids)
+            try:
+                feed('constant', dumps(var.type), _dumps(var.data))
+            except Exception as e:
+                raise UncacheableGraph('can not serialize constant %s: %s' %
+                                       (var, e))
+        return ids[var]
+
+    for j, node in enumerate(fgraph.toposort()):
+        feed('apply', dumps(node.op), [ref(i) for i in node.inputs],
+             [dumps(o.type) for o in node.outputs])
+        for k, out in enumerate(node.outputs):
+            ids[out] = 'n%d.%d' % (j, k)
+    feed('outputs', [ref(o) for o in fgraph.outputs])
+    return h.hexdigest()
+
+
+class OptimizedGraphCache(object):
+    """
+    Directory of optimized graphs, one pickle file per key.
+
+    Parameters
+    ----------
+    dirname : str
+        Directory where the entries are stored. It is created if needed.
+    max_entries : int
+        Maximum number of entries kept on disk.
+    max_size : int
+        Maximum total size of the entries, in bytes.
+
+    """
+
+    # Age in seconds after which a temporary file is considered left by a
+    # writer that crashed or was killed.
+    tmp_age_thresh = 60 * 60
+
+    def __init__(self, dirname, max_entries=None, max_size=None):
+        self.dirname = dirname
+        if max_entries is None:
+            max_entries = config.cache_optimizations_max_entries
+        if max_size is None:
+            max_size = config.cache_optimizations_max_size * 1024 * 1024
+        self.max_entries = max_entries
+        self.max_size = max_size
+
+    def _path(self, key):
+        return os.path.join(self.dirname, key + '.pkl')
+
+    def load(self, key, fgraph):
+        """
+        Return the optimized version of `fgraph` stored under `key`.
+
+        The containers of the shared inputs are not stored in the cache;
+        they are taken from `fgraph`. Return None on a miss or if the
+        entry is not usable.
+
+        """
+        path = self._path(key)
+        try:
+            f = open(path, 'rb')
+        except (IOError, OSError):
+            return None
+
+        containers = [getattr(i, 'container', None) for i in fgraph.inputs]
+
+        def persistent_load(pid):
+            kind, idx = pid
+            assert kind == 'container'
+            return containers[idx]
+
+        # The graph may contain Ops with inner functions (e.g. Scan).
+        # They must not be compiled again while unpickling.
+        unpickle_function = config.unpickle_function
+        try:
+            config.unpickle_function = False
+            with f:
+                p = pickle.Unpickler(f)
+                p.persistent_load = persistent_load
+                optimized = p.load()
+        except Exception as e:
+            _logger.warning('Removing unusable optimized graph %s: %s',
+                            path, e)
+            self._remove(path)
+            return None
+        finally:
+            config.unpickle_function = unpickle_function
+
+        if not self._compatible(fgraph, optimized):
+            _logger.warning('Removing optimized graph %s which does not match '
+                            'the graph it was stored for', path)
+            self._remove(path)
+            return None
+
+        # Mark the entry as recently used for the LRU eviction.
+        try:
+            os.utime(path, None)
+        except OSError:
+            pass
+        return optimized
+
+    @staticmethod
+    def _compatible(fgraph, optimized):
+        if (len(fgraph.inputs) != len(optimized.inputs) or
+                len(fgraph.outputs) != len(optimized.outputs)):
+            return False
+        return (all(a.type == b.type
+                    for a, b in zip(fgraph.inputs, optimized.inputs)) and
+                all(a.type == b.type
+                    for a, b in zip(fgraph.outputs, optimized.outputs)))
+
+    def store(self, key, fgraph):
+        """
+        Store the optimized `fgraph` under `key`.
+
+        Errors are logged and ignored: the cache is only an accelerator.
+
+        """
+        containers = dict((id(getattr(i, 'container', None)), idx)
+                          for idx, i in enumerate(fgraph.inputs)
+                          if getattr(i, 'container', None) is not None)
+
+        def persistent_id(obj):
+            if isinstance(obj, gof.Container) and id(obj) in containers:
+                return ('container', containers[id(obj)])
+            return None
+
+        # The profile is specific to this process.
+        profile = getattr(fgraph, 'profile', None)
+        buf = BytesIO()
+        try:
+            fgraph.profile = None
+            p = pickle.Pickler(buf, -1)
+            p.persistent_id = persistent_id
+            p.dump(fgraph)
+        except Exception as e:
+            _logger.warning('Can not store optimized graph in cache: %s', e)
+            return
+        finally:
+            fgraph.profile = profile
+
+        try:
+            if not os.path.isdir(self.dirname):
+                os.makedirs(self.dirname)
+            fd, tmp = tempfile.mkstemp(dir=self.dirname, suffix='.tmp')
+            with os.fdopen(fd, 'wb') as f:
+                f.write(buf.getvalue())
+            path = self._path(key)
+            try:
+                os.rename(tmp, path)
+            except OSError:
+                # On Windows, rename fails if another process already
+                # stored the same entry.
+                self._remove(tmp)
+        except (IOError, OSError) as e:
+            _logger.warning('Can not store optimized graph in cache: %s', e)
+            return
+        self.evict()
+
+    def entries(self):
+        """
+        Return a list of (mtime, size, path) for all entries.
+
+        """
+        rval = []
+        try:
+            names = os.listdir(self.dirname)
+        except OSError:
+            return rval
+        for name in names:
+            if not name.endswith('.pkl'):
+                continue
+            path = os.path.join(self.dirname, name)
+            try:
+                st = os.stat(path)
+            except OSError:
+                # Removed by another process.
+                continue
+            rval.append((st.st_mtime, st.st_size, path))
+        return rval
+
+    def evict(self):
+        """
+        Remove the least recently used entries until the cache fits in
+        `max_entries` and `max_size`, and the temporary files older than
+        `tmp_age_thresh`.
+
+        """
+        self.remove_stale_tmp()
+        entries = sorted(self.entries())
+        total = sum(e[1] for e in entries)
+        while entries and (len(entries) > self.max_entries or
+                           total > self.max_size):
+            mtime, size, path = entries.pop(0)
+            self._remove(path)
+            total -= size
+
+    def remove_stale_tmp(self):
+        """
+        Remove the temporary files of the writers that did not finish.
+
+        """
+        try:
+            names = os.listdir(self.dirname)
+        except OSError:
+            return
+        now = time.time()
+        for name in names:
+            if not name.endswith('.tmp'):
+                continue
+            path = os.path.join(self.dirname, name)
+            try:
+                mtime = os.stat(path).st_mtime
+            except OSError:
+                # Renamed or removed by another process.
+                continue
+            if now - mtime > self.tmp_age_thresh:
+                self._remove(path)
+
+    def clear(self):
+        """
+        Remove all entries.
+
+        """
+        for _, _, path in self.entries():
+            self._remove(path)
+
+    @staticmethod
+    def _remove(path):
+        try:
+            os.remove(path)
+        except OSError:
+            pass
+
+
+_optimized_graph_cache = None
+
+
+def get_optimized_graph_cache():
+    """
+    Return the `OptimizedGraphCache` of the current `config.compiledir`.
+
+    """
+    global _optimized_graph_cache
+    dirname = os.path.join(config.compiledir, 'optimized_graphs')
+    if (_optimized_graph_cache is None or
+            _optimized_graph_cache.dirname != dirname):
+        _optimized_graph_cache = OptimizedGraphCache(dirname)
+    return _optimized_graph_cache
@@ -11,13 +11,16 @@ from __future__ import absolute_import, print_function, division
 
 import atexit
 import copy
+import json
 import logging
 import operator
 import os
+import random
 import sys
 import time
-from collections import defaultdict
-from six import iteritems
+import weakref
+from collections import defaultdict, deque
+from six import iteritems, itervalues
 import warnings
 
 import numpy as np
@@ -69,7 +72,7 @@ def _atexit_print_fn():
                            n_ops_to_print=config.profiling.n_ops,
                            n_apply_to_print=config.profiling.n_apply)
                 if not isinstance(ps, ScanProfileStats):
-                    to_sum.append(ps)
+                    to_sum.append(ps.sampling_estimate())
             else:
                 # TODO print the name if there is one!
                 print('Skipping empty Profile')
@@ -79,11 +82,16 @@ def _atexit_print_fn():
             msg = ("Sum of all(%d) printed profiles at exit excluding Scan op"
                    " profile." % len(to_sum))
             cum.message = msg
+            cum.sampled_from = None
             for ps in to_sum[1:]:
                 for attr in ["compile_time", "fct_call_time", "fct_callcount",
-                             "vm_call_time", "optimizer_time", "linker_time",
+                             "sampled_callcount", "vm_call_time", "optimizer_time", "linker_time",
                              "validate_time", "import_time",
-                             "linker_node_make_thunks"]:
+                             "linker_node_make_thunks",
+                             "optimizer_cache_hits",
+                             "optimizer_cache_misses",
+                             "compile_lock_wait_time",
+                             "compile_lock_wait_count"]:
                     setattr(cum, attr, getattr(cum, attr) + getattr(ps, attr))
 
                 # merge dictonary
@@ -113,10 +121,57 @@ def _atexit_print_fn():
                         n_ops_to_print=config.profiling.n_ops,
                         n_apply_to_print=config.profiling.n_apply)
 
+        if config.profiling.optimizer_json:
+            with open(config.profiling.optimizer_json, 'w') as f:
+                dump_optimizer_profiles(_atexit_print_list, f)
+
+        if config.profiling.timeline_json:
+            with open(config.profiling.timeline_json, 'w') as f:
+                dump_timeline(_atexit_print_list, f)
+
     if config.print_global_stats:
         print_global_stats()
 
 
+def dump_optimizer_profiles(profiles, file):
+    """
+    Save the optimizer profiles of the ProfileStats `profiles` in JSON.
+
+    The file holds a dict with a list `functions`, that has for each
+    profile with an optimizer profile its `message`, `optimizer_time`,
+    `nb_nodes` and the dict of `ProfileStats.optimizer_profile_dict`.
+
+    """
+    functions = []
+    for ps in profiles:
+        prof = ps.optimizer_profile_dict()
+        if prof is not None:
+            functions.append({'name': ps.message,
+                              'optimizer_time': ps.optimizer_time,
+                              'nb_nodes': ps.nb_nodes,
+                              'optimizer_profile': prof})
+    json.dump({'theano_version': theano.__version__,
+               'functions': functions}, file, indent=1, sort_keys=True)
+
+
+def dump_timeline(profiles, file):
+    """
+    Save the timeline of the ProfileStats `profiles` in the Chrome trace
+    event format, that chrome://tracing and Perfetto can display.
+
+    The events of all the profiles use the same clock, so the inner
+    functions of Scan appear nested under the Scan node that called them.
+
+    """
+    events = []
+    for ps in profiles:
+        events.extend(ps.timeline_events())
+    json.dump({'traceEvents': events,
+               'displayTimeUnit': 'ms',
+               'otherData': {'theano_version': theano.__version__}},
+              file)
+
+
 def print_global_stats():
     """
     Print the following stats:
@@ -156,6 +211,175 @@ def register_profiler_printer(fct):
     return fct
 
 
+def _memory_owner(value):
+    # The object that owns the memory of the ndarray value
+    while isinstance(value, np.ndarray) and value.base is not None:
+        value = value.base
+    return value
+
+
+class MeasuredMemory(object):
+    """
+    Measure the buffers allocated by the nodes of a function while it runs
+    (config.profiling.measure_memory).
+
+    After each thunk, the ndarray outputs are followed to the object that
+    owns their memory. An output whose memory is owned by a buffer that did
+    not exist before was allocated by the node. Otherwise it is a view of
+    an input or of another buffer, or the node reused the buffer of its
+    previous call. Weak references on the buffers tell when they are really
+    freed, so the live bytes include the buffers kept by the VM or by
+    Python references. The inputs of the function are not counted.
+
+    """
+
+    def __init__(self):
+        # id(owner) -> [weakref or owner, nbytes, node, output index,
+        #               variables that use the buffer]
+        self.live = {}
+        self.live_bytes = 0
+        self.reset()
+
+    def reset(self):
+        """Forget the measures, but not the buffers that are alive."""
+        self.node_calls = {}  # node -> number of measured calls
+        self.node_allocated = {}  # node -> bytes of new buffers
+        self.node_aliased = {}  # node -> bytes of outputs that are views
+        self.node_reused = {}  # node -> bytes of buffers of previous calls
+        self.peak = 0
+        self.peak_node = None
+        # (nbytes, node, output index, held after its last use) of the
+        # buffers live at the peak
+        self.peak_buffers = []
+        # node -> bytes a new output could have taken from a dying input
+        self.inplace_savings = {}
+        self._external = set()
+        self._executed = set()
+
+    def _free(self, key):
+        entry = self.live.pop(key, None)
+        if entry is not None:
+            self.live_bytes -= entry[1]
+
+    def start_call(self, storage_map):
+        """Called by the VM before the first thunk of a call."""
+        self._external = set(
+            id(_memory_owner(s[0])) for v, s in iteritems(storage_map)
+            if v.owner is None and s[0] is not None)
+        self._executed = set()
+
+    def node_done(self, node, thunk):
+        """Called by the VM after the thunk of `node` computed its outputs."""
+        self._executed.add(node)
+        self.node_calls[node] = self.node_calls.get(node, 0) + 1
+        for idx, storage in enumerate(thunk.outputs):
+            value = storage[0]
+            if not isinstance(value, np.ndarray):
+                continue
+            out = node.outputs[idx]
+            owner = _memory_owner(value)
+            key = id(owner)
+            entry = self.live.get(key)
+            if key in self._external:
+                d = self.node_aliased
+            elif entry is not None:
+                if entry[2] is node and entry[3] == idx:
+                    d = self.node_reused
+                else:
+                    d = self.node_aliased
+                if out not in entry[4]:
+                    entry[4].append(out)
+            else:
+                d = self.node_allocated
+                nbytes = getattr(owner, 'nbytes', value.nbytes)
+                self._check_inplace(node, out, value.nbytes)
+                try:
+                    ref = weakref.ref(owner,
+                                      lambda r, key=key: self._free(key))
+                except TypeError:
+                    ref = owner
+                self.live[key] = [ref, nbytes, node, idx, [out]]
+                self.live_bytes += nbytes
+            d[node] = d.get(node, 0) + value.nbytes
+        if self.live_bytes > self.peak:
+            self.peak = self.live_bytes
+            self.peak_node = node
+            # The inputs of node were needed while it ran
+            self.peak_buffers = [(e[1], e[2], e[3], self._dead(e[4], node))
+                                 for e in itervalues(self.live)]
+
+    def _dead(self, variables, running=None):
+        # True if all the clients of the variables, but running, ran
+        # during this call
+        return all(c != 'output' and c is not running and
+                   c in self._executed
+                   for var in variables for c, i in var.clients)
+
+    def _check_inplace(self, node, out, nbytes):
+        # Could an Elemwise have written its new output out over a buffer
+        # that it used for the last time?
+        if not hasattr(node.op, 'inplace_pattern'):
+            return
+        for e in itervalues(self.live):
+            if (e[1] >= nbytes and
+                    any(i in e[4] and i.type == out.type
+                        for i in node.inputs) and
+                    self._dead(e[4])):
+                self.inplace_savings[node] = max(
+                    self.inplace_savings.get(node, 0), nbytes)
+                return
+
+    def summary(self, file=sys.stderr, N=None):
+        if not self.node_calls:
+            return
+        print("Measured Memory Profile (config.profiling.measure_memory)",
+              file=file)
+        print("(Buffers allocated by the nodes, inputs excluded)", file=file)
+        print("---", file=file)
+        held = sum(b[0] for b in self.peak_buffers if b[3])
+        print("    Peak of the live buffers: %dKB, after node %s" % (
+            int(round(self.peak / 1024.)), self.peak_node), file=file)
+        print("    Held at the peak after their last use: %dKB" %
+              int(round(held / 1024.)), file=file)
+        print("---", file=file)
+        print("    <Allocated/call (bytes)> <Aliased/call> <Reused/call>"
+              " <Apply node>", file=file)
+        print("", file=file)
+
+        def per_call(d, node):
+            return d.get(node, 0) // self.node_calls[node]
+        nodes = sorted(self.node_calls, reverse=True,
+                       key=lambda n: (per_call(self.node_allocated, n),
+                                      per_call(self.node_aliased, n)))
+        for node in nodes[:N]:
+            print("     %9dB %9dB %9dB  %s" % (
+                per_call(self.node_allocated, node),
+                per_call(self.node_aliased, node),
+                per_call(self.node_reused, node), node), file=file)
+        print("   ... (remaining %i Apply nodes)" % max(
+            0, len(nodes) - len(nodes[:N])), file=file)
+        print("", file=file)
+        if held:
+            print("    Buffers held at the peak after their last use "
+                  "(allow_gc=True frees them):", file=file)
+            for nbytes, node, idx, dead in sorted(
+                    self.peak_buffers, key=lambda b: b[0],
+                    reverse=True)[:N]:
+                if dead:
+                    print("     %9dB  output %d of %s" % (nbytes, idx, node),
+                          file=file)
+            print("", file=file)
+        if self.inplace_savings:
+            print("    Elemwise nodes that allocated an output while an "
+                  "input of the same type was used for the last time "
+                  "(working inplace would save):", file=file)
+            for node, nbytes in sorted(iteritems(self.inplace_savings),
+                                       key=lambda n: n[1],
+                                       reverse=True)[:N]:
+                print("     %9dB  %s" % (nbytes, node), file=file)
+            print("", file=file)
+
+
 class ProfileStats(object):
 
     """
@@ -177,9 +401,14 @@ class ProfileStats(object):
         # self.compile_time = 0.
         self.fct_call_time = 0.
         self.fct_callcount = 0
+        self.sampled_callcount = 0
         self.vm_call_time = 0.
         self.apply_time = {}
         self.apply_callcount = {}
+        if self.timeline is not None:
+            self.timeline.clear()
+        if self.measured_memory is not None:
+            self.measured_memory.reset()
         # self.apply_cimpl = None
         # self.message = None
     #
@@ -202,6 +431,30 @@ class ProfileStats(object):
     # Number of calls to Function.__call__
     #
 
+    sampled_callcount = 0
+    # Number of calls to Function.__call__ whose thunks were timed. With
+    # sampled profiling, apply_time and apply_callcount only cover them.
+    #
+
+    sample_every = 1
+    # Time the thunks of one call out of sample_every
+    # (config.profiling.sample_every)
+    #
+
+    sample_fraction = 1.0
+    # Time the thunks of that random fraction of the calls
+    # (config.profiling.sample_fraction)
+    #
+
+    sampling = False
+    # True if sample_every > 1 or sample_fraction < 1
+    #
+
+    sampled_from = None
+    # In the estimate returned by sampling_estimate(), the number of
+    # calls that were timed.
+    #
+
     vm_call_time = 0.0
     # Total time spent in Function.fn.__call__
     #
@@ -237,6 +490,13 @@ class ProfileStats(object):
     optimizer_time = 0.0
     # time spent optimizing graph (FunctionMaker.__init__)
 
+    optimizer_cache_hits = 0
+    # Number of graphs taken from the optimization cache
+    # (config.cache_optimizations) instead of being optimized.
+
+    optimizer_cache_misses = 0
+    # Number of graphs looked up in the optimization cache and not found.
+
     validate_time = 0.0
     # time spent in fgraph.validate
     # This is a subset of optimizer_time that is dominated by toposort()
@@ -248,6 +508,12 @@ class ProfileStats(object):
     import_time = 0.0
     # time spent in importing compiled python module.
 
+    compile_lock_wait_time = 0.0
+    # time spent acquiring compilation locks (see theano.gof.compilelock)
+
+    compile_lock_wait_count = 0
+    # number of lock acquisitions that waited for another process
+
     linker_node_make_thunks = 0.0
 
     linker_make_thunk_time = {}
@@ -262,6 +528,22 @@ class ProfileStats(object):
     optimizer_profile = None
     # None or tuple (the optimizer, the profile it returned)
 
+    memory_plan = None
+    # None or the MemoryPlan of the function (config.vm.memory_plan)
+
+    vm_thread_time = []
+    # Time spent in thunks by each thread of a ThreadedLoop VM, the
+    # busiest thread first.
+
+    measured_memory = None
+    # None, or the MeasuredMemory of the calls
+    # (config.profiling.measure_memory)
+
+    timeline = None
+    # None, or a deque of the last config.profiling.timeline thunk
+    # executions (node, start, end, thread ident) recorded by the VM. node
+    # is None for a whole call of the VM.
+
     # param is called flag_time_thunks because most other attributes with time
     # in the name are times *of* something, rather than configuration flags.
     def __init__(self, atexit_print=True, flag_time_thunks=None,
@@ -298,11 +580,21 @@ class ProfileStats(object):
         self.variable_shape = {}
         self.variable_strides = {}
         self.variable_offset = {}
+        self.vm_thread_time = []
+        if config.profiling.timeline:
+            self.timeline = deque(maxlen=config.profiling.timeline)
+        if config.profiling.measure_memory:
+            self.measured_memory = MeasuredMemory()
         if flag_time_thunks is None:
             self.flag_time_thunks = config.profiling.time_thunks
         else:
             self.flag_time_thunks = flag_time_thunks
+        self.sample_every = config.profiling.sample_every
+        self.sample_fraction = config.profiling.sample_fraction
         self.__dict__.update(kwargs)
+        self.sampling = self.sample_every > 1 or self.sample_fraction < 1
+        self._sample_countdown = 0
+        self._sample_random = random.Random()
         if atexit_print:
             global _atexit_print_list
             _atexit_print_list.append(self)
@@ -312,6 +604,43 @@ class ProfileStats(object):
                 _atexit_registered = True
         self.ignore_first_call = theano.config.profiling.ignore_first_call
 
+    def sample_call(self):
+        """
+        Return True if the thunks of the next call must be timed.
+
+        The first call is timed, then one out of `sample_every` calls or,
+        if `sample_fraction` < 1, a random fraction of them.
+
+        """
+        if self.sample_fraction < 1:
+            return self._sample_random.random() < self.sample_fraction
+        self._sample_countdown -= 1
+        if self._sample_countdown <= 0:
+            self._sample_countdown = self.sample_every
+            return True
+        return False
+
+    def sampling_estimate(self):
+        """
+        Return a copy of this profile where the time and the number of
+        calls of the nodes are scaled from the sampled calls to all the
+        calls, or self if all the calls were timed.
+
+        """
+        if not 0 < self.sampled_callcount < self.fct_callcount:
+            return self
+        scale = float(self.fct_callcount) / self.sampled_callcount
+        estimate = copy.copy(self)
+        estimate.apply_time = dict((node, t * scale) for node, t
+                                   in iteritems(self.apply_time))
+        estimate.apply_callcount = dict(
+            (node, int(round(c * scale)))
+            for node, c in iteritems(self.apply_callcount))
+        estimate.vm_thread_time = [t * scale for t in self.vm_thread_time]
+        estimate.sampled_callcount = self.fct_callcount
+        estimate.sampled_from = self.sampled_callcount
+        return estimate
+
     def class_time(self):
         """
         dict op -> total time on thunks
@@ -730,6 +1059,9 @@ class ProfileStats(object):
         print('  Message: %s' % self.message, file=file)
         print('  Time in %i calls to Function.__call__: %es' % (
             self.fct_callcount, self.fct_call_time), file=file)
+        if self.sampled_from is not None:
+            print('  Thunks timed in %i sampled calls, their times are '
+                  'scaled to all the calls' % self.sampled_from, file=file)
         if self.fct_call_time > 0:
             print('  Time in Function.fn.__call__: %es (%.3f%%)' % (
                 self.vm_call_time,
@@ -739,15 +1071,29 @@ class ProfileStats(object):
                 print('  Time in thunks: %es (%.3f%%)' %
                       (local_time, 100 * local_time / self.fct_call_time),
                       file=file)
+            if self.vm_thread_time and self.vm_call_time > 0:
+                print('  Time in thunks by thread (% of Function.fn.__call__):',
+                      file=file)
+                for i, t in enumerate(self.vm_thread_time):
+                    print('    Thread %d: %es (%.3f%%)' % (
+                        i, t, 100 * t / self.vm_call_time), file=file)
         print('  Total compile time: %es' % self.compile_time, file=file)
         print('    Number of Apply nodes: %d' % self.nb_nodes, file=file)
         print('    Theano Optimizer time: %es' % self.optimizer_time,
               file=file)
+        if self.optimizer_cache_hits or self.optimizer_cache_misses:
+            print('       Optimization cache: %d hits, %d misses' % (
+                self.optimizer_cache_hits, self.optimizer_cache_misses),
+                file=file)
         print('       Theano validate time: %es' % self.validate_time,
               file=file)
         print('    Theano Linker time (includes C, CUDA code '
               'generation/compiling): %es' % self.linker_time, file=file)
         print('       Import time %es' % self.import_time, file=file)
+        if self.compile_lock_wait_count:
+            print('       Compile lock wait time %es (%d waits)' % (
+                self.compile_lock_wait_time, self.compile_lock_wait_count),
+                file=file)
         print('       Node make_thunk time %es' % self.linker_node_make_thunks,
               file=file)
 
@@ -761,6 +1107,107 @@ class ProfileStats(object):
         if self.optimizer_time > 0:
             assert self.validate_time < self.optimizer_time
 
+    def optimizer_profile_dict(self):
+        """
+        Return the optimizer profile as nested dicts and lists of numbers
+        and strings, that can be saved in JSON, or None if there is no
+        optimizer profile.
+
+        See the `profile_to_dict` method of the optimizers.
+
+        """
+        if not self.optimizer_profile:
+            return None
+        opt, prof = self.optimizer_profile
+        return opt.profile_to_dict(prof)
+
+    def timeline_events(self, min_gap=1e-6):
+        """
+        Return the timeline as a list of Chrome trace events.
+
+        There is one complete ("X") event for each recorded call of the VM
+        and for each thunk execution. The thunks of the critical path of a
+        call, the chain of dependencies that ended last, have the category
+        "critical". The gaps of at least `min_gap` seconds between the
+        thunks of a thread during a call are "idle" events. They are the
+        overhead of the VM, or the time the thread waited for the others.
+
+        """
+        if not self.timeline:
+            return []
+        pid = os.getpid()
+        # The profiles of Scan have a name instead of a message
+        fct_name = str(self.message or getattr(self, 'name', None) or
+                       'Theano function')
+        node_idx = {}
+
+        def event(name, cat, t0, t1, tid, **args):
+            args['function'] = fct_name
+            return {'name': name, 'cat': cat, 'ph': 'X',
+                    'ts': (t0 - theano_imported_time) * 1e6,
+                    'dur': (t1 - t0) * 1e6, 'pid': pid, 'tid': tid,
+                    'args': args}
+
+        records = sorted(self.timeline, key=lambda r: r[1])
+        calls = [r for r in records if r[0] is None]
+        events = [event(fct_name, 'call', r[1], r[2], r[3]) for r in calls]
+
+        # The thunks run during each call, then the ones whose call was
+        # dropped from the timeline.
+        by_call = [[] for r in calls]
+        j = 0
+        for r in records:
+            if r[0] is None:
+                continue
+            while j < len(calls) and calls[j][2] < r[1]:
+                j += 1
+            if j < len(calls) and calls[j][1] <= r[1]:
+                by_call[j].append(r)
+            else:
+                by_call.append([r])
+
+        for j, thunks in enumerate(by_call):
+            # Walk back from the thunk that ended last, each time to the
+            # thunk of an input that ended last before it started.
+            critical = set()
+            runs = {}
+            for r in thunks:
+                runs.setdefault(r[0], []).append(r)
+            r = max(thunks, key=lambda r: r[2]) if thunks else None
+            while r is not None:
+                critical.add(id(r))
+                prev = None
+                for i in r[0].inputs:
+                    for p in runs.get(i.owner, ()):
+                        if p[2] <= r[1] and (prev is None or p[2] > prev[2]):
+                            prev = p
+                r = prev
+
+            # thread ident -> end of its last thunk
+            idle_from = {}
+            if j < len(calls):
+                idle_from[calls[j][3]] = calls[j][1]
+            for r in thunks:
+                node = r[0]
+                if node.fgraph not in node_idx:
+                    node_idx[node.fgraph] = dict(
+                        (n, i) for i, n in enumerate(node.fgraph.toposort()))
+                is_critical = id(r) in critical
+                events.append(event(
+                    str(node.op), 'thunk,critical' if is_critical else 'thunk',
+                    r[1], r[2], r[3], node=node_idx[node.fgraph].get(node),
+                    critical=is_critical))
+                start = idle_from.get(r[3])
+                if start is not None and r[1] - start >= min_gap:
+                    events.append(event('idle', 'idle', start, r[1], r[3]))
+                idle_from[r[3]] = max(r[2], idle_from.get(r[3], r[2]))
+            if j < len(calls):
+                start = idle_from[calls[j][3]]
+                if calls[j][2] - start >= min_gap:
+                    events.append(event('idle', 'idle', start, calls[j][2],
+                                        calls[j][3]))
+        return events
+
     def summary_globals(self, file):
         print('Time in all call to theano.grad() %es' %
               theano.gradient.grad_time, file=file)
@@ -788,6 +1235,7 @@ class ProfileStats(object):
                     else:
                         v = 0  # 'Unknown'
                 else:
+                    sh = None
                     v = 0  # 'Variable isn't created'
 
                 var_mem[out] = v
@@ -1247,6 +1695,16 @@ class ProfileStats(object):
             new_max_node_memory_size[0] / 1024.)), file=file)
         print("---", file=file)
 
+        if self.memory_plan is not None:
+            print("    Planned arena size (Theano flag vm.memory_plan)",
+                  file=file)
+            print("        CPU: %dKB for %d variables of %dKB" % (
+                int(round(self.memory_plan.size / 1024.)),
+                len(self.memory_plan.offsets),
+                int(round(self.memory_plan.total_size() / 1024.))),
+                file=file)
+            print("---", file=file)
+
         if min_max_peak:
             print("    Minimum peak from all valid apply node order is "
                   "%dKB(took %.3fs to compute)" %
@@ -1310,6 +1768,10 @@ class ProfileStats(object):
 
     def summary(self, file=sys.stderr, n_ops_to_print=20,
                 n_apply_to_print=20):
+        if 0 < self.sampled_callcount < self.fct_callcount:
+            self.sampling_estimate().summary(file, n_ops_to_print,
+                                             n_apply_to_print)
+            return
         self.summary_function(file)
         self.summary_globals(file)
         local_time = sum(self.apply_time.values())
@@ -1325,6 +1787,8 @@ class ProfileStats(object):
             theano.printing.debugprint(fcts, print_type=True)
         if self.variable_shape or self.variable_strides:
             self.summary_memory(file, n_apply_to_print)
+        if self.measured_memory is not None:
+            self.measured_memory.summary(file, n_apply_to_print)
         if self.optimizer_profile:
             print("Optimizer Profile", file=file)
             print("-----------------", file=file)
@@ -9,6 +9,7 @@ import numpy as np
 
 import theano
 from theano.compile.io import In
+from theano.tests import unittest_tools as utt
 
 
 def test_function_dump():
@@ -192,3 +193,103 @@ class TestFunctionIn(unittest.TestCase):
 
         # If allow_downcast is None, like False
         self.assertRaises(TypeError, f, z, z, [0.1])
+
+
+class TestFunctionFamily(unittest.TestCase):
+
+    def setUp(self):
+        self.x = theano.tensor.matrix('x')
+        self.y = theano.tensor.vector('y')
+        self.w = theano.shared(np.ones(3, dtype=theano.config.floatX), 'w')
+        self.n = theano.shared(np.asarray(0, dtype='int64'), 'n')
+        p = theano.tensor.nnet.sigmoid(theano.tensor.dot(self.x, self.w))
+        self.cost = ((p - self.y) ** 2).mean()
+        self.gw = theano.tensor.grad(self.cost, self.w)
+        self.members = [
+            ('train', dict(inputs=[self.x, self.y], outputs=self.cost,
+                           updates=[(self.w, self.w - 0.1 * self.gw),
+                                    (self.n, self.n + 1)])),
+            ('valid', dict(inputs=[self.x, self.y],
+                           outputs=[self.cost, abs(p - self.y).max()])),
+            ('predict', dict(inputs=[self.x], outputs=p > 0.5))]
+        rng = np.random.RandomState(1)
+        self.x_val = rng.rand(4, 3).astype(theano.config.floatX)
+        self.y_val = rng.rand(4).astype(theano.config.floatX)
+
+    def check(self, mode):
+        family = theano.function_family(self.members, mode=mode)
+        assert family.inputs == [self.x, self.y]
+        w_val = self.w.get_value()
+        fcts = dict((name, theano.function(mode=mode, **kwargs))
+                    for name, kwargs in self.members)
+        # The members are views on the merged function
+        valid = family['valid'](self.x_val, self.y_val)
+        assert isinstance(valid, list)
+        utt.assert_allclose(valid, fcts['valid'](self.x_val, self.y_val))
+        utt.assert_allclose(family['predict'](self.x_val),
+                            fcts['predict'](self.x_val))
+        assert self.n.get_value() == 0
+        cost = family['train'](self.x_val, self.y_val)
+        utt.assert_allclose(cost, valid[0])
+        assert self.n.get_value() == 1
+        new_w = self.w.get_value()
+        self.w.set_value(w_val)
+        utt.assert_allclose(cost, fcts['train'](self.x_val, self.y_val))
+        utt.assert_allclose(new_w, self.w.get_value())
+        assert self.n.get_value() == 2
+
+        # Several members in one call
+        train, predict = family(self.x_val, self.y_val,
+                                members=['train', 'predict'])
+        utt.assert_allclose(predict, fcts['predict'](self.x_val))
+        assert self.n.get_value() == 3
+        return family
+
+    def test_cvm(self):
+        family = self.check(theano.compile.Mode(linker='cvm'))
+        assert family.partial_eval
+        # The graph of the cost is shared by the members
+        fgraph = family.function.maker.fgraph
+        nodes = [len(theano.function(
+            mode=theano.compile.Mode(linker='cvm'),
+            **kwargs).maker.fgraph.apply_nodes)
+            for _, kwargs in self.members]
+        assert len(fgraph.apply_nodes) < sum(nodes)
+
+    def test_stack(self):
+        mode = theano.compile.Mode(
+            linker=theano.gof.vm.VM_Linker(use_cloop=False))
+        family = self.check(mode)
+        assert family.partial_eval
+        assert isinstance(family.function.fn, theano.gof.vm.Stack)
+
+    def test_no_partial_eval(self):
+        family = self.check(theano.compile.Mode(linker='py'))
+        assert not family.partial_eval
+        assert family['train'].fn is not None
+
+    def test_default_updates(self):
+        self.n.default_update = self.n + 1
+        try:
+            family = theano.function_family(
+                [('f', dict(inputs=[self.x], outputs=self.x * self.n)),
+                 ('g', dict(inputs=[self.y], outputs=self.y + 1,
+                            no_default_updates=True))])
+            family['f'](self.x_val)
+            assert self.n.get_value() == 1
+            family['g'](self.y_val)
+            assert self.n.get_value() == 1
+        finally:
+            del self.n.default_update
+
+    def test_errors(self):
+        family = theano.function_family(
+            [('a', dict(inputs=[self.x], outputs=self.x,
+                        updates=[(self.n, self.n + 1)])),
+             ('b', dict(inputs=[self.x], outputs=self.x,
+                        updates=[(self.n, self.n + 2)]))])
+        self.assertRaises(ValueError, family, self.x_val)
+        self.assertRaises(TypeError, family['a'], self.x_val, self.x_val)
+        self.assertRaises(
+            theano.gof.MissingInputError, theano.function_family,
+            [('a', dict(inputs=[self.x], outputs=self.cost))])
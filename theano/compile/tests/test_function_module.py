@@ -13,6 +13,7 @@ from theano.compile import function
 from theano.compile import UnusedInputError
 from theano.gof import MissingInputError
 from theano.compat import exc_message
+from theano.tests import unittest_tools as utt
 from theano.tests.unittest_tools import SkipTest
 
 from theano import tensor
@@ -616,6 +617,152 @@ class T_function(unittest.TestCase):
 
             assert f._check_for_aliased_inputs, d
 
+    def test_call_many(self):
+        x, y = T.dvectors('x', 'y')
+        s = theano.shared(0.)
+        f = function([x, In(y, value=np.ones(2))], [x + y, (x * y).sum()],
+                     updates=[(s, s + x.sum())])
+        args = [(np.arange(2.) + i, np.arange(2.) * i) for i in range(4)]
+        args += [(np.arange(2.),)]
+        expected = [f(*a) for a in args]
+        s_expected = s.get_value()
+        s.set_value(0.)
+
+        results = f.call_many(args)
+        assert len(results) == len(expected)
+        for r, e in zip(results, expected):
+            utt.assert_allclose(r[0], e[0])
+            utt.assert_allclose(r[1], e[1])
+        assert s.get_value() == s_expected
+        # The required inputs are not kept alive
+        assert f.input_storage[0].storage[0] is None
+
+        out, total = f.call_many(args, stack=True)
+        assert out.shape == (5, 2) and total.shape == (5,)
+        utt.assert_allclose(out, [e[0] for e in expected])
+
+        gen = f.call_iter(iter(args), output_subset=[1])
+        utt.assert_allclose(next(gen)[0], expected[0][1])
+        gen.close()
+
+        g = function([x], {'a': x + 1, 'b': x.sum()})
+        r = g.call_many([(np.arange(2.),)] * 3, stack=True)
+        utt.assert_allclose(r['a'], [[1, 2]] * 3)
+        utt.assert_allclose(r['b'], [1] * 3)
+
+        g = function([x], x * 2)
+        g.trust_input = True
+        utt.assert_allclose(g.call_many([(np.ones(2),)] * 2, stack=True),
+                            [[2, 2]] * 2)
+
+        self.assertRaises(TypeError, f.call_many, [()])
+        self.assertRaises(TypeError, f.call_many, [(1, 2, 3)])
+        self.assertRaises(TypeError, f.call_many, [(np.ones((2, 2)),)])
+        self.assertRaises(ValueError, f.call_many, [(np.ones(3),)])
+
+    def test_out(self):
+        class RecordStorage(gof.Op):
+            # Records the storage of its output before it computes it
+            __props__ = ()
+
+            def make_node(self, x):
+                return gof.Apply(self, [x], [x.type()])
+
+            def perform(self, node, inputs, outputs):
+                self.storage = outputs[0][0]
+                if outputs[0][0] is None:
+                    outputs[0][0] = inputs[0] * 2
+                else:
+                    np.multiply(inputs[0], 2, out=outputs[0][0])
+
+        x = T.dmatrix('x')
+        a = np.random.rand(3, 4)
+        for linker in ['py', 'vm', 'cvm', 'c|py']:
+            mode = theano.compile.Mode(linker=linker, optimizer=None)
+            op = RecordStorage()
+            f = function([x], [op(x), x, x.sum()], mode=mode)
+            buf = np.empty((3, 4))
+            buf2 = np.empty((3, 4))
+            r = f(a, out=[buf, buf2, None])
+            assert r[0] is buf and r[1] is buf2
+            utt.assert_allclose(buf, a * 2)
+            utt.assert_allclose(buf2, a)
+            utt.assert_allclose(r[2], a.sum())
+            assert op.storage is buf, linker
+            # The buffers are not reused by the next calls
+            r = f(a)
+            assert op.storage is not buf
+            assert r[0] is not buf and r[1] is not buf2
+
+            # Not contiguous buffers are filled by a copy
+            buf = np.empty((4, 3)).T
+            assert f(a, out=[buf, None, None])[0] is buf
+            assert op.storage is not buf
+            utt.assert_allclose(buf, a * 2)
+
+        g = function([x], {'a': x + 1, 'b': x.sum()})
+        buf = np.empty((3, 4))
+        assert g(a, out={'a': buf})['a'] is buf
+        utt.assert_allclose(buf, a + 1)
+        g = function([x], x + 1)
+        assert g(a, out=buf) is buf
+        utt.assert_allclose(buf, a + 1)
+
+        self.assertRaises(ValueError, g, a, out=[buf, buf])
+        self.assertRaises(TypeError, g, a, out=np.empty((3, 4), 'float32'))
+        self.assertRaises(TypeError, g, a, out=np.empty(3))
+        self.assertRaises(ValueError, g, a, out=np.empty((4, 3)))
+        self.assertRaises(TypeError, g, a, out=buf, output_subset=[0])
+
+        # A call with a buffer of the wrong shape does not update the
+        # shared variables
+        s = theano.shared(np.zeros(3))
+        h = function([x], x + 1, updates={s: s + 1})
+        self.assertRaises(ValueError, h, a, out=np.empty((4, 3)))
+        utt.assert_allclose(s.get_value(), np.zeros(3))
+        h(a, out=buf)
+        utt.assert_allclose(s.get_value(), np.ones(3))
+
+    def test_out_input(self):
+        # The buffer of an output that is an input of the graph is filled
+        # by a copy, and the input is not cleared after the call
+        s = theano.shared(np.zeros(3))
+        f = function([], s, updates={s: s + 1})
+        buf = np.empty(3)
+        for i in range(2):
+            assert f(out=buf) is buf
+            utt.assert_allclose(buf, [i] * 3)
+            utt.assert_allclose(s.get_value(), [i + 1] * 3)
+
+        x = T.dvector('x')
+        a = np.arange(3.)
+        for o in [x, x[::-1]]:
+            f = function([In(x, borrow=True)], Out(o, borrow=True))
+            for i in range(2):
+                assert f(a, out=buf) is buf
+                utt.assert_allclose(buf, f(a))
+            utt.assert_allclose(a, np.arange(3.))
+
+    def test_out_aliased(self):
+        # A buffer that shares memory with an input is filled after the
+        # inputs are read
+        x = T.dmatrix('x')
+        y = T.dmatrix('y')
+        f = function([x, y], T.dot(x, y))
+        a = np.random.rand(3, 3)
+        b = np.random.rand(3, 3)
+        expected = np.dot(a, b)
+        assert f(a, b, out=[a]) is a
+        utt.assert_allclose(a, expected)
+
+        g = function([x], [x + 1, x * 2])
+        buf = np.empty((6, 3))
+        self.assertRaises(ValueError, g, b, out=[buf[:3], buf[:3]])
+        self.assertRaises(ValueError, g, b, out=[buf[:3], buf[1:4]])
+        r = g(b, out=[buf[:3], buf[3:]])
+        utt.assert_allclose(r[0], b + 1)
+        utt.assert_allclose(r[1], b * 2)
+
 
 class T_picklefunction(unittest.TestCase):
 
@@ -1,9 +1,11 @@
 # Test of memory profiling
 from __future__ import absolute_import, print_function, division
 
+import json
 import unittest
 
 import numpy as np
+from six import iteritems, itervalues
 
 import theano
 from six.moves import StringIO
@@ -103,6 +105,200 @@ class Test_profiling(unittest.TestCase):
             theano.config.profile = config1
             theano.config.profile_memory = config2
 
+    def test_optimizer_profile_dict(self):
+        a, b = T.vectors('a', 'b')
+        z = T.exp(a * 2 + b).sum() + T.log(a + 1).sum()
+        if theano.config.mode in ["DebugMode", "DEBUG_MODE", "FAST_COMPILE"]:
+            m = "FAST_RUN"
+        else:
+            m = None
+
+        with theano.change_flags(profile=True, profile_optimizer=True):
+            p = theano.ProfileStats(False, gpu_checks=False)
+            f = theano.function([a, b], z, profile=p, mode=m)
+        prof = f.profile.optimizer_profile_dict()
+        assert prof['optimizer'] == 'SeqOptimizer'
+        assert prof['nodes_before'] >= prof['nodes_after']
+
+        def find(d, optimizer):
+            # All the sub-profiles of `optimizer` type in d.
+            found = []
+            if isinstance(d, dict):
+                if d.get('optimizer') == optimizer and 'passes' in d:
+                    found.append(d)
+                for v in d.values():
+                    found += find(v, optimizer)
+            elif isinstance(d, list):
+                for v in d:
+                    found += find(v, optimizer)
+            return found
+        eq = find(prof, 'EquilibriumOptimizer')
+        assert eq
+        for d in eq:
+            assert d['node_delta'] == d['nodes_after'] - d['nodes_before']
+            for lopt in d['local_optimizers']:
+                assert lopt['attempts'] >= lopt['applied']
+                assert lopt['failures'] >= 0
+        assert any(d['time_per_op_type'] for d in eq)
+
+        buf = StringIO()
+        theano.compile.profiling.dump_optimizer_profiles([f.profile], buf)
+        saved = json.loads(buf.getvalue())
+        assert len(saved['functions']) == 1
+        assert saved['functions'][0]['optimizer_profile']['name'] == \
+            prof['name']
+
+        # The text profile still works, also after merging.
+        opt, opt_prof = f.profile.optimizer_profile
+        opt.print_profile(StringIO(), opt_prof)
+        merged = opt.merge_profile(opt_prof, opt_prof)
+        assert len(merged) == len(opt_prof)
+        opt.print_profile(StringIO(), merged)
+
+    def test_timeline(self):
+        a, b = T.vectors('a', 'b')
+        z = T.exp(a * 2 + b) + T.log(b + 1).sum()
+
+        for linker in ['cvm', 'vm', 'vm_nogc']:
+            with theano.change_flags({'profile': True,
+                                      'profiling.timeline': 12}):
+                p = theano.ProfileStats(False, gpu_checks=False)
+                f = theano.function(
+                    [a, b], z, profile=p,
+                    mode=theano.Mode(linker=linker, optimizer='fast_run'))
+            n_nodes = len(f.maker.fgraph.apply_nodes)
+            for i in range(4):
+                f(np.ones(5), np.ones(5))
+            # The ring buffer keeps the last records only
+            assert len(f.profile.timeline) == min(12, 4 * (n_nodes + 1))
+            assert f.profile.timeline[-1][0] is None
+
+            events = f.profile.timeline_events()
+            thunks = [e for e in events if e['cat'].startswith('thunk')]
+            calls = [e for e in events if e['cat'] == 'call']
+            assert len(calls) >= 1
+            assert thunks
+            assert all(e['ph'] == 'X' and e['dur'] >= 0 for e in events)
+            # The critical path ends with the last thunk of the last call.
+            last = max(thunks, key=lambda e: e['ts'] + e['dur'])
+            assert last['args']['critical']
+
+            buf = StringIO()
+            theano.compile.profiling.dump_timeline([f.profile], buf)
+            saved = json.loads(buf.getvalue())
+            assert len(saved['traceEvents']) == len(events)
+
+            f.profile.reset()
+            assert not f.profile.timeline_events()
+
+    def test_sampling(self):
+        a, b = T.vectors('a', 'b')
+        z = T.exp(a * 2 + b) + T.log(b + 1).sum()
+        x = T.scalar('x')
+        lazy = ifelse(T.lt(x, 0), x * 2, x * 3)
+
+        for linker in ['cvm', 'vm', 'vm_nogc']:
+            mode = theano.Mode(linker=linker, optimizer='fast_run')
+            p = theano.ProfileStats(False, gpu_checks=False, sample_every=3)
+            f = theano.function([a, b], z, profile=p, mode=mode)
+            p2 = theano.ProfileStats(False, gpu_checks=False,
+                                     sample_every=3)
+            g = theano.function([x], lazy, profile=p2, mode=mode)
+            for i in range(6):
+                f(np.ones(5), np.ones(5))
+                g(1.)
+            # The calls 1 and 4 are timed, then the whole call_iter.
+            list(f.call_iter([(np.ones(5), np.ones(5))] * 2))
+            assert p.fct_callcount == 8
+            assert p.sampled_callcount == 4
+            counts = set(itervalues(p.apply_callcount))
+            assert counts == set([4]), counts
+            assert p2.sampled_callcount == 2
+
+            estimate = p.sampling_estimate()
+            assert estimate.sampled_from == 4
+            assert set(itervalues(estimate.apply_callcount)) == set([8])
+            for node, t in iteritems(p.apply_time):
+                assert np.allclose(estimate.apply_time[node], t * 2)
+            buf = StringIO()
+            p.summary(buf)
+            assert "4 sampled calls" in buf.getvalue()
+
+        p = theano.ProfileStats(False, gpu_checks=False,
+                                sample_fraction=0.5)
+        f = theano.function([a, b], z, profile=p)
+        for i in range(50):
+            f(np.ones(5), np.ones(5))
+        assert 0 < p.sampled_callcount < 50
+
+    def test_sampling_timeline(self):
+        # With the timeline, the Python VMs time all the calls, but only
+        # the sampled ones are counted in the profile.
+        a, b = T.vectors('a', 'b')
+        z = T.exp(a * 2 + b) + T.log(b + 1).sum()
+
+        for allow_gc, threads in [(False, None), (True, None), (True, 2)]:
+            lnk = theano.gof.vm.VM_Linker(allow_gc=allow_gc,
+                                          use_cloop=False, threads=threads)
+            mode = theano.Mode(linker=lnk, optimizer='fast_run')
+            with theano.change_flags({'profiling.timeline': 100}):
+                p = theano.ProfileStats(False, gpu_checks=False,
+                                        sample_every=3)
+                f = theano.function([a, b], z, profile=p, mode=mode)
+            for i in range(6):
+                f(np.ones(5), np.ones(5))
+            assert p.fct_callcount == 6
+            assert p.sampled_callcount == 2
+            counts = set(itervalues(p.apply_callcount))
+            assert counts == set([2]), counts
+            estimate = p.sampling_estimate()
+            assert set(itervalues(estimate.apply_callcount)) == set([6])
+            # All the calls are in the timeline.
+            assert len([e for e in p.timeline if e[0] is None]) == 6
+
+    def test_measure_memory(self):
+        x = T.matrix('x')
+        y = T.exp(x)
+        z = T.dot(y, y.T) + 1
+        w = (z * 2).sum() + T.exp(T.tanh(y)).sum()
+        val = np.ones((20, 20), dtype=theano.config.floatX)
+        nbytes = val.nbytes
+
+        for allow_gc in [True, False]:
+            mode = theano.Mode(
+                linker=theano.gof.vm.VM_Linker(allow_gc=allow_gc,
+                                               use_cloop=True),
+                optimizer='fast_run').excluding('gemm_optimizer')
+            with theano.change_flags({'profiling.measure_memory': True}):
+                p = theano.ProfileStats(False, gpu_checks=False)
+                f = theano.function([x], w, profile=p, mode=mode)
+            mem = p.measured_memory
+            for i in range(3):
+                f(val)
+            exp = [n for n in f.maker.fgraph.apply_nodes
+                   if n.inputs == f.maker.fgraph.inputs][0]
+            assert mem.node_calls[exp] == 3
+            if allow_gc:
+                assert mem.node_allocated[exp] == 3 * nbytes
+                held = 0
+            else:
+                # The later calls write in the buffer of the first one
+                assert mem.node_allocated[exp] == nbytes
+                assert mem.node_reused[exp] == 2 * nbytes
+                held = nbytes
+            # The views and inplace outputs do not allocate
+            for node in f.maker.fgraph.apply_nodes:
+                if (getattr(node.op, 'view_map', None) or
+                        getattr(node.op, 'destroy_map', None)):
+                    assert node not in mem.node_allocated, node
+            # exp(x) and the dot are live together
+            assert mem.peak >= 2 * nbytes
+            assert sum(b[0] for b in mem.peak_buffers if b[3]) >= held
+
+            buf = StringIO()
+            p.summary(buf)
+            assert "Measured Memory Profile" in buf.getvalue()
+
 
 if __name__ == '__main__':
     unittest.main()
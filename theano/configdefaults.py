@@ -606,6 +606,21 @@ AddConfigVar('optimizer_verbose',
              BoolParam(False),
              in_c_key=False)
 
+AddConfigVar('optimizer_incremental_toposort',
+             "If True, the graphs of the compiled functions keep their "
+             "topological order up to date during optimization, instead "
+             "of sorting the whole graph each time it is needed.",
+             BoolParam(False),
+             in_c_key=False)
+
+AddConfigVar('optimizer_worklist',
+             "If True, after their first iteration the EquilibriumOptimizers "
+             "first apply their local optimizers near the nodes changed "
+             "since the previous iteration, and only visit the other nodes "
+             "when none of them changes.",
+             BoolParam(False),
+             in_c_key=False)
+
 AddConfigVar(
     'on_opt_error',
     ("What to do when an optimization crashes: warn and skip it, raise "
@@ -642,6 +657,14 @@ AddConfigVar(
     BoolParam(True),
     in_c_key=False)
 
+AddConfigVar(
+    'tensor.elemwise_fusion_max_inputs',
+    ("Maximum number of inputs of an elemwise node built by the elemwise "
+     "fusion optimization on the CPU. The C code and its compilation time "
+     "grow with the number of inputs."),
+    IntParam(1024, lambda i: i > 1),
+    in_c_key=False)
+
 AddConfigVar(
     'gpu.local_elemwise_fusion',
     ("Enable or not in fast_run mode(fast_run optimization) the gpu "
@@ -890,6 +913,17 @@ AddConfigVar(
     in_c_key=False)
 
 
+AddConfigVar(
+    'intern_apply',
+    ("If True, calling an Op on the same inputs as an existing Apply node "
+     "returns the outputs of that node instead of building a new one, so "
+     "duplicated subgraphs are merged while the graph is built. Constant "
+     "inputs are compared by value. The variables returned may then be "
+     "shared by several parts of the graph, so do not rename them."),
+    BoolParam(False),
+    in_c_key=False)
+
+
 AddConfigVar(
     'print_test_value',
     ("If 'True', the __eval__ of a Theano variable will return its test_value "
@@ -988,6 +1022,14 @@ AddConfigVar('openmp_elemwise_minsize',
              in_c_key=False,
              )
 
+AddConfigVar('openmp_careduce_minsize',
+             "If OpenMP is enabled, this is the minimum number of input "
+             "elements for which the openmp parallelization is enabled "
+             "in reductions (sum, prod, max, min, all, any).",
+             IntParam(200000),
+             in_c_key=False,
+             )
+
 AddConfigVar(
     'check_input',
     "Specify if types should check their input in their C code. "
@@ -999,14 +1041,27 @@ AddConfigVar(
 
 AddConfigVar(
     'cache_optimizations',
-    "WARNING: work in progress, does not work yet. "
-    "Specify if the optimization cache should be used. This cache will "
-    "any optimized graph and its optimization. Actually slow downs a lot "
-    "the first optimization, and could possibly still contains some bugs. "
-    "Use at your own risks.",
+    "Specify if the optimization cache should be used. Optimized graphs "
+    "are stored in the compiledir, keyed by the structure of the "
+    "unoptimized graph, the optimizer and the Theano flags, and reused "
+    "by later compilations of the same graph, also in other processes.",
     BoolParam(False),
     in_c_key=False)
 
+AddConfigVar(
+    'cache_optimizations_max_entries',
+    "Maximum number of optimized graphs kept in the optimization cache. "
+    "The least recently used ones are removed first.",
+    IntParam(1000, lambda i: i > 0),
+    in_c_key=False)
+
+AddConfigVar(
+    'cache_optimizations_max_size',
+    "Maximum total size, in MB, of the optimized graphs kept in the "
+    "optimization cache. The least recently used ones are removed first.",
+    IntParam(1024, lambda i: i > 0),
+    in_c_key=False)
+
 
 def good_seed_param(seed):
     if seed == "random":
@@ -1133,6 +1188,19 @@ AddConfigVar('profiling.time_thunks',
              BoolParam(True),
              in_c_key=False)
 
+AddConfigVar('profiling.sample_every',
+             "When profiling, time the thunks of only one call out of that "
+             "many calls of each function. The others run without timing "
+             "and the times are scaled in the profile.",
+             IntParam(1, lambda i: i > 0),
+             in_c_key=False)
+
+AddConfigVar('profiling.sample_fraction',
+             "When profiling, time the thunks of that random fraction of "
+             "the calls of each function, instead of profiling.sample_every.",
+             FloatParam(1.0, lambda x: 0 < x <= 1),
+             in_c_key=False)
+
 AddConfigVar('profiling.n_apply',
              "Number of Apply instances to print by default",
              IntParam(20, lambda i: i > 0),
@@ -1166,6 +1234,35 @@ AddConfigVar('profiling.destination',
              StrParam('stderr'),
              in_c_key=False)
 
+AddConfigVar('profiling.optimizer_json',
+             "If not empty, the optimizer profiles of the profiled "
+             "functions are also saved in JSON in this file at exit. "
+             "Needs profile_optimizer=True.",
+             StrParam(''),
+             in_c_key=False)
+
+AddConfigVar('profiling.timeline',
+             "If > 0, the Python VMs of the profiled functions record the "
+             "start and end of that many of their last thunk executions, "
+             "for a timeline of the calls. The CVM is then replaced by the "
+             "Stack VM.",
+             IntParam(0, lambda i: i >= 0),
+             in_c_key=False)
+
+AddConfigVar('profiling.timeline_json',
+             "If not empty, the timeline of the profiled functions is saved "
+             "in this file at exit, in the Chrome trace event format. "
+             "Needs profiling.timeline > 0.",
+             StrParam(''),
+             in_c_key=False)
+
+AddConfigVar('profiling.measure_memory',
+             "If True, the profiled functions use the Stack VM and measure "
+             "the buffers allocated by each node, the live bytes along the "
+             "calls and what allow_gc or inplace ops would save at the peak.",
+             BoolParam(False),
+             in_c_key=False)
+
 AddConfigVar('profiling.debugprint',
              """
              Do a debugprint of the profiled functions
@@ -1232,11 +1329,47 @@ AddConfigVar('cmodule.age_thresh_use',
              IntParam(60 * 60 * 24 * 24, allow_override=False),
              in_c_key=False)
 
+AddConfigVar('cmodule.use_index',
+             "If True, the compiled modules are found through an index file "
+             "in the compiledir instead of loading the key.pkl file of "
+             "every module at startup. The compiledir is still walked "
+             "when the index is missing, and once a day to remove old "
+             "modules and rebuild the index.",
+             BoolParam(True),
+             in_c_key=False)
+
 AddConfigVar('cmodule.debug',
              "If True, define a DEBUG macro (if not exists) for any compiled C code.",
              BoolParam(False),
              in_c_key=True)
 
+AddConfigVar('cmodule.compile_workers',
+             "Number of C modules compiled concurrently when the VM linker "
+             "builds a function. When higher than 1, all the modules of the "
+             "graph missing from the cache are compiled up front by that "
+             "many concurrent compiler processes. 0 or 1 compiles them one "
+             "at a time, when they are first needed.",
+             IntParam(0, lambda i: i >= 0),
+             in_c_key=False)
+
+AddConfigVar('cmodule.cache_probes',
+             "If True, the results of the test programs compiled to find "
+             "the BLAS flags, the -march flags and the options supported "
+             "by the compiler are kept in the compiledir, so that the "
+             "next processes do not compile them again. Use "
+             "'theano-cache probes clear' to forget them.",
+             BoolParam(True),
+             in_c_key=False)
+
+AddConfigVar('cmodule.hoist_constants',
+             "Constants with at most this many elements are read from "
+             "Python when a C module is instantiated, instead of being "
+             "part of its key and of its code. Graphs that only differ by "
+             "the values of such constants (a learning rate, a shape) then "
+             "share one compiled module. 0 disables it.",
+             IntParam(0, lambda i: i >= 0),
+             in_c_key=False)
+
 
 def check_mkl_openmp():
     if not theano.config.blas.check_openmp:
@@ -1568,6 +1701,23 @@ AddConfigVar('vm.lazy',
              ConfigParam('None', filter_vm_lazy),
              in_c_key=False)
 
+AddConfigVar('vm.threads',
+             "Number of threads of a VM_Linker created with threads=0, "
+             "that runs the independent nodes of the graph concurrently. "
+             "Only the thunks that release the GIL run concurrently, which "
+             "the C code of the CPU ops does not do. 0 means the number of "
+             "CPU cores.",
+             IntParam(0, lambda i: i >= 0),
+             in_c_key=False)
+
+AddConfigVar('vm.memory_plan',
+             "Useful only for the vm linkers with allow_gc=False. If True, "
+             "the intermediate results whose shape is known when compiling "
+             "are assigned ahead of time into one preallocated buffer, "
+             "sharing the memory of the results that are no longer needed.",
+             BoolParam(False),
+             in_c_key=False)
+
 AddConfigVar(
     'warn.identify_1pexp_bug',
     'Warn if Theano versions prior to 7987b51 (2011-12-18) could have '
@@ -25,6 +25,7 @@ from theano.gof import graph
 from theano.gof import link
 from theano.gof import utils
 from theano.gof import cmodule
+from theano.gof import compilelock
 from theano.gof.compilelock import get_lock, release_lock
 from theano.gof.callcache import CallCache
 
@@ -547,6 +548,24 @@ def struct_variable_codeblocks(variable, policies, id, symbol_table, sub):
     return struct_builder, block
 
 
+def is_hoisted_constant(variable, max_size):
+    """
+    Tell if the value of the constant `variable` is left out of the C code
+    and of the module key (see ``config.cmodule.hoist_constants``).
+
+    Such a constant is read from its Python value when the module is
+    instantiated, so graphs that only differ by the values of these
+    constants share one compiled module.
+
+    """
+    data = getattr(variable, 'data', None)
+    return (max_size > 0 and isinstance(variable, graph.Constant) and
+            isinstance(data, (np.ndarray, np.generic)) and
+            data.size <= max_size and
+            # Scalar can't extract a float16 from Python.
+            data.dtype != 'float16')
+
+
 class CLinker(link.Linker):
     """
     Creates C code for an fgraph, compiles it and returns callables
@@ -589,6 +608,7 @@ class CLinker(link.Linker):
         fgraph = self.fgraph
         self.inputs = fgraph.inputs
         self.outputs = fgraph.outputs
+        self.hoist_constants = config.cmodule.hoist_constants
 
         self.node_order = self.schedule(fgraph)
 
@@ -625,7 +645,8 @@ class CLinker(link.Linker):
         self.consts = []
         # Move c type from orphans (theano.scalar.Scalar) to self.consts
         for variable in self.orphans:
-            if isinstance(variable, graph.Constant):
+            if (isinstance(variable, graph.Constant) and
+                    not is_hoisted_constant(variable, self.hoist_constants)):
                 try:
                     variable.type.c_literal(variable.data)
                     self.consts.append(variable)
@@ -1298,6 +1319,7 @@ class CLinker(link.Linker):
                                  libraries=self.libraries(),
                                  header_dirs=self.header_dirs(),
                                  c_compiler=self.c_compiler(),
+                                 hoist_constants=self.hoist_constants,
                                  )
 
     def cmodule_key_variables(self, inputs, outputs, no_recycling,
@@ -1330,11 +1352,14 @@ class CLinker(link.Linker):
 
     def cmodule_key_(self, fgraph, no_recycling, compile_args=None,
                      libraries=None, header_dirs=None, insert_config_hash=True,
-                     c_compiler=None):
+                     c_compiler=None, hoist_constants=0):
         """
         Do the actual computation of cmodule_key in a static method
         to allow it to be reused in scalar.Composite.__eq__.
 
+        The values of the constants for which `is_hoisted_constant` is
+        true with `hoist_constants` are left out of the key.
+
         """
         if compile_args is None:
             compile_args = []
@@ -1403,7 +1428,14 @@ class CLinker(link.Linker):
             # It is important that a variable (i)
             # yield a 'position' that reflects its role in code_gen()
             if isinstance(i, graph.Constant):  # orphans
-                if id(i) not in constant_ids:
+                if id(i) in constant_ids:
+                    isig = constant_ids[id(i)]
+                elif is_hoisted_constant(i, hoist_constants):
+                    # Only the type of the constant, already in the
+                    # signature of the node, is part of the key.
+                    isig = ('hoisted', topological_pos, i_idx)
+                    constant_ids[id(i)] = isig
+                else:
                     isig = (i.signature(), topological_pos, i_idx)
                     # If the Theano constant provides a strong hash
                     # (no collision for transpose, 2, 1, 0, -1, -2,
@@ -1420,8 +1452,6 @@ class CLinker(link.Linker):
                         error_on_play[0] = True
                         return None
                     constant_ids[id(i)] = isig
-                else:
-                    isig = constant_ids[id(i)]
                 # print 'SIGNATURE', i.signature()
                 # return i.signature()
             elif i in fgraph_inputs_dict:  # inputs
@@ -1508,9 +1538,9 @@ class CLinker(link.Linker):
         c_compiler = self.c_compiler()
         libs = self.libraries()
         preargs = self.compile_args()
-        # We want to compute the code without the lock
         src_code = mod.code()
-        get_lock()
+        # `location` is private to this compilation, so no lock is needed.
+        # `ModuleCache.module_from_key` holds the lock of this module.
         try:
             _logger.debug("LOCATION %s", str(location))
             module = c_compiler.compile_str(
@@ -1524,8 +1554,6 @@ class CLinker(link.Linker):
         except Exception as e:
             e.args += (str(self.fgraph),)
             raise
-        finally:
-            release_lock()
         return module
 
     def get_dynamic_module(self):
@@ -1666,6 +1694,119 @@ class CLinker(link.Linker):
         return code.getvalue()
 
 
+def _prepare_compile_job(node, cache, storage_map, compute_map):
+    """
+    Return (key, module_hash, compiler, compile_str kwargs) for the module
+    `Op.make_c_thunk` would build for `node`, or None if that module is
+    already in `cache` or can't be generated.
+
+    """
+    op = node.op
+    if (not getattr(op, '_f16_ok', False) and
+            any(getattr(v.type, 'dtype', '') == 'float16'
+                for v in node.inputs + node.outputs)):
+        return None
+    try:
+        op.prepare_node(node, storage_map=storage_map,
+                        compute_map=compute_map, impl='c')
+        e = theano.gof.fg.FunctionGraph(node.inputs, node.outputs)
+        lnk = CLinker().accept(e, no_recycling=[])
+        key = lnk.cmodule_key()
+        if (key is None or key in cache.entry_from_key or
+                (key[0] and cache._load_from_index(key=key) is not None)):
+            return None
+        src_code = lnk.get_src_code()
+        module_hash = cmodule.get_module_hash(src_code, key)
+        if cache._load_from_index(module_hash=module_hash) is not None:
+            return None
+        kwargs = dict(module_name=lnk.get_dynamic_module().code_hash,
+                      src_code=src_code,
+                      include_dirs=lnk.header_dirs(),
+                      lib_dirs=lnk.lib_dirs(),
+                      libs=lnk.libraries(),
+                      preargs=lnk.compile_args(),
+                      py_module=False)
+        return key, module_hash, lnk.c_compiler(), kwargs
+    except Exception as e:
+        # Ops without C code, or with C code that fails to generate.
+        # make_thunk will deal with them as usual.
+        _logger.debug("Not compiling %s ahead of time: %s", node, e)
+        return None
+
+
+def compile_nodes(nodes, n_workers, storage_map=None, compute_map=None):
+    """
+    Compile concurrently the C modules of `nodes` missing from the cache.
+
+    Each node gets the module that `Op.make_c_thunk` would build for it,
+    so the thunks made afterwards find their module in the cache. Nodes
+    whose C code can't be generated or compiled are skipped here; the
+    error, if any, is reported when their thunk is made.
+
+    Each compilation is a compiler subprocess, so a pool of `n_workers`
+    threads is enough to keep that many compilers busy without forking
+    the interpreter. Only the registration of the new modules in the
+    module cache is serialized, under the compile lock.
+
+    Returns
+    -------
+    list
+        The newly compiled modules.
+
+    """
+    cache = get_module_cache()
+    jobs = []
+    seen = set()
+    for node in nodes:
+        job = _prepare_compile_job(node, cache, storage_map, compute_map)
+        # Many nodes of a graph share the same module.
+        if job is not None and job[1] not in seen:
+            seen.add(job[1])
+            jobs.append(job)
+    if not jobs:
+        return []
+
+    def compile_one(job):
+        key, module_hash, c_compiler, kwargs = job
+        location = cmodule.dlimport_workdir(cache.dirname)
+        try:
+            c_compiler.compile_str(location=location, **kwargs)
+        except Exception as e:
+            _logger.debug("Compilation of %s failed: %s", location, e)
+            cmodule._rmtree(location, ignore_if_missing=True,
+                            msg='exception during compilation')
+            return None
+        return os.path.join(location, '%s.%s' % (
+            kwargs['module_name'], cmodule.get_lib_extension()))
+
+    from multiprocessing.pool import ThreadPool
+    pool = ThreadPool(min(n_workers, len(jobs)))
+    try:
+        lib_filenames = pool.map(compile_one, jobs, chunksize=1)
+    finally:
+        pool.close()
+        pool.join()
+
+    compiled = []
+    # Pick up the modules other processes compiled in the meantime.
+    cache.refresh(cleanup=False)
+    with compilelock.lock_ctx():
+        for (key, module_hash, _, _), lib_filename in izip(jobs,
+                                                           lib_filenames):
+            if lib_filename is None:
+                continue
+            if (key in cache.entry_from_key or
+                    cache._load_from_index(module_hash=module_hash)
+                    is not None):
+                cmodule._rmtree(os.path.dirname(lib_filename),
+                                ignore_if_missing=True,
+                                msg='module compiled by another process')
+                continue
+            compiled.append(cache.add_compiled_module(key, module_hash,
+                                                      lib_filename))
+    return compiled
+
+
 class _CThunk(object):
     """
     A thunk with a C implementation.
@@ -12,19 +12,23 @@ import os
 import re
 import shutil
 import stat
+import struct
 import subprocess
 import sys
 import tempfile
 import time
 import platform
+import distutils.spawn
 import distutils.sysconfig
 import warnings
 
+import numpy as np
 import numpy.distutils
 
 import theano
 from theano.compat import PY3, decode, decode_iter
-from six import b, BytesIO, StringIO, string_types, iteritems
+from six import (b, BytesIO, StringIO, string_types, integer_types,
+                 iteritems, itervalues)
 from six.moves import xrange
 from theano.gof.utils import flatten
 from theano import config
@@ -573,6 +577,216 @@ class KeyData(object):
                     pass
 
 
+def _key_description(obj, out):
+    if isinstance(obj, (tuple, list)):
+        out.append('(')
+        for o in obj:
+            _key_description(o, out)
+        out.append(')')
+    elif obj is None or isinstance(obj, (string_types, bytes, bool,
+                                         integer_types, float)):
+        out.append(repr(obj))
+    else:
+        cls = type(obj)
+        out.append('%s.%s{%s}' % (cls.__module__, cls.__name__, obj))
+
+
+def key_digest(key):
+    """
+    Return a digest of `key` that is stable across processes, or None.
+
+    Pickles and Python hashes of equal keys differ from one process to the
+    next, so the digest is computed from the structure of the key and the
+    string representation of its Ops and Types. Different keys may thus
+    have the same digest: it is only used to find candidate modules, whose
+    KeyData is always checked afterwards.
+
+    """
+    out = []
+    try:
+        _key_description(key, out)
+    except Exception:
+        return None
+    return hash_from_code('\n'.join(out))
+
+
+class ModuleIndex(object):
+    """
+    Append-only index of the versioned modules of a ModuleCache.
+
+    The index is a single file, `module_index`, in the cache directory.
+    It is a sequence of records, each made of its length (a 4 bytes
+    little endian integer) followed by a pickled tuple:
+    - ``('fsck', time)``: the first record, written when the index is
+      rebuilt from a full scan of the cache directory.
+    - ``('add', module_hash, entry, key_pkl, digests)``: a module and
+      the digests (see `key_digest`) of some of its keys. `entry` and
+      `key_pkl` are relative to the cache directory.
+
+    Records are appended under the compile lock. Readers do not take the
+    lock: they only read what was added since their last read, and ignore
+    a record that is not completely written yet. The index is rebuilt
+    (written to a temporary file, then renamed) by `ModuleCache.refresh`
+    after each full scan.
+
+    Parameters
+    ----------
+    dirname
+        The cache directory.
+
+    """
+
+    filename = 'module_index'
+    _header = struct.Struct('<I')
+
+    def __init__(self, dirname):
+        self.dirname = dirname
+        self.path = os.path.join(dirname, self.filename)
+        self.reset()
+
+    def reset(self):
+        self.hashes_of_digest = {}
+        self.entries = {}
+        self.fsck_time = None
+        self._offset = 0
+        self._inode = None
+
+    def exists(self):
+        return os.path.exists(self.path)
+
+    def _add(self, module_hash, entry, key_pkl, digests):
+        self.entries[module_hash] = (os.path.join(self.dirname, entry),
+                                     os.path.join(self.dirname, key_pkl))
+        for digest in digests:
+            hashes = self.hashes_of_digest.setdefault(digest, [])
+            if module_hash not in hashes:
+                hashes.append(module_hash)
+
+    def update(self):
+        """
+        Read the records added since the last call.
+
+        Returns
+        -------
+        bool
+            False if the index is missing or corrupted, in which case a
+            full scan of the cache directory is needed.
+
+        """
+        try:
+            f = open(self.path, 'rb')
+        except IOError:
+            self.reset()
+            return False
+        with f:
+            inode = os.fstat(f.fileno()).st_ino
+            if inode != self._inode:
+                # The index was rebuilt by another process.
+                self.reset()
+                self._inode = inode
+            f.seek(self._offset)
+            data = f.read()
+        pos = 0
+        size = self._header.size
+        try:
+            while pos + size <= len(data):
+                length, = self._header.unpack_from(data, pos)
+                if pos + size + length > len(data):
+                    # Partially written record.
+                    break
+                record = pickle.loads(data[pos + size:pos + size + length])
+                if record[0] == 'add':
+                    self._add(*record[1:])
+                elif record[0] == 'fsck':
+                    self.fsck_time = record[1]
+                else:
+                    raise ValueError('unknown record %s' % (record[0],))
+                pos += size + length
+        except Exception as e:
+            _logger.warning('Corrupted module index %s (%s), the cache '
+                            'directory will be scanned.', self.path, e)
+            self.reset()
+            return False
+        self._offset += pos
+        return self.fsck_time is not None
+
+    def _record(self, module_hash, entry, key_pkl, keys):
+        digests = [d for d in map(key_digest, keys) if d is not None]
+        return ('add', module_hash,
+                os.path.relpath(entry, self.dirname),
+                os.path.relpath(key_pkl, self.dirname), digests)
+
+    @classmethod
+    def _dumps(cls, record):
+        data = pickle.dumps(record, 2)
+        return cls._header.pack(len(data)) + data
+
+    def append(self, module_hash, entry, key_pkl, keys):
+        """
+        Record that `keys` are associated to the module `entry`.
+
+        This function expects the compile lock to be held. Nothing is done
+        if the index does not exist: it will be created by the next full
+        scan. Nothing is done either if the index already associates the
+        digests of `keys` to the module.
+
+        """
+        if not self.exists():
+            return
+        self.update()
+        record = self._record(module_hash, entry, key_pkl, keys)
+        if (module_hash in self.entries and
+                all(module_hash in self.hashes_of_digest.get(d, ())
+                    for d in record[4])):
+            return
+        data = self._dumps(record)
+        try:
+            with open(self.path, 'ab') as f:
+                f.write(data)
+        except IOError as e:
+            _logger.warning('Could not update the module index: %s', e)
+
+    def rebuild(self, key_datas):
+        """
+        Replace the index with one containing `key_datas`.
+
+        The modules of the current index that are still on disk are kept,
+        since the caller may not have been able to unpickle their KeyData.
+        This function expects the compile lock to be held.
+
+        """
+        self.update()
+        records = [self._dumps(('fsck', time.time()))]
+        done = set()
+        for key_data in key_datas:
+            done.add(key_data.module_hash)
+            records.append(self._dumps(self._record(
+                key_data.module_hash, key_data.get_entry(),
+                key_data.key_pkl, key_data.keys)))
+        digests = {}
+        for digest, hashes in iteritems(self.hashes_of_digest):
+            for module_hash in hashes:
+                digests.setdefault(module_hash, []).append(digest)
+        for module_hash, (entry, key_pkl) in iteritems(self.entries):
+            if module_hash not in done and os.path.exists(key_pkl):
+                records.append(self._dumps(
+                    ('add', module_hash, os.path.relpath(entry, self.dirname),
+                     os.path.relpath(key_pkl, self.dirname),
+                     digests.get(module_hash, []))))
+        try:
+            fd, tmp = tempfile.mkstemp(dir=self.dirname, prefix='index')
+            with os.fdopen(fd, 'wb') as f:
+                f.write(b('').join(records))
+            if os.name == 'nt' and os.path.exists(self.path):
+                os.remove(self.path)
+            os.rename(tmp, self.path)
+        except (IOError, OSError) as e:
+            _logger.warning('Could not write the module index: %s', e)
+            return
+        self.reset()
+        self.update()
+
+
 class ModuleCache(object):
     """
     Interface to the cache of dynamically compiled modules on disk.
@@ -623,6 +837,12 @@ class ModuleCache(object):
     These three elements uniquely identify a module, and are summarized
     in a single "module hash".
 
+    Unless ``config.cmodule.use_index`` is False, the versioned modules are
+    also listed in a `ModuleIndex`, so a new process finds the modules it
+    needs without walking the whole cache directory. The full walk of
+    ``refresh`` is only done when the index is missing, and then
+    periodically (see ``fsck_interval``) to repair the cache.
+
     Parameters
     ----------
     check_for_broken_eq
@@ -683,6 +903,7 @@ class ModuleCache(object):
         self.check_for_broken_eq = check_for_broken_eq
         self.loaded_key_pkl = set()
         self.time_spent_in_check_key = 0
+        self.index = ModuleIndex(dirname)
 
         if do_refresh:
             self.refresh()
@@ -709,8 +930,15 @@ class ModuleCache(object):
             self.stats[0] += 1
         return self.module_from_name[name]
 
+    fsck_interval = 60 * 60 * 24  # 1 day
+    """
+    The time (in seconds) after which the cache directory is walked again
+    at exit to remove old and broken modules and rebuild the index.
+
+    """
+
     def refresh(self, age_thresh_use=None, delete_if_problem=False,
-                cleanup=True):
+                cleanup=True, full_scan=None):
         """
         Update cache data by walking the cache directory structure.
 
@@ -718,6 +946,10 @@ class ModuleCache(object):
         Remove entries which have been removed from the filesystem.
         Also, remove malformed cache directories.
 
+        When the module index is used, this only reads the new records of
+        the index, unless `full_scan` is True. The key.pkl files are then
+        loaded on demand by the lookups.
+
         Parameters
         ----------
         age_thresh_use
@@ -730,13 +962,24 @@ class ModuleCache(object):
             - Duplicated modules, regardless of their age.
         cleanup : bool
             Do a cleanup of the cache removing expired and broken modules.
+        full_scan : bool
+            Walk the cache directory even if the module index is up to
+            date. Defaults to True only when the index is disabled,
+            missing or corrupted. The index is rebuilt after a full scan.
 
         Returns
         -------
         list
-            A list of modules of age higher than age_thresh_use.
+            A list of modules of age higher than age_thresh_use. It is
+            empty if the directory was not walked.
 
         """
+        if full_scan is None:
+            full_scan = not (config.cmodule.use_index and self.index.update())
+        if not full_scan:
+            # Modules may have been deleted by another process.
+            self._remove_gone_entries()
+            return []
         if age_thresh_use is None:
             age_thresh_use = self.age_thresh_use
         start_time = time.time()
@@ -765,7 +1008,7 @@ class ModuleCache(object):
         files, root = None, None  # To make sure the "del" below works
         for subdirs_elem in subdirs:
             # Never clean/remove lock_dir
-            if subdirs_elem == 'lock_dir':
+            if subdirs_elem in ('lock_dir', 'module_locks'):
                 continue
             root = os.path.join(self.dirname, subdirs_elem)
             # Don't delete the gpuarray kernel cache
@@ -778,8 +1021,12 @@ class ModuleCache(object):
                 continue
             files = os.listdir(root)
             if not files:
-                rmtree_empty(root, ignore_nocleanup=True,
-                             msg="empty dir")
+                # Another process may have just created it to compile a
+                # module in it, without holding the global lock.
+                if (time_now - os.stat(root)[stat.ST_MTIME] >
+                        config.compile.timeout):
+                    rmtree_empty(root, ignore_nocleanup=True,
+                                 msg="empty dir")
                 continue
             if 'delete.me' in files:
                 rmtree(root, ignore_nocleanup=True,
@@ -910,35 +1157,7 @@ class ModuleCache(object):
                                               age, entry)
                         continue
 
-                    # Remember the map from a module's hash to the KeyData
-                    # object associated with it.
-                    self.module_hash_to_key_data[mod_hash] = key_data
-
-                    for key in key_data.keys:
-                        if key not in self.entry_from_key:
-                            self.entry_from_key[key] = entry
-                            # Assert that we have not already got this
-                            # entry somehow.
-                            assert entry not in self.module_from_name
-                            # Store safe part of versioned keys.
-                            if key[0]:
-                                self.similar_keys.setdefault(
-                                    get_safe_part(key),
-                                    []).append(key)
-                        else:
-                            dir1 = os.path.dirname(self.entry_from_key[key])
-                            dir2 = os.path.dirname(entry)
-                            _logger.warning(
-                                "The same cache key is associated to "
-                                "different modules (%s and %s). This "
-                                "is not supposed to happen! You may "
-                                "need to manually delete your cache "
-                                "directory to fix this.",
-                                dir1, dir2)
-                    # Clean up the name space to prevent bug.
-                    if key_data.keys:
-                        del key
-                    self.loaded_key_pkl.add(key_pkl)
+                    self._register_key_data(key_data, entry, key_pkl)
                 else:
                     too_old_to_use.append(entry)
 
@@ -949,7 +1168,32 @@ class ModuleCache(object):
         # Clean up the name space to prevent bug.
         del root, files, subdirs
 
-        # Remove entries that are not in the filesystem.
+        self._remove_gone_entries()
+
+        if to_delete or to_delete_empty or config.cmodule.use_index:
+            with compilelock.lock_ctx():
+                for a, kw in to_delete:
+                    _rmtree(*a, **kw)
+                for a, kw in to_delete_empty:
+                    files = os.listdir(a[0])
+                    if not files:
+                        _rmtree(*a, **kw)
+                if config.cmodule.use_index and os.path.isdir(self.dirname):
+                    self.index.rebuild(
+                        key_data for key_data in
+                        itervalues(self.module_hash_to_key_data)
+                        if key_data.keys and list(key_data.keys)[0][0])
+
+        _logger.debug('Time needed to refresh cache: %s',
+                      (time.time() - start_time))
+
+        return too_old_to_use
+
+    def _remove_gone_entries(self):
+        """
+        Forget the modules that have been removed from the filesystem.
+
+        """
         items_copy = list(self.module_hash_to_key_data.items())
         for module_hash, key_data in items_copy:
             entry = key_data.get_entry()
@@ -991,20 +1235,89 @@ class ModuleCache(object):
                                         "file system.",
                                         pkl_file_to_remove)
                     self.loaded_key_pkl.remove(pkl_file_to_remove)
+                    self.index.entries.pop(module_hash, None)
 
-        if to_delete or to_delete_empty:
-            with compilelock.lock_ctx():
-                for a, kw in to_delete:
-                    _rmtree(*a, **kw)
-                for a, kw in to_delete_empty:
-                    files = os.listdir(a[0])
-                    if not files:
-                        _rmtree(*a, **kw)
+    def _register_key_data(self, key_data, entry, key_pkl):
+        """
+        Make the keys of a KeyData loaded from `key_pkl` known to this cache.
 
-        _logger.debug('Time needed to refresh cache: %s',
-                      (time.time() - start_time))
+        """
+        # Remember the map from a module's hash to the KeyData
+        # object associated with it.
+        self.module_hash_to_key_data[key_data.module_hash] = key_data
+
+        for key in key_data.keys:
+            if key not in self.entry_from_key:
+                self.entry_from_key[key] = entry
+                # Assert that we have not already got this
+                # entry somehow.
+                assert entry not in self.module_from_name
+                # Store safe part of versioned keys.
+                if key[0]:
+                    self.similar_keys.setdefault(
+                        get_safe_part(key),
+                        []).append(key)
+            else:
+                dir1 = os.path.dirname(self.entry_from_key[key])
+                dir2 = os.path.dirname(entry)
+                _logger.warning(
+                    "The same cache key is associated to "
+                    "different modules (%s and %s). This "
+                    "is not supposed to happen! You may "
+                    "need to manually delete your cache "
+                    "directory to fix this.",
+                    dir1, dir2)
+        self.loaded_key_pkl.add(key_pkl)
+
+    def _load_from_index(self, key=None, module_hash=None):
+        """
+        Load the KeyData of a versioned module found through the index.
 
-        return too_old_to_use
+        The module is looked up by `module_hash` if given, otherwise by the
+        digest of `key`. Return the KeyData, or None if the index does not
+        know the module, or if the module is too old or not usable.
+
+        """
+        if module_hash is not None:
+            if module_hash in self.module_hash_to_key_data:
+                return self.module_hash_to_key_data[module_hash]
+            candidates = [module_hash]
+        else:
+            candidates = None
+        if not config.cmodule.use_index or not self.index.update():
+            return None
+        if candidates is None:
+            candidates = self.index.hashes_of_digest.get(key_digest(key), [])
+        for candidate in candidates:
+            if (candidate in self.module_hash_to_key_data or
+                    candidate not in self.index.entries):
+                continue
+            entry, key_pkl = self.index.entries[candidate]
+            if key_pkl in self.loaded_key_pkl:
+                continue
+            try:
+                if (time.time() - last_access_time(entry) >=
+                        self.age_thresh_use):
+                    continue
+                with open(key_pkl, 'rb') as f:
+                    key_data = pickle.load(f)
+            except Exception as e:
+                # Removed by another process, or the key refers to Ops
+                # that can't be imported yet. The full scan will deal
+                # with it.
+                _logger.debug('Could not load %s from the index: %s',
+                              key_pkl, e)
+                continue
+            if (not isinstance(key_data, KeyData) or
+                    key_data.module_hash != candidate or
+                    not all(k[0] for k in key_data.keys)):
+                continue
+            key_data.entry = entry
+            key_data.key_pkl = key_pkl
+            self._register_key_data(key_data, entry, key_pkl)
+            if key is None or key in key_data.keys:
+                return key_data
+        return None
 
     def _get_from_key(self, key, key_data=None):
         """
@@ -1024,6 +1337,8 @@ class ModuleCache(object):
                     "Invalid key. key must have form (version, rest)", key)
             if key in self.entry_from_key:
                 name = self.entry_from_key[key]
+            elif _version and self._load_from_index(key=key) is not None:
+                name = self.entry_from_key[key]
         else:
             assert key_data is not None
             name = key_data.get_entry()
@@ -1032,9 +1347,18 @@ class ModuleCache(object):
         return self._get_module(name)
 
     def _get_from_hash(self, module_hash, key, keep_lock=False):
-        if module_hash in self.module_hash_to_key_data:
-            key_data = self.module_hash_to_key_data[module_hash]
+        key_data = self._load_from_index(module_hash=module_hash)
+        if key_data is not None:
             module = self._get_from_key(None, key_data)
+            if key in key_data.keys:
+                # The key was already in the KeyData loaded from the
+                # index, but its digest was not: record it for the next
+                # processes.
+                if config.cmodule.use_index:
+                    with compilelock.lock_ctx(keep_lock=keep_lock):
+                        self.index.append(module_hash, key_data.get_entry(),
+                                          key_data.key_pkl, [key])
+                return module
             with compilelock.lock_ctx(keep_lock=keep_lock):
                 try:
                     key_data.add_key(key, save_pkl=bool(key[0]))
@@ -1042,6 +1366,9 @@ class ModuleCache(object):
                 except pickle.PicklingError:
                     key_data.remove_key(key)
                     key_broken = True
+                if key[0] and not key_broken and config.cmodule.use_index:
+                    self.index.append(module_hash, key_data.get_entry(),
+                                      key_data.key_pkl, [key])
                 # We need the lock while we check in case of parallel
                 # process that could be changing the file at the same
                 # time.
@@ -1100,6 +1427,9 @@ class ModuleCache(object):
                 key_data.save_pkl()
             if not key_broken and self.check_for_broken_eq:
                 self.check_key(key, key_pkl)
+            if config.cmodule.use_index:
+                self.index.append(module_hash, name, key_pkl,
+                                  key_data.keys)
             self.loaded_key_pkl.add(key_pkl)
         elif config.cmodule.warn_no_version:
             key_flat = flatten(key)
@@ -1141,7 +1471,8 @@ class ModuleCache(object):
         if module is not None:
             return module
 
-        with compilelock.lock_ctx(keep_lock=keep_lock):
+        # Only processes compiling this very module wait on each other.
+        with compilelock.module_lock_ctx(module_hash):
             # 1) Maybe somebody else compiled it for us while we
             #    where waiting for the lock. Try to load it again.
             # 2) If other repo that import Theano have Theano ops defined,
@@ -1162,7 +1493,8 @@ class ModuleCache(object):
             if module is not None:
                 return module
 
-            module = self._get_from_hash(module_hash, key)
+            module = self._get_from_hash(module_hash, key,
+                                         keep_lock=keep_lock)
             if module is not None:
                 return module
 
@@ -1193,12 +1525,46 @@ class ModuleCache(object):
             # compilation.
             assert hash(key) == hash_key
 
-            key_data = self._add_to_cache(module, key, module_hash)
-            self.module_hash_to_key_data[module_hash] = key_data
+            # Only the update of the index needs the global lock.
+            with compilelock.lock_ctx(keep_lock=keep_lock):
+                key_data = self._add_to_cache(module, key, module_hash)
+                self.module_hash_to_key_data[module_hash] = key_data
 
         self.stats[2] += 1
         return module
 
+    def add_compiled_module(self, key, module_hash, lib_filename):
+        """
+        Import a module compiled outside of `module_from_key` and register
+        it in the cache under `key`.
+
+        This function expects the compile lock to be held.
+
+        Parameters
+        ----------
+        key
+            The key of the module, as returned by ``CLinker.cmodule_key_``.
+        module_hash
+            The hash returned by `get_module_hash` for that key and the
+            compiled source code.
+        lib_filename
+            The shared library built by ``compile_str(py_module=False)``
+            in a directory returned by `dlimport_workdir`.
+
+        """
+        location = os.path.dirname(lib_filename)
+        open(os.path.join(location, "__init__.py"), 'w').close()
+        module = dlimport(lib_filename)
+        name = module.__file__
+        assert name.startswith(location)
+        assert name not in self.module_from_name
+        self.module_from_name[name] = module
+
+        key_data = self._add_to_cache(module, key, module_hash)
+        self.module_hash_to_key_data[module_hash] = key_data
+        self.stats[2] += 1
+        return module
+
     def check_key(self, key, key_pkl):
         """
         Perform checks to detect broken __eq__ / __hash__ implementations.
@@ -1307,7 +1673,8 @@ class ModuleCache(object):
             age_thresh_use=age_thresh_use,
             delete_if_problem=delete_if_problem,
             # The clean up is done at init, no need to trigger it again
-            cleanup=False)
+            cleanup=False,
+            full_scan=True)
         if not too_old_to_use:
             return
         with compilelock.lock_ctx():
@@ -1503,7 +1870,11 @@ class ModuleCache(object):
 
         # Note: for clear_old(), as this happen unfrequently, we only
         # take the lock when it happen.
-        self.clear_old()
+        # Note: with the index, the cache directory is only walked again
+        # once every fsck_interval.
+        if (not config.cmodule.use_index or not self.index.update() or
+                time.time() - self.index.fsck_time > self.fsck_interval):
+            self.clear_old()
         self.clear_unversioned()
         _logger.debug('Time spent checking keys: %s',
                       self.time_spent_in_check_key)
@@ -1742,6 +2113,143 @@ def gcc_llvm():
 gcc_llvm.is_llvm = None
 
 
+class ProbeCache(object):
+    """
+    Results of the compiler probes, kept across processes.
+
+    Finding the BLAS flags, the equivalent of ``-march=native`` or whether
+    the compiler supports an option compiles and runs small test programs.
+    Their results are stored in the file `probe_cache` of the cache
+    directory, so that the next processes do not repeat them. A result is
+    keyed by the name and the arguments of the probe, and by what it
+    depends on: the path and version of the compiler, the host, the Python
+    executable, the NumPy version, ``config.gcc.cxxflags`` and the
+    environment variables that change where the compiler and the linker
+    look for files.
+
+    The file is a pickled dict key -> (name, result). It is written to a
+    temporary file, then renamed. Concurrent writers may lose each other's
+    results, which are then only computed again.
+
+    Parameters
+    ----------
+    dirname
+        The cache directory.
+
+    """
+
+    filename = 'probe_cache'
+    env_vars = ('CPATH', 'C_INCLUDE_PATH', 'CPLUS_INCLUDE_PATH',
+                'LIBRARY_PATH', 'LD_LIBRARY_PATH', 'DYLD_LIBRARY_PATH',
+                'DYLD_FALLBACK_LIBRARY_PATH', 'MKL_THREADING_LAYER')
+
+    def __init__(self, dirname):
+        self.dirname = dirname
+        self.path = os.path.join(dirname, self.filename)
+        self._results = None
+
+    def _load(self):
+        try:
+            with open(self.path, 'rb') as f:
+                results = pickle.load(f)
+            if not isinstance(results, dict):
+                raise ValueError('not a dict')
+        except IOError:
+            results = {}
+        except Exception as e:
+            _logger.warning('Corrupted probe cache %s (%s), the probes '
+                            'will be run again.', self.path, e)
+            results = {}
+        self._results = results
+        return results
+
+    @property
+    def results(self):
+        if self._results is None:
+            self._load()
+        return self._results
+
+    def context(self):
+        """
+        Return what the result of a probe depends on, besides its arguments.
+
+        """
+        cxx = theano.config.cxx
+        return (distutils.spawn.find_executable(cxx) or cxx,
+                gcc_version_str, platform.node(), sys.executable,
+                np.__version__, theano.config.gcc.cxxflags,
+                tuple(os.environ.get(v, '') for v in self.env_vars))
+
+    def key(self, name, args):
+        return hash_from_code(repr((name, args, self.context())))
+
+    def get(self, name, args=()):
+        """
+        Return (True, result) if the probe `name` was already run with
+        `args` in this context, (False, None) otherwise.
+
+        """
+        key = self.key(name, args)
+        if key not in self.results:
+            # Another process may have run it since we loaded the file.
+            self._load()
+        if key in self.results:
+            return True, self.results[key][1]
+        return False, None
+
+    def set(self, name, args, result):
+        results = self._load()
+        results[self.key(name, args)] = (name, result)
+        self._write(results)
+
+    def clear(self):
+        self._results = {}
+        if os.path.exists(self.path):
+            os.remove(self.path)
+
+    def _write(self, results):
+        try:
+            fd, tmp = tempfile.mkstemp(dir=self.dirname, prefix='probe')
+            with os.fdopen(fd, 'wb') as f:
+                pickle.dump(results, f, 2)
+            if os.name == 'nt' and os.path.exists(self.path):
+                os.remove(self.path)
+            os.rename(tmp, self.path)
+        except (IOError, OSError) as e:
+            _logger.warning('Could not write the probe cache: %s', e)
+
+    def cached(self, name, args, compute):
+        """
+        Return the result of the probe `name` with `args`, calling
+        `compute()` and storing its result if it is not in the cache.
+
+        Exceptions raised by `compute` are not cached.
+
+        """
+        if not theano.config.cmodule.cache_probes:
+            return compute()
+        found, result = self.get(name, args)
+        if not found:
+            result = compute()
+            self.set(name, args, result)
+        return result
+
+
+def get_probe_cache():
+    """
+    Return the ProbeCache of the current compiledir.
+
+    """
+    dirname = theano.config.compiledir
+    if get_probe_cache.dirname != dirname:
+        get_probe_cache.cache = ProbeCache(dirname)
+        get_probe_cache.dirname = dirname
+    return get_probe_cache.cache
+
+get_probe_cache.cache = None
+get_probe_cache.dirname = None
+
+
 class Compiler(object):
     """
     Meta compiler that offer some generic function.
@@ -1767,6 +2275,9 @@ class Compiler(object):
 
         Compile arguments from the Compiler's compile_args() method are added
         if comp_args=True.
+
+        The results are kept in the probe cache (see `ProbeCache`), unless
+        the compiler could not be run.
         """
         if not compiler:
             return False
@@ -1776,48 +2287,19 @@ class Compiler(object):
             args = cls.compile_args()
         else:
             args = []
-        compilation_ok = True
-        run_ok = False
-        out, err = None, None
+        # Python3 compatibility: try to cast Py3 strings as Py2 strings
         try:
-            fd, path = tempfile.mkstemp(suffix='.c', prefix=tmp_prefix)
-            exe_path = path[:-2]
-            if os.name == 'nt':
-                path = "\"" + path + "\""
-                exe_path = "\"" + exe_path + "\""
-            try:
-                # Python3 compatibility: try to cast Py3 strings as Py2 strings
-                try:
-                    src_code = b(src_code)
-                except Exception:
-                    pass
-                os.write(fd, src_code)
-                os.close(fd)
-                fd = None
-                out, err, p_ret = output_subprocess_Popen(
-                    [compiler] + args + [path, '-o', exe_path] + flags)
-                if p_ret != 0:
-                    compilation_ok = False
-                elif try_run:
-                    out, err, p_ret = output_subprocess_Popen([exe_path])
-                    run_ok = (p_ret == 0)
-            finally:
-                try:
-                    if fd is not None:
-                        os.close(fd)
-                finally:
-                    if os.path.exists(path):
-                        os.remove(path)
-                    if os.path.exists(exe_path):
-                        os.remove(exe_path)
-                    if os.path.exists(exe_path + ".exe"):
-                        os.remove(exe_path + ".exe")
+            src_code = b(src_code)
+        except Exception:
+            pass
+        try:
+            compilation_ok, run_ok, out, err = get_probe_cache().cached(
+                'try_compile',
+                (compiler, args, flags, src_code, try_run),
+                lambda: cls._compile_tmp(src_code, tmp_prefix, compiler,
+                                         args, flags, try_run))
         except OSError as e:
-            if err is None:
-                err = str(e)
-            else:
-                err = str(err) + "\n" + str(e)
-            compilation_ok = False
+            compilation_ok, run_ok, out, err = False, False, None, str(e)
 
         if not try_run and not output:
             return compilation_ok
@@ -1828,6 +2310,45 @@ class Compiler(object):
         else:
             return (compilation_ok, run_ok, out, err)
 
+    @staticmethod
+    def _compile_tmp(src_code, tmp_prefix, compiler, args, flags, try_run):
+        """
+        Compile (and run) a test program, without the probe cache.
+
+        Return (compile_status, run_status, out, err).
+
+        """
+        compilation_ok = True
+        run_ok = False
+        fd, path = tempfile.mkstemp(suffix='.c', prefix=tmp_prefix)
+        exe_path = path[:-2]
+        if os.name == 'nt':
+            path = "\"" + path + "\""
+            exe_path = "\"" + exe_path + "\""
+        try:
+            os.write(fd, src_code)
+            os.close(fd)
+            fd = None
+            out, err, p_ret = output_subprocess_Popen(
+                [compiler] + args + [path, '-o', exe_path] + flags)
+            if p_ret != 0:
+                compilation_ok = False
+            elif try_run:
+                out, err, p_ret = output_subprocess_Popen([exe_path])
+                run_ok = (p_ret == 0)
+        finally:
+            try:
+                if fd is not None:
+                    os.close(fd)
+            finally:
+                if os.path.exists(path):
+                    os.remove(path)
+                if os.path.exists(exe_path):
+                    os.remove(exe_path)
+                if os.path.exists(exe_path + ".exe"):
+                    os.remove(exe_path + ".exe")
+        return compilation_ok, run_ok, out, err
+
     @classmethod
     def _try_flags(cls, flag_list, preambule="", body="",
                    try_run=False, output=False, compiler=None,
@@ -1935,6 +2456,13 @@ class GCC_compiler(Compiler):
             )
             detect_march = False
 
+        if detect_march and config.cmodule.cache_probes:
+            # The detection runs the compiler a few times.
+            found, flags = get_probe_cache().get('march_flags')
+            if found:
+                GCC_compiler.march_flags = list(flags)
+                detect_march = False
+
         if detect_march:
             GCC_compiler.march_flags = []
 
@@ -2152,6 +2680,10 @@ class GCC_compiler(Compiler):
                 if not march_success:
                     GCC_compiler.march_flags = []
 
+            if config.cmodule.cache_probes:
+                get_probe_cache().set('march_flags', (),
+                                      GCC_compiler.march_flags)
+
         # Add the detected -march=native equivalent flags
         if march_flags and GCC_compiler.march_flags:
             cxxflags.extend(GCC_compiler.march_flags)
@@ -5,6 +5,7 @@ from __future__ import absolute_import, print_function, division
 import atexit
 import os
 import socket  # only used for gethostname()
+import threading
 import time
 import logging
 
@@ -24,6 +25,11 @@ if _logger.level == logging.NOTSET:
 
 hostname = socket.gethostname()
 
+# Total time (in seconds) spent in `lock`, and number of times `lock` had
+# to wait for another process. They are reported by ProfileStats.
+lock_wait_time = 0.
+lock_wait_count = 0
+
 
 def force_unlock():
     """
@@ -42,6 +48,73 @@ def lock_ctx(lock_dir=None, keep_lock=False, **kw):
         release_lock()
 
 
+def module_lock_dir(name):
+    """
+    Return the lock directory of the module identified by `name`.
+
+    """
+    return os.path.join(config.compiledir, 'module_locks', name)
+
+
+@contextmanager
+def module_lock_ctx(name, min_wait=1, max_wait=2, **kw):
+    """
+    Lock the compilation of one module only.
+
+    Processes compiling different modules do not wait on each other. The
+    global lock (`lock_ctx`) is still needed to update the cache index.
+    While the lock is held, it is refreshed every half
+    `config.compile.timeout` so that waiting processes do not override it
+    during a long compilation.
+
+    Parameters
+    ----------
+    name : str
+        Identifier of the module, typically its module hash.
+    min_wait, max_wait
+        Bounds of the random wait between two attempts to get the lock.
+        They are lower than for the global lock as only processes
+        compiling the very same module wait here.
+    kw
+        Forwarded to `lock`.
+
+    """
+    if not getattr(get_lock, 'lock_is_enabled', True):
+        yield
+        return
+    tmp_dir = module_lock_dir(name)
+    lock(tmp_dir, min_wait=min_wait, max_wait=max_wait, **kw)
+    done = threading.Event()
+    heartbeat = None
+    if config.compile.timeout:
+        heartbeat = threading.Thread(
+            target=_refresh_lock_until,
+            args=(os.path.join(tmp_dir, 'lock'), done,
+                  config.compile.timeout / 2.))
+        heartbeat.daemon = True
+        heartbeat.start()
+    try:
+        yield
+    finally:
+        done.set()
+        if heartbeat is not None:
+            heartbeat.join()
+        Unlocker(tmp_dir).unlock(force=False)
+
+
+def _refresh_lock_until(lock_file, done, period):
+    while not done.wait(period):
+        try:
+            with open(lock_file, 'w') as lock_write:
+                lock_write.write('%s_%s_%s\n' % (
+                    os.getpid(),
+                    ''.join([str(random.randint(0, 9)) for i in range(10)]),
+                    hostname))
+        except Exception:
+            # The lock is released at the end of the context anyway.
+            pass
+
+
 # We define this name with an underscore so that python shutdown
 # deletes this before non-underscore names (like os).  We need to do
 # it this way to avoid errors on shutdown.
@@ -197,6 +270,8 @@ def lock(tmp_dir, timeout=notset, min_wait=None, max_wait=None, verbosity=1):
     assert os.path.isdir(base_lock)
 
     # Variable initialization.
+    global lock_wait_time, lock_wait_count
+    lock_start = time.time()
     lock_file = os.path.join(tmp_dir, 'lock')
     my_pid = os.getpid()
     no_display = (verbosity == 0)
@@ -238,7 +313,7 @@ def lock(tmp_dir, timeout=notset, min_wait=None, max_wait=None, verbosity=1):
                         msg = "process '%s'" % read_owner.split('_')[0]
                         _logger.warning("Overriding existing lock by dead %s "
                                         "(I am process '%s')", msg, my_pid)
-                    get_lock.unlocker.unlock(force=True)
+                    Unlocker(tmp_dir).unlock(force=True)
                     continue
                 if last_owner == read_owner:
                     if (timeout is not None and
@@ -251,7 +326,7 @@ def lock(tmp_dir, timeout=notset, min_wait=None, max_wait=None, verbosity=1):
                                 msg = "process '%s'" % read_owner.split('_')[0]
                             _logger.warning("Overriding existing lock by %s "
                                             "(I am process '%s')", msg, my_pid)
-                        get_lock.unlocker.unlock(force=True)
+                        Unlocker(tmp_dir).unlock(force=True)
                         continue
                 else:
                     last_owner = read_owner
@@ -297,6 +372,9 @@ def lock(tmp_dir, timeout=notset, min_wait=None, max_wait=None, verbosity=1):
                 continue
             else:
                 # We got the lock, hoorray!
+                lock_wait_time += time.time() - lock_start
+                if nb_wait > 0:
+                    lock_wait_count += 1
                 return
 
         except Exception as e:
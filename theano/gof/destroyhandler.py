@@ -289,6 +289,13 @@ class DestroyHandler(toolbox.Bookkeeper):  # noqa
     This implementation computes the data structures once at initialization
     and then incrementally updates them.
 
+    The cycles are also detected incrementally: a topological order of the
+    Apply nodes, including the orderings, is maintained as the graph
+    changes, and `validate` only checks the edges added since it last
+    succeeded (see `toolbox.TopoOrder`). Set `incremental` to False before
+    the handler is attached to check the whole graph with `_contains_cycle`
+    instead. The 'fast' algo does not use this order.
+
     It is a work in progress. The following data structures have been
     converted to use the incremental strategy:
         <none>
@@ -298,6 +305,7 @@ class DestroyHandler(toolbox.Bookkeeper):  # noqa
 
     """
     pickle_rm_attr = ["destroyers", "has_destroyers"]
+    incremental = True
 
     def __init__(self, do_imports_on_attach=True, algo=None):
         self.fgraph = None
@@ -380,6 +388,15 @@ class DestroyHandler(toolbox.Bookkeeper):  # noqa
         # clients: how many times does an apply use a given variable
         self.clients = OrderedDict()  # variable -> apply -> ninputs
         self.stale_droot = True
+        # The order is only complete if all the nodes are imported. It is
+        # not used by the 'fast' algo.
+        if (self.do_imports_on_attach and self.incremental and
+                self.algo != 'fast'):
+            self.topo_order = toolbox.TopoOrder()
+        else:
+            self.topo_order = None
+        # The edges added by on_change_input, checked by validate
+        self.new_edges = []
 
         self.debug_all_apps = set()
         if self.do_imports_on_attach:
@@ -449,6 +466,8 @@ class DestroyHandler(toolbox.Bookkeeper):  # noqa
         del self.view_o
         del self.clients
         del self.stale_droot
+        del self.topo_order
+        del self.new_edges
         assert self.fgraph.destroyer_handler is self
         delattr(self.fgraph, 'destroyers')
         delattr(self.fgraph, 'has_destroyers')
@@ -536,6 +555,10 @@ class DestroyHandler(toolbox.Bookkeeper):  # noqa
         for i, output in enumerate(app.outputs):
             self.clients.setdefault(output, OrderedDict())
 
+        if self.topo_order is not None:
+            self.topo_order.insert(app, [i.owner for i in app.inputs
+                                         if i.owner])
+
         self.stale_droot = True
 
     def on_prune(self, fgraph, app, reason):
@@ -573,6 +596,9 @@ class DestroyHandler(toolbox.Bookkeeper):  # noqa
             if not self.view_o[i]:
                 del self.view_o[i]
 
+        if self.topo_order is not None:
+            self.topo_order.remove(app)
+
         self.stale_droot = True
         if app in self.fail_validate:
             del self.fail_validate[app]
@@ -598,6 +624,9 @@ class DestroyHandler(toolbox.Bookkeeper):  # noqa
             self.clients.setdefault(new_r, OrderedDict()).setdefault(app, 0)
             self.clients[new_r][app] += 1
 
+            if new_r.owner is not None and self.topo_order is not None:
+                self.new_edges.append((new_r.owner, app))
+
             # UPDATE self.view_i, self.view_o
             for o_idx, i_idx_list in iteritems(getattr(app.op, 'view_map',
                                                        OrderedDict())):
@@ -653,7 +682,12 @@ class DestroyHandler(toolbox.Bookkeeper):  # noqa
                         raise app_err_pairs[app]
             else:
                 ords = self.orderings(fgraph, ordered=False)
-                if _contains_cycle(fgraph, ords):
+                if self.topo_order is None or not self.incremental:
+                    self.new_edges = []
+                    if _contains_cycle(fgraph, ords):
+                        raise InconsistencyError(
+                            "Dependency graph contains cycles")
+                elif not self.update_topo_order(ords):
                     raise InconsistencyError("Dependency graph contains cycles")
         else:
             # James's Conjecture:
@@ -666,7 +700,56 @@ class DestroyHandler(toolbox.Bookkeeper):  # noqa
             # doing this conjecture should speed up compilation most of
             # the time. The user should create such dependency except
             # if he mess too much with the internal.
-            pass
+            # The order is still updated, without checking the result.
+            if self.topo_order is not None and self.incremental:
+                self.update_topo_order({})
+        return True
+
+    def update_topo_order(self, ords):
+        """
+        Add the edges changed since the last call and the orderings `ords`
+        to the topological order of the nodes.
+
+        Return False if this makes a cycle. The edges left to check are then
+        checked at the next call, if they are still in the graph.
+
+        """
+        order = self.topo_order
+        # The nodes that must run after each node, because of the orderings
+        ords_clients = {}
+        for app, deps in iteritems(ords):
+            for d in deps:
+                ords_clients.setdefault(d, []).append(app)
+
+        def successors(node):
+            for o in node.outputs:
+                for c, _ in o.clients:
+                    yield c
+            for c in ords_clients.get(node, ()):
+                yield c
+
+        def predecessors(node):
+            for i in node.inputs:
+                if i.owner is not None:
+                    yield i.owner
+            for d in ords.get(node, ()):
+                yield d
+
+        new_edges = self.new_edges
+        self.new_edges = []
+        for idx, (x, y) in enumerate(new_edges):
+            # The change may have been reverted since.
+            if (x in order.pos and y in order.pos and
+                    any(i.owner is x for i in y.inputs) and
+                    not order.add_edge(x, y, successors, predecessors)):
+                self.new_edges = new_edges[idx:] + self.new_edges
+                return False
+        # The orderings are all checked, as they are computed again each
+        # time. This is fast when they agree with the order.
+        for y, deps in iteritems(ords):
+            for x in deps:
+                if not order.add_edge(x, y, successors, predecessors):
+                    return False
         return True
 
     def orderings(self, fgraph, ordered=True):
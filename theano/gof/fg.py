@@ -625,6 +625,9 @@ class FunctionGraph(utils.object2):
         this FunctionGraph as sole argument. It should return a dictionary of
         `{node: predecessors}` where predecessors is a list of nodes that
         should be computed before the key node.
+
+        If an `IncrementalToposort` feature is attached, the order it
+        maintains is returned instead of sorting the whole graph.
         """
         if len(self.apply_nodes) < 2:
             # optimization
@@ -636,6 +639,9 @@ class FunctionGraph(utils.object2):
 
         ords = self.orderings()
 
+        if hasattr(self, 'incremental_toposort'):
+            return self.incremental_toposort.toposort(ords)
+
         order = graph.io_toposort(fg.inputs, fg.outputs, ords)
 
         return order
@@ -778,6 +784,9 @@ class FunctionGraph(utils.object2):
 
         if attach_feature:
             for feature in self._features:
+                clone = getattr(feature, 'clone', None)
+                if clone is not None:
+                    feature = clone()
                 e.attach_feature(feature)
         return e, equiv
 
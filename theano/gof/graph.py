@@ -9,6 +9,7 @@ from copy import copy
 from itertools import count
 
 import warnings
+import weakref
 
 import theano
 from theano import config
@@ -627,6 +628,52 @@ class Constant(Variable):
     # index is not defined, because the `owner` attribute must necessarily be None
 
 
+# The interned Apply nodes, see `intern_apply`.
+_interned_applies = weakref.WeakValueDictionary()
+
+
+def intern_apply(node):
+    """
+    Return the interned Apply node computing the same thing as `node`.
+
+    This is the node already interned with the same op and inputs if there
+    is one, else `node` itself, which gets interned. Constant inputs are
+    compared by their signature and the other inputs by identity. The table
+    only holds weak references, so it does not keep the graphs alive.
+
+    Nodes destroying their inputs, nodes whose op or constant inputs are not
+    hashable, and nodes already in a FunctionGraph are never returned. The
+    nodes built on the variables of a FunctionGraph, or while it is being
+    optimized, are not interned either: they must not be replaced by nodes
+    of the graph of the user.
+
+    """
+    if (not intern_apply.enable or
+            getattr(node.op, 'destroy_map', None) or
+            any(hasattr(i, 'fgraph') for i in node.inputs)):
+        return node
+    key = (node.op, tuple(i.merge_signature() if isinstance(i, Constant)
+                          else id(i) for i in node.inputs))
+    try:
+        other = _interned_applies.get(key)
+    except TypeError:
+        return node
+    # The inputs of a node can be changed in place by a FunctionGraph,
+    # so check that the interned node still matches its key.
+    if (other is not None and not hasattr(other, 'fgraph') and
+            len(other.inputs) == len(node.inputs) and
+            all(a is b or (isinstance(a, Constant) and a.equals(b))
+                for a, b in zip(other.inputs, node.inputs)) and
+            [o.type for o in other.outputs] ==
+            [o.type for o in node.outputs]):
+        return other
+    _interned_applies[key] = node
+    return node
+
+
+intern_apply.enable = True
+
+
 def stack_search(start, expand, mode='bfs', build_inv=False):
     """
     Search through a graph, either breadth- or depth-first.
@@ -683,6 +683,9 @@ def streamline(fgraph, thunks, order, post_thunk_old_storage=None,
             for thunk in thunks:
                 thunk()
         f = streamline_fast_f
+    # Function.__call__ edits this list to keep the output buffers of the
+    # caller.
+    f.pre_call_clear = no_recycling
     return f
 
 
@@ -613,8 +613,13 @@ class PureOp(object):
         """
         return_list = kwargs.pop('return_list', False)
         node = self.make_node(*inputs, **kwargs)
+        new_node = True
+        if config.intern_apply:
+            interned = graph.intern_apply(node)
+            new_node = interned is node
+            node = interned
 
-        if config.compute_test_value != 'off':
+        if new_node and config.compute_test_value != 'off':
             run_perform = True
 
             # build test input-values
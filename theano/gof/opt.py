@@ -22,6 +22,7 @@ import theano
 from theano import config
 from theano.compat import izip
 from six import string_types, iteritems, itervalues, integer_types
+from six.moves import StringIO
 from six.moves import reduce
 from theano.gof import graph, op, utils, unify, toolbox
 from theano.gof.fg import InconsistencyError
@@ -33,10 +34,40 @@ _logger = logging.getLogger('theano.gof.opt')
 _optimizer_idx = [0]
 
 
+def _profile_name(opt):
+    """
+    Return the name of `opt` used in the dicts of `profile_to_dict`.
+
+    """
+    return str(getattr(opt, 'name', None) or
+               getattr(opt, '__name__', None) or opt)
+
+
+def _str_keys(d):
+    """
+    Return a copy of the dict of numbers `d` with str keys, for JSON.
+
+    """
+    r = {}
+    for k, v in iteritems(d):
+        k = k.__name__ if isinstance(k, type) else _profile_name(k)
+        r[k] = r.get(k, 0) + v
+    return r
+
+
 def _list_of_nodes(fgraph):
     return list(graph.io_toposort(fgraph.inputs, fgraph.outputs))
 
 
+def _io_toposort(fgraph, start_from):
+    # Reuse the order maintained by IncrementalToposort when the whole
+    # graph is needed.
+    if (start_from is fgraph.outputs and
+            hasattr(fgraph, 'incremental_toposort')):
+        return fgraph.incremental_toposort.data_toposort()
+    return graph.io_toposort(fgraph.inputs, start_from)
+
+
 class Optimizer(object):
     """
 
@@ -84,10 +115,13 @@ class Optimizer(object):
         self.add_requirements(fgraph)
         try:
             orig = theano.tensor.basic.constant.enable
+            orig_intern = graph.intern_apply.enable
             theano.tensor.basic.constant.enable = False
+            graph.intern_apply.enable = False
             ret = self.apply(fgraph, *args, **kwargs)
         finally:
             theano.tensor.basic.constant.enable = orig
+            graph.intern_apply.enable = orig_intern
         return ret
 
     def __call__(self, fgraph):
@@ -122,6 +156,26 @@ class Optimizer(object):
                 "The function print_profile must be overrided if the"
                 " optimizer return profiling information.")
 
+    def profile_to_dict(self, prof):
+        """
+        Return the profile `prof` returned by `apply` as a dict of numbers,
+        strings, lists and dicts, that can be saved in JSON.
+
+        Optimizers that return a profile should override it. By default,
+        the dict only holds the text printed by `print_profile`.
+
+        """
+        if prof is None:
+            return None
+        stream = StringIO()
+        try:
+            self.print_profile(stream, prof)
+        except NotImplementedError:
+            pass
+        return {'optimizer': self.__class__.__name__,
+                'name': _profile_name(self),
+                'text': stream.getvalue()}
+
 
 class FromFunctionOptimizer(Optimizer):
     """
@@ -348,6 +402,38 @@ class SeqOptimizer(Optimizer, list):
                                       level=level + 1)
         print(file=stream)
 
+    @staticmethod
+    def profile_to_dict(prof):
+        (opts, prof, validate_time, callback_time,
+         nb_node_before, nb_node_after, sub_profs, sub_validate_time,
+         nb_nodes, callbacks_time) = prof
+        children = []
+        for i, (opt, t, nb_n) in enumerate(zip(opts, prof, nb_nodes)):
+            child = {'name': _profile_name(opt),
+                     'optimizer': opt.__class__.__name__,
+                     'index': i,
+                     'time': t,
+                     'nodes_before': nb_n[0],
+                     'nodes_after': nb_n[1],
+                     'node_delta': nb_n[1] - nb_n[0],
+                     'validate_time': None,
+                     'profile': None}
+            if sub_validate_time:
+                child['validate_time'] = (sub_validate_time[i + 1] -
+                                          sub_validate_time[i])
+            if sub_profs[i]:
+                child['profile'] = opt.profile_to_dict(sub_profs[i])
+            children.append(child)
+        return {'optimizer': 'SeqOptimizer',
+                'name': getattr(opts, 'name', getattr(opts, '__name__', None)),
+                'time': sum(prof),
+                'nodes_before': nb_node_before,
+                'nodes_after': nb_node_after,
+                'validate_time': validate_time,
+                'callback_time': callback_time,
+                'callbacks_time': _str_keys(callbacks_time),
+                'optimizers': children}
+
     @staticmethod
     def merge_profile(prof1, prof2):
         """
@@ -948,6 +1034,20 @@ class MergeOptimizer(Optimizer):
                     # just print i.
                     print(blanc, "      ", i[0], ',', i[1], file=stream)
 
+    @staticmethod
+    def profile_to_dict(prof):
+        (nb_fail, replace_time, validate_time,
+         callback_time, callbacks_time, nb_merged, nb_constant) = prof
+        return {'optimizer': 'MergeOptimizer',
+                'name': 'MergeOptimizer',
+                'time': replace_time,
+                'failures': nb_fail,
+                'merged': nb_merged,
+                'constants_merged': nb_constant,
+                'validate_time': validate_time,
+                'callback_time': callback_time,
+                'callbacks_time': _str_keys(callbacks_time)}
+
     @staticmethod
     def merge_profile(prof1, prof2):
         def merge_none_number(v1, v2):
@@ -1366,7 +1466,7 @@ class LocalOptGroup(LocalOptimizer):
                 new_repl = opt.transform(node)
                 opt_finish = time.time()
                 if self.profile:
-                    self.time_opts[opt] += opt_start - opt_finish
+                    self.time_opts[opt] += opt_finish - opt_start
                     self.process_count[opt] += 1
                 if not new_repl:
                     continue
@@ -1431,6 +1531,20 @@ class LocalOptGroup(LocalOptimizer):
 
         print(file=stream)
 
+    @staticmethod
+    def profile_to_dict(prof):
+        (time_opts, process_count, applied_true, node_created, profile) = prof
+        if not profile:
+            return None
+        return {'optimizer': 'LocalOptGroup',
+                'local_optimizers': [
+                    {'name': _profile_name(o),
+                     'time': time_opts[o],
+                     'attempts': process_count[o],
+                     'applied': applied_true[o],
+                     'node_created': node_created[o]}
+                    for o in process_count]}
+
     def merge_profile(prof1, prof2):
         raise NotImplementedError
 
@@ -1885,6 +1999,13 @@ class NavigatorOptimizer(Optimizer):
             (raised normally).
 
     """
+    failure_count = None
+    """
+    While `apply` runs, dict local optimizer -> number of exceptions caught
+    by `process_node`, if the subclass profiles them.
+
+    """
+
     @staticmethod
     def warn(exc, nav, repl_pairs, local_opt, node):
         """
@@ -2019,6 +2140,7 @@ class NavigatorOptimizer(Optimizer):
             replacements = lopt.transform(node)
         except Exception as e:
             if self.failure_callback is not None:
+                self.count_failure(lopt)
                 self.failure_callback(e, self,
                                       [(x, None) for x in node.outputs],
                                       lopt, node)
@@ -2064,11 +2186,16 @@ class NavigatorOptimizer(Optimizer):
             # This is not supposed to happen.  The default failure_callback
             # will print a traceback as a warning.
             if self.failure_callback is not None:
+                self.count_failure(lopt)
                 self.failure_callback(e, self, repl_pairs, lopt, node)
                 return False
             else:
                 raise
 
+    def count_failure(self, lopt):
+        if self.failure_count is not None:
+            self.failure_count[lopt] = self.failure_count.get(lopt, 0) + 1
+
     def add_requirements(self, fgraph):
         super(NavigatorOptimizer, self).add_requirements(fgraph)
         # Added by default
@@ -2105,7 +2232,7 @@ class TopoOptimizer(NavigatorOptimizer):
         callback_before = fgraph.execute_callbacks_time
         nb_nodes_start = len(fgraph.apply_nodes)
         t0 = time.time()
-        q = deque(graph.io_toposort(fgraph.inputs, start_from))
+        q = deque(_io_toposort(fgraph, start_from))
         io_t = time.time() - t0
 
         def importer(node):
@@ -2115,6 +2242,9 @@ class TopoOptimizer(NavigatorOptimizer):
         u = self.attach_updater(fgraph, importer, None,
                                 name=getattr(self, 'name', None))
         nb = 0
+        nb_tried = 0
+        time_op_types = {}
+        failure_count = self.failure_count = {}
         try:
             t0 = time.time()
             while q:
@@ -2125,15 +2255,22 @@ class TopoOptimizer(NavigatorOptimizer):
                 if node not in fgraph.apply_nodes:
                     continue
                 current_node = node
+                op_type = type(node.op)
+                t_node = time.time()
                 nb += self.process_node(fgraph, node)
+                nb_tried += 1
+                time_op_types[op_type] = (time_op_types.get(op_type, 0) +
+                                          time.time() - t_node)
             loop_t = time.time() - t0
         finally:
             self.detach_updater(fgraph, u)
+            self.failure_count = None
 
         callback_time = fgraph.execute_callbacks_time - callback_before
         nb_nodes_end = len(fgraph.apply_nodes)
         return (self, nb, nb_nodes_start, nb_nodes_end,
-                io_t, loop_t, callback_time, self.local_opt)
+                io_t, loop_t, callback_time, self.local_opt,
+                nb_tried, sum(failure_count.values()), time_op_types)
 
     @staticmethod
     def print_profile(stream, prof, level=0):
@@ -2144,13 +2281,16 @@ class TopoOptimizer(NavigatorOptimizer):
             return
 
         (opt, nb, nb_nodes_start, nb_nodes_end,
-         io_t, loop_t, callback_time, lopt) = prof
+         io_t, loop_t, callback_time, lopt,
+         nb_tried, nb_failures, time_op_types) = prof
 
         print(blanc, "TopoOptimizer ",
               getattr(opt, "name", getattr(opt, "__name__", "")), file=stream)
 
         print(blanc, "  nb_node (start, end, changed)", (
             nb_nodes_start, nb_nodes_end, nb), file=stream)
+        print(blanc, "  nb_node tried, failures", (nb_tried, nb_failures),
+              file=stream)
         print(blanc, "  init io_toposort", io_t, file=stream)
         print(blanc, "  loop time", loop_t, file=stream)
         print(blanc, "  callback_time", callback_time, file=stream)
@@ -2163,6 +2303,34 @@ class TopoOptimizer(NavigatorOptimizer):
                                             lopt.profile),
                                    level=level + 1)
 
+    @staticmethod
+    def profile_to_dict(prof):
+        if prof is None:
+            return None
+        (opt, nb, nb_nodes_start, nb_nodes_end,
+         io_t, loop_t, callback_time, lopt,
+         nb_tried, nb_failures, time_op_types) = prof
+        d = {'optimizer': 'TopoOptimizer',
+             'name': getattr(opt, "name", getattr(opt, "__name__", None)),
+             'time': io_t + loop_t,
+             'io_toposort_time': io_t,
+             'loop_time': loop_t,
+             'callback_time': callback_time,
+             'nodes_before': nb_nodes_start,
+             'nodes_after': nb_nodes_end,
+             'node_delta': nb_nodes_end - nb_nodes_start,
+             'local_optimizer': _profile_name(lopt),
+             'attempts': nb_tried,
+             'applied': nb,
+             'failures': nb_failures,
+             'time_per_op_type': _str_keys(time_op_types),
+             'local_optimizers': None}
+        if isinstance(lopt, LocalOptGroup) and lopt.profile:
+            d['local_optimizers'] = lopt.profile_to_dict(
+                (lopt.time_opts, lopt.process_count, lopt.applied_true,
+                 lopt.node_created, lopt.profile))['local_optimizers']
+        return d
+
     def __str__(self):
         return getattr(self, '__name__',
                        '<TopoOptimizer instance>')
@@ -2263,13 +2431,27 @@ class ChangeTracker:
     def __init__(self):
         self.changed = False
         self.nb_imported = 0
+        # Nodes imported or whose inputs or clients changed since the last
+        # call to `pop_nodes`.
+        self.nodes = set()
 
     def on_import(self, fgraph, node, reason):
         self.nb_imported += 1
         self.changed = True
+        self.nodes.add(node)
 
     def on_change_input(self, fgraph, node, i, r, new_r, reason):
         self.changed = True
+        if not isinstance(node, str):
+            self.nodes.add(node)
+        for var in (r, new_r):
+            if var.owner is not None:
+                self.nodes.add(var.owner)
+
+    def pop_nodes(self):
+        nodes = self.nodes
+        self.nodes = set()
+        return nodes
 
     def reset(self):
         self.changed = False
@@ -2316,9 +2498,20 @@ class EquilibriumOptimizer(NavigatorOptimizer):
         They must not traverse the graph as they are called very frequently.
         The MergeOptimizer is one example of optimization that respect this.
         They are applied after all global optimizer, then when one local optimizer is applied, then after all final optimizer.
+    worklist
+        If True, after the first iteration the local optimizers are first
+        applied to the nodes near the ones changed since the previous
+        iteration. Only when none of them changes, the other nodes are
+        visited to check that the equilibrium is reached. If None (the
+        default), use the config flag `optimizer_worklist`.
 
     """
 
+    # Number of levels of clients of a changed node that are visited again
+    # by the worklist. Patterns match a few levels of inputs, so a change can
+    # enable an optimization a few nodes below.
+    worklist_depth = 3
+
     def __init__(self,
                  optimizers,
                  failure_callback=None,
@@ -2326,7 +2519,8 @@ class EquilibriumOptimizer(NavigatorOptimizer):
                  tracks_on_change_inputs=False,
                  max_use_ratio=None,
                  final_optimizers=None,
-                 cleanup_optimizers=None):
+                 cleanup_optimizers=None,
+                 worklist=None):
         super(EquilibriumOptimizer, self).__init__(
             None,
             ignore_newtrees=ignore_newtrees,
@@ -2353,6 +2547,7 @@ class EquilibriumOptimizer(NavigatorOptimizer):
         self.max_use_ratio = max_use_ratio
         assert self.max_use_ratio is not None, (
             'max_use_ratio has to be a number')
+        self.worklist = worklist
 
     def get_local_optimizers(self):
         for opt in self.local_optimizers_all:
@@ -2365,6 +2560,51 @@ class EquilibriumOptimizer(NavigatorOptimizer):
                     yield opt
                     s.add(opt)
 
+    def get_node_optimizers(self, op, cache):
+        """
+        Return the local optimizers to apply to the nodes of `op`.
+
+        The lists are stored in the dict `cache`, so the optimizers tracking
+        each Op are only gathered once per call to `apply`.
+
+        """
+        key = (type(op), op)
+        try:
+            return cache[key]
+        except KeyError:
+            lopts = (self.local_optimizers_all +
+                     self.local_optimizers_map.get(type(op), []) +
+                     self.local_optimizers_map.get(op, []))
+            cache[key] = lopts
+            return lopts
+
+    def worklist_nodes(self, fgraph, changed_nodes):
+        """
+        Return the set of nodes that can be optimized after a change to
+        `changed_nodes`.
+
+        These are the changed nodes still in `fgraph`, the owners of their
+        inputs, whose clients changed, and their clients up to
+        `worklist_depth` levels.
+
+        """
+        front = [node for node in changed_nodes if node in fgraph.apply_nodes]
+        nodes = set(front)
+        for node in front:
+            nodes.update(i.owner for i in node.inputs if i.owner is not None)
+        seen = set(front)
+        for depth in range(self.worklist_depth):
+            next_front = []
+            for node in front:
+                for out in node.outputs:
+                    for client, _ in out.clients:
+                        if client != 'output' and client not in seen:
+                            seen.add(client)
+                            next_front.append(client)
+            front = next_front
+        nodes.update(seen)
+        return nodes
+
     def add_requirements(self, fgraph):
         super(EquilibriumOptimizer, self).add_requirements(fgraph)
         for opt in self.get_local_optimizers():
@@ -2385,6 +2625,11 @@ class EquilibriumOptimizer(NavigatorOptimizer):
             for node in start_from:
                 assert node in fgraph.outputs
 
+        worklist = self.worklist
+        if worklist is None:
+            worklist = config.optimizer_worklist
+        node_optimizers = {}
+
         changed = True
         max_use_abort = False
         opt_name = None
@@ -2403,6 +2648,9 @@ class EquilibriumOptimizer(NavigatorOptimizer):
         global_sub_profs = []
         final_sub_profs = []
         cleanup_sub_profs = []
+        attempt_count = {}
+        time_op_types = {}
+        failure_count = self.failure_count = {}
         for opt in (self.global_optimizers +
                     list(self.get_local_optimizers()) +
                     self.final_optimizers +
@@ -2410,6 +2658,7 @@ class EquilibriumOptimizer(NavigatorOptimizer):
             global_process_count.setdefault(opt, 0)
             time_opts.setdefault(opt, 0)
             node_created.setdefault(opt, 0)
+            attempt_count.setdefault(opt, 0)
 
         def apply_cleanup(profs_dict):
             changed = False
@@ -2419,6 +2668,7 @@ class EquilibriumOptimizer(NavigatorOptimizer):
                 t_opt = time.time()
                 sub_prof = copt.apply(fgraph)
                 time_opts[copt] += time.time() - t_opt
+                attempt_count[copt] += 1
                 profs_dict[copt].append(sub_prof)
                 if change_tracker.changed:
                     process_count.setdefault(copt, 0)
@@ -2444,6 +2694,7 @@ class EquilibriumOptimizer(NavigatorOptimizer):
                 t_opt = time.time()
                 sub_prof = gopt.apply(fgraph)
                 time_opts[gopt] += time.time() - t_opt
+                attempt_count[gopt] += 1
                 sub_profs.append(sub_prof)
                 if change_tracker.changed:
                     process_count.setdefault(gopt, 0)
@@ -2465,12 +2716,18 @@ class EquilibriumOptimizer(NavigatorOptimizer):
 
             # apply local optimizer
             topo_t0 = time.time()
-            q = deque(graph.io_toposort(fgraph.inputs, start_from))
+            q = _io_toposort(fgraph, start_from)
+            changed_nodes = change_tracker.pop_nodes()
+            max_nb_nodes = max(max_nb_nodes, len(q))
+            max_use = max_nb_nodes * self.max_use_ratio
+            full_pass = not worklist or not loop_timing
+            if not full_pass:
+                todo = self.worklist_nodes(fgraph, changed_nodes)
+                q = [node for node in q if node in todo]
+            q = deque(q)
             io_toposort_timing.append(time.time() - topo_t0)
 
             nb_nodes.append(len(q))
-            max_nb_nodes = max(max_nb_nodes, len(q))
-            max_use = max_nb_nodes * self.max_use_ratio
 
             def importer(node):
                 if node is not current_node:
@@ -2484,25 +2741,40 @@ class EquilibriumOptimizer(NavigatorOptimizer):
             u = self.attach_updater(fgraph, importer, None,
                                     chin=chin,
                                     name=getattr(self, 'name', None))
+            local_changed = False
             try:
-                while q:
+                while q or not (full_pass or local_changed):
+                    if not q:
+                        # The worklist is exhausted without any change, so
+                        # the nodes it visited cannot be optimized anymore.
+                        # Visit the other nodes to check that the
+                        # equilibrium is reached.
+                        full_pass = True
+                        topo_t0 = time.time()
+                        q.extend(n for n in _io_toposort(fgraph, start_from)
+                                 if n not in todo)
+                        io_toposort_timing[-1] += time.time() - topo_t0
+                        nb_nodes[-1] += len(q)
+                        continue
                     node = q.pop()
                     if node not in fgraph.apply_nodes:
                         continue
                     current_node = node
-                    for lopt in (self.local_optimizers_all +
-                                 self.local_optimizers_map.get(type(node.op), []) +
-                                 self.local_optimizers_map.get(node.op, [])):
+                    op_type = type(node.op)
+                    t_node = time.time()
+                    for lopt in self.get_node_optimizers(node.op,
+                                                         node_optimizers):
                         nb = change_tracker.nb_imported
                         t_opt = time.time()
                         lopt_change = self.process_node(fgraph, node, lopt)
                         time_opts[lopt] += time.time() - t_opt
+                        attempt_count[lopt] += 1
                         if not lopt_change:
                             continue
                         process_count.setdefault(lopt, 0)
                         process_count[lopt] += 1
                         global_process_count[lopt] += 1
-                        changed = True
+                        changed = local_changed = True
                         node_created[lopt] += change_tracker.nb_imported - nb
                         changed |= apply_cleanup(iter_cleanup_sub_profs)
                         if global_process_count[lopt] > max_use:
@@ -2512,6 +2784,8 @@ class EquilibriumOptimizer(NavigatorOptimizer):
                         if node not in fgraph.apply_nodes:
                             # go to next node
                             break
+                    time_op_types[op_type] = (time_op_types.get(op_type, 0) +
+                                              time.time() - t_node)
             finally:
                 self.detach_updater(fgraph, u)
 
@@ -2524,6 +2798,7 @@ class EquilibriumOptimizer(NavigatorOptimizer):
                 t_opt = time.time()
                 sub_prof = gopt.apply(fgraph)
                 time_opts[gopt] += time.time() - t_opt
+                attempt_count[gopt] += 1
                 sub_profs.append(sub_prof)
                 if change_tracker.changed:
                     process_count.setdefault(gopt, 0)
@@ -2565,6 +2840,7 @@ class EquilibriumOptimizer(NavigatorOptimizer):
             else:
                 _logger.error(msg)
         fgraph.remove_feature(change_tracker)
+        self.failure_count = None
         assert len(loop_process_count) == len(loop_timing)
         assert len(loop_process_count) == len(global_opt_timing)
         assert len(loop_process_count) == len(nb_nodes)
@@ -2576,7 +2852,8 @@ class EquilibriumOptimizer(NavigatorOptimizer):
                 (start_nb_nodes, end_nb_nodes, max_nb_nodes),
                 global_opt_timing, nb_nodes, time_opts, io_toposort_timing,
                 node_created, global_sub_profs, final_sub_profs,
-                cleanup_sub_profs)
+                cleanup_sub_profs, attempt_count, failure_count,
+                time_op_types)
 
     def print_summary(self, stream=sys.stdout, level=0, depth=-1):
         name = getattr(self, 'name', None)
@@ -2593,7 +2870,8 @@ class EquilibriumOptimizer(NavigatorOptimizer):
          (start_nb_nodes, end_nb_nodes, max_nb_nodes),
          global_opt_timing, nb_nodes, time_opts, io_toposort_timing,
          node_created, global_sub_profs, final_sub_profs,
-         cleanup_sub_profs) = prof
+         cleanup_sub_profs, attempt_count, failure_count,
+         time_op_types) = prof
 
         blanc = ('    ' * level)
         print(blanc, "EquilibriumOptimizer", end=' ', file=stream)
@@ -2613,6 +2891,12 @@ class EquilibriumOptimizer(NavigatorOptimizer):
         print(blanc, "  time in final optimizers %.3fs" % s, file=stream)
         s = sum([time_opts[o] for o in opt.cleanup_optimizers])
         print(blanc, "  time in cleanup optimizers %.3fs" % s, file=stream)
+        if time_op_types:
+            d = sorted(iteritems(time_op_types), key=lambda a: -a[1])
+            print(blanc, "  time in local optimizers per Op type: %s" % (
+                " ".join("(%s, %.3fs)" % (k.__name__, v)
+                         for k, v in d[:5]) +
+                (" ..." if len(d) > 5 else "")), file=stream)
         for i in range(len(loop_timing)):
             lopt = ""
             if loop_process_count[i]:
@@ -2645,6 +2929,8 @@ class EquilibriumOptimizer(NavigatorOptimizer):
         for o, count in iteritems(process_count):
             if count > 0:
                 count_opt.append((time_opts[o], count,
+                                  attempt_count.get(o, 0),
+                                  failure_count.get(o, 0),
                                   node_created[o], o))
             else:
                 not_used.append((time_opts[o], o))
@@ -2652,12 +2938,13 @@ class EquilibriumOptimizer(NavigatorOptimizer):
 
         if count_opt:
             print(blanc,
-                  '  times - times applied - nb node created - name:',
+                  '  times - times applied - times tried - failures - '
+                  'nb node created - name:',
                   file=stream)
-            count_opt.sort()
-            for (t, count, n_created, o) in count_opt[::-1]:
-                print(blanc, '  %.3fs - %d - %d - %s' % (
-                    t, count, n_created, o), file=stream)
+            count_opt.sort(key=lambda c: c[:5])
+            for (t, count, tried, failed, n_created, o) in count_opt[::-1]:
+                print(blanc, '  %.3fs - %d - %d - %d - %d - %s' % (
+                    t, count, tried, failed, n_created, o), file=stream)
             print(blanc, '  %.3fs - in %d optimization that were not used (display only those with a runtime > 0)' % (
                 not_used_time, len(not_used)), file=stream)
             not_used.sort(key=lambda nu: (nu[0], str(nu[1])))
@@ -2692,6 +2979,65 @@ class EquilibriumOptimizer(NavigatorOptimizer):
                 except NotImplementedError:
                     print(blanc, "merge not implemented for ", o)
 
+    @staticmethod
+    def profile_to_dict(prof):
+        (opt, loop_timing, loop_process_count,
+         (start_nb_nodes, end_nb_nodes, max_nb_nodes),
+         global_opt_timing, nb_nodes, time_opts, io_toposort_timing,
+         node_created, global_sub_profs, final_sub_profs,
+         cleanup_sub_profs, attempt_count, failure_count,
+         time_op_types) = prof
+
+        process_count = {}
+        for count in loop_process_count:
+            for o, v in iteritems(count):
+                process_count[o] = process_count.get(o, 0) + v
+
+        def opt_dicts(opts):
+            return [{'name': _profile_name(o),
+                     'optimizer': o.__class__.__name__,
+                     'time': time_opts.get(o, 0),
+                     'attempts': attempt_count.get(o, 0),
+                     'applied': process_count.get(o, 0),
+                     'failures': failure_count.get(o, 0),
+                     'node_created': node_created.get(o, 0)}
+                    for o in opts]
+
+        def sub_dicts(opts, sub_profs):
+            return [dict((_profile_name(o), o.profile_to_dict(p))
+                         for o, p in zip(opts, profs) if p is not None)
+                    for profs in sub_profs]
+
+        passes = []
+        for i in range(len(loop_timing)):
+            passes.append({
+                'time': loop_timing[i],
+                'global_opts_time': global_opt_timing[i],
+                'io_toposort_time': io_toposort_timing[i],
+                'nodes': nb_nodes[i],
+                'applied': _str_keys(loop_process_count[i])})
+        return {
+            'optimizer': 'EquilibriumOptimizer',
+            'name': getattr(opt, "name", getattr(opt, "__name__", None)),
+            'time': sum(loop_timing),
+            'nodes_before': start_nb_nodes,
+            'nodes_after': end_nb_nodes,
+            'node_delta': end_nb_nodes - start_nb_nodes,
+            'max_nodes': max_nb_nodes,
+            'io_toposort_time': sum(io_toposort_timing),
+            'passes': passes,
+            'time_per_op_type': _str_keys(time_op_types),
+            'local_optimizers': opt_dicts(opt.get_local_optimizers()),
+            'global_optimizers': opt_dicts(opt.global_optimizers),
+            'final_optimizers': opt_dicts(opt.final_optimizers),
+            'cleanup_optimizers': opt_dicts(opt.cleanup_optimizers),
+            'global_profiles': sub_dicts(opt.global_optimizers,
+                                         global_sub_profs),
+            'final_profiles': sub_dicts(opt.final_optimizers,
+                                        final_sub_profs),
+            'cleanup_profiles': sub_dicts(opt.cleanup_optimizers,
+                                          cleanup_sub_profs)}
+
     @staticmethod
     def merge_profile(prof1, prof2):
         # (opt, loop_timing, loop_process_count, max_nb_nodes,
@@ -2779,6 +3125,9 @@ class EquilibriumOptimizer(NavigatorOptimizer):
         assert len(loop_timing) == max(len(prof1[1]), len(prof2[1]))
 
         node_created = merge_dict(prof1[8], prof2[8])
+        attempt_count = merge_dict(prof1[12], prof2[12])
+        failure_count = merge_dict(prof1[13], prof2[13])
+        time_op_types = merge_dict(prof1[14], prof2[14])
         return (new_opt,
                 loop_timing,
                 loop_process_count,
@@ -2790,7 +3139,10 @@ class EquilibriumOptimizer(NavigatorOptimizer):
                 node_created,
                 global_sub_profs,
                 final_sub_profs,
-                cleanup_sub_profs)
+                cleanup_sub_profs,
+                attempt_count,
+                failure_count,
+                time_op_types)
 
 #################
 #   Utilities   #
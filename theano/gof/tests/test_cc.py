@@ -11,6 +11,7 @@ from theano.gof.type import Type
 from theano.gof.graph import Variable, Apply, Constant
 from theano.gof.op import Op
 from theano.gof import fg
+from theano.tests import unittest_tools as utt
 
 
 def as_variable(x):
@@ -230,6 +231,35 @@ def test_clinker_literal_cache():
         out1 = benchmark(normal_svd, orientationi)
 
 
+def test_clinker_hoist_constants():
+    # Graphs that differ by the value of small constants share their key
+    # and their code, and still compute with their own constants.
+    if not theano.config.cxx:
+        raise SkipTest("G++ not available, so we need to skip this test.")
+
+    def linker(c, v):
+        x = theano.scalar.float64('x')
+        y = theano.tensor.dvector('y')
+        e = x * theano.scalar.constant(c)
+        e2 = y + theano.tensor.constant(v)
+        return CLinker().accept(fg.FunctionGraph([x, y], [e, e2]))
+
+    v1, v2 = np.arange(3.), np.arange(3.) + 5
+    assert linker(2.5, v1).cmodule_key() != linker(1.5, v2).cmodule_key()
+    with theano.change_flags(**{'cmodule.hoist_constants': 3}):
+        lnk1, lnk2 = linker(2.5, v1), linker(1.5, v2)
+        assert lnk1.cmodule_key() == lnk2.cmodule_key()
+        assert "2.5" not in lnk1.code_gen()
+        assert lnk1.get_src_code() == lnk2.get_src_code()
+        for lnk, c, v in [(lnk1, 2.5, v1), (lnk2, 1.5, v2)]:
+            out, out2 = lnk.make_function()(2., np.ones(3))
+            assert out == 2. * c
+            utt.assert_allclose(out2, v + 1)
+    with theano.change_flags(**{'cmodule.hoist_constants': 2}):
+        # The vector constants are too big.
+        assert linker(2.5, v1).cmodule_key() != linker(1.5, v2).cmodule_key()
+
+
 def test_clinker_single_node():
     if not theano.config.cxx:
         raise SkipTest("G++ not available, so we need to skip this test.")
@@ -6,10 +6,22 @@ deterministic based on the input type and the op.
 """
 from __future__ import absolute_import, print_function, division
 
+import os
+import shutil
+import tempfile
+import threading
+import time
+
 import numpy as np
+from nose.plugins.skip import SkipTest
+from six import b
+import six.moves.cPickle as pickle
 
 import theano
-from theano.gof.cmodule import GCC_compiler
+from theano.gof import cmodule, compilelock
+from theano.gof.cc import CLinker, get_module_cache
+from theano.gof.cmodule import GCC_compiler, ModuleCache, ProbeCache
+from theano.gof.fg import FunctionGraph
 
 
 class MyOp(theano.compile.ops.DeepCopyOp):
@@ -67,3 +79,141 @@ def test_flag_detection():
     # but was not detected because that path is not usually taken,
     # so we test it here directly.
     GCC_compiler.try_flags(["-lblas"])
+
+
+def test_module_lock():
+    # Module locks only block processes (here, threads) that compile the
+    # same module, and the waits are accounted.
+    name = 'test_module_lock_%d' % os.getpid()
+    lock_dir = compilelock.module_lock_dir(name)
+    acquired = threading.Event()
+
+    def hold():
+        with compilelock.module_lock_ctx(name):
+            acquired.set()
+            time.sleep(0.5)
+
+    t = threading.Thread(target=hold)
+    t.start()
+    acquired.wait()
+    assert os.path.isdir(lock_dir)
+
+    # Another module is not blocked.
+    count = compilelock.lock_wait_count
+    with compilelock.module_lock_ctx(name + '_other'):
+        pass
+    assert compilelock.lock_wait_count == count
+
+    wait_time = compilelock.lock_wait_time
+    with compilelock.module_lock_ctx(name, min_wait=0.1, max_wait=0.2):
+        assert not t.is_alive()
+    t.join()
+    assert compilelock.lock_wait_count == count + 1
+    assert compilelock.lock_wait_time > wait_time
+    assert not os.path.exists(lock_dir)
+
+
+def test_module_index():
+    # A new process finds a versioned module through the index, without
+    # walking the cache directory.
+    if not theano.config.cxx or not theano.config.cmodule.use_index:
+        raise SkipTest("Need cxx and the module index")
+    x = theano.tensor.dvector('x')
+    lnk = CLinker().accept(FunctionGraph([x], [x * 2 + 1.5]))
+    key = lnk.cmodule_key()
+    assert key[0]
+    cache = get_module_cache()
+    module = cache.module_from_key(key=key, lnk=lnk)
+    assert cache.index.exists()
+
+    new_cache = ModuleCache(cache.dirname, check_for_broken_eq=False)
+    assert key not in new_cache.entry_from_key
+    assert new_cache.module_from_key(key=key, lnk=lnk).__file__ == \
+        module.__file__
+    assert new_cache.stats[2] == 0
+    assert len(new_cache.loaded_key_pkl) == 1
+
+    # The digest of a key is the same after a pickle round-trip, and a
+    # module and key already in the index are not recorded again.
+    assert cmodule.key_digest(key) is not None
+    assert cmodule.key_digest(pickle.loads(pickle.dumps(key))) == \
+        cmodule.key_digest(key)
+    key_data, = new_cache.module_hash_to_key_data.values()
+    size = os.path.getsize(new_cache.index.path)
+    with compilelock.lock_ctx():
+        new_cache.index.append(key_data.module_hash, key_data.get_entry(),
+                               key_data.key_pkl, [key])
+    assert os.path.getsize(new_cache.index.path) == size
+
+    # A full scan rebuilds the index, which still knows the module.
+    fsck_time = new_cache.index.fsck_time
+    new_cache.refresh(full_scan=True)
+    assert new_cache.index.fsck_time >= fsck_time
+    assert any(entry == module.__file__
+               for entry, _ in new_cache.index.entries.values())
+
+
+def test_module_index_removed():
+    # A refresh through the index forgets the modules deleted by another
+    # process.
+    if not theano.config.cxx or not theano.config.cmodule.use_index:
+        raise SkipTest("Need cxx and the module index")
+    dirname = tempfile.mkdtemp()
+    try:
+        x = theano.tensor.dvector('x')
+        lnk = CLinker().accept(FunctionGraph([x], [x * 3 + 2.5]))
+        key = lnk.cmodule_key()
+        cache = ModuleCache(dirname, check_for_broken_eq=False)
+        module = cache.module_from_key(key=key, lnk=lnk)
+        assert key in cache.entry_from_key
+        shutil.rmtree(os.path.dirname(module.__file__))
+
+        assert cache.refresh() == []
+        assert key not in cache.entry_from_key
+        assert not cache.module_hash_to_key_data
+        assert not cache.index.entries
+    finally:
+        shutil.rmtree(dirname)
+
+
+def test_probe_cache():
+    # The result of a trial compilation is reused by a new process, and
+    # depends on the environment.
+    if not theano.config.cxx:
+        raise SkipTest("Need cxx")
+    tmpdir = tempfile.mkdtemp()
+    code = "int main(int argc, char** argv) { return %d; }"
+    # Detect the -march flags now, they are cached too.
+    GCC_compiler.compile_args()
+    old_cache = cmodule.get_probe_cache()
+    old_ld_path = os.environ.get('LD_LIBRARY_PATH')
+    try:
+        cache = cmodule.get_probe_cache.cache = ProbeCache(tmpdir)
+        assert GCC_compiler.try_compile_tmp(code % 0, try_run=True) == \
+            (True, True)
+        assert GCC_compiler.try_compile_tmp(code % 1, try_run=True) == \
+            (True, False)
+        assert len(cache.results) == 2
+
+        new_cache = cmodule.get_probe_cache.cache = ProbeCache(tmpdir)
+        new_cache.set('try_compile',
+                      (theano.config.cxx, GCC_compiler.compile_args(), [],
+                       b(code % 0), True),
+                      (True, False, None, None))
+        # The stored result is used, instead of compiling again.
+        assert GCC_compiler.try_compile_tmp(code % 0, try_run=True) == \
+            (True, False)
+        os.environ['LD_LIBRARY_PATH'] = tmpdir
+        assert GCC_compiler.try_compile_tmp(code % 0, try_run=True) == \
+            (True, True)
+
+        new_cache.clear()
+        assert not os.path.exists(new_cache.path)
+        assert new_cache.get('try_compile', ()) == (False, None)
+    finally:
+        cmodule.get_probe_cache.cache = old_cache
+        if old_ld_path is None:
+            os.environ.pop('LD_LIBRARY_PATH', None)
+        else:
+            os.environ['LD_LIBRARY_PATH'] = old_ld_path
+        shutil.rmtree(tmpdir)
@@ -1,5 +1,6 @@
 from __future__ import absolute_import, print_function, division
 
+import numpy as np
 from six.moves import xrange
 from theano.gof.type import Type
 from theano.gof import graph
@@ -492,3 +493,75 @@ def test_multiple_inplace():
     OpSubOptimizer(multiple_in_place_1, multiple_in_place_0_1, fail).optimize(g)
     consistent(g)
     assert fail.failures == 1
+
+
+def test_incremental_cycle_detection():
+    # Random replacements, checked against the global cycle detection
+    rng = np.random.RandomState(42)
+    ops = [add, dot, sigmoid, add_in_place]
+    n_checked = [0, 0]
+    for k in range(40):
+        x, y, z = inputs()
+        variables = [x, y, z]
+        for i in range(20):
+            op = ops[rng.randint(len(ops))]
+            variables.append(op(*[variables[rng.randint(len(variables))]
+                                  for j in range(op.nin)]))
+        g = Env([x, y, z], variables[-4:], validate=False)
+        dh = g.destroy_handler
+        if not g.consistent():
+            continue
+        for i in range(50):
+            nodes = sorted(g.apply_nodes,
+                           key=lambda n: n.outputs[0].auto_name)
+            if not nodes:
+                break
+            r = nodes[rng.randint(len(nodes))].outputs[0]
+            all_vars = sorted(g.variables, key=lambda v: v.auto_name)
+            new_r = all_vars[rng.randint(len(all_vars))]
+            if r is new_r or not r.clients:
+                continue
+            chk = g.checkpoint()
+            g.replace(r, new_r)
+            try:
+                expected = not destroyhandler._contains_cycle(
+                    g, dh.orderings(g, ordered=False))
+            except InconsistencyError:
+                expected = False
+            try:
+                g.validate()
+                valid = True
+            except InconsistencyError:
+                valid = False
+            if dh.destroyers:
+                assert valid == expected
+                n_checked[valid] += 1
+            if not expected:
+                g.revert(chk)
+                g.validate()
+            # The order agrees with the graph and its orderings
+            pos = dh.topo_order.pos
+            assert len(pos) == len(g.apply_nodes)
+            assert sorted(pos.values()) == dh.topo_order.positions
+            ords = dh.orderings(g, ordered=False)
+            for node in g.apply_nodes:
+                for prev in ([inp.owner for inp in node.inputs if inp.owner] +
+                             list(ords.get(node, []))):
+                    assert pos[prev] < pos[node]
+    assert min(n_checked) > 10, n_checked
+
+
+def test_new_edges_cleared():
+    # The edges added by the replacements are not kept when the
+    # incremental order does not use them
+    for algo in ['regular', 'fast']:
+        x, y, z = inputs()
+        e = add_in_place(add(x, y), z)
+        g = FunctionGraph([x, y, z], [dot(e, x)], clone=False)
+        dh = destroyhandler.DestroyHandler(algo=algo)
+        g.attach_feature(dh)
+        g.attach_feature(ReplaceValidate())
+        assert (dh.topo_order is None) == (algo == 'fast')
+        g.replace_validate(e.owner.inputs[0], add(y, x))
+        g.replace_validate(g.outputs[0], sigmoid(g.outputs[0]))
+        assert dh.new_edges == []
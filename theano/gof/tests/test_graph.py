@@ -1,4 +1,5 @@
 from __future__ import absolute_import, print_function, division
+import gc
 from itertools import count
 import pickle
 import unittest
@@ -7,10 +8,11 @@ from nose.plugins.skip import SkipTest
 import numpy as np
 
 from theano import (
-    sparse,
+    change_flags, sparse,
     shared, tensor)
+from theano.gof.fg import FunctionGraph
 from theano.gof.graph import (
-    Apply,
+    Apply, _interned_applies,
     as_string, clone, general_toposort, inputs, io_toposort,
     is_same_graph, Variable)
 from theano.gof.op import Op
@@ -341,6 +343,50 @@ class TestEval(unittest.TestCase):
                          "temporary functions must not be serialized")
 
 
+class TestInternApply(unittest.TestCase):
+
+    def test_intern(self):
+        x, y = tensor.vectors('x', 'y')
+        with change_flags(intern_apply=True):
+            a = tensor.exp(x + y) * 2
+            b = tensor.exp(x + y) * tensor.TensorConstant(
+                tensor.bscalar().type, np.asarray(2, dtype='int8'))
+            c = tensor.exp(y + x)
+            d = tensor.inc_subtensor(x[:2], y[:2], inplace=True)
+            e = tensor.inc_subtensor(x[:2], y[:2], inplace=True)
+        assert a is b
+        assert c.owner is not a.owner.inputs[0].owner
+        assert c.owner.inputs[0].owner is not a.owner
+        # Nodes destroying their inputs are not interned
+        assert d is not e
+        with change_flags(intern_apply=False):
+            assert tensor.exp(x + y) is not a.owner.inputs[0]
+
+    def test_weak(self):
+        x = tensor.vector('x')
+        with change_flags(intern_apply=True):
+            gc.collect()
+            n = len(_interned_applies)
+            y = tensor.exp(x)
+            assert len(_interned_applies) == n + 1
+            del y
+            gc.collect()
+            assert len(_interned_applies) == n
+
+    def test_fgraph(self):
+        # A node used by a FunctionGraph can be changed in place
+        x, y = tensor.vectors('x', 'y')
+        with change_flags(intern_apply=True):
+            s = x + y
+            z = tensor.exp(s)
+            fgraph = FunctionGraph([x, y], [z], clone=False)
+            assert tensor.exp(s) is not z
+            fgraph.replace(s, x)
+            fgraph.disown()
+            assert z.owner.inputs == [x]
+            assert tensor.exp(s).owner.inputs == [s]
+
+
 ################
 # autoname     #
 ################
@@ -1,16 +1,16 @@
 from __future__ import absolute_import, print_function, division
 import os
+import time
 import numpy as np
 import theano
 import theano.tensor as T
+from theano.compile import optcache
 
 floatX = 'float32'
 
 
 def test_graph_opt_caching():
-    opt_db_file = os.path.join(theano.config.compiledir, 'optimized_graphs.pkl')
-    if os.path.exists(opt_db_file):
-        os.remove(opt_db_file)
+    optcache.get_optimized_graph_cache().clear()
 
     mode = theano.config.mode
     if mode in ["DEBUG_MODE", "DebugMode"]:
@@ -30,13 +30,66 @@ def test_graph_opt_caching():
         p = theano.shared(np.ones((10, 10), dtype=floatX))
         q = theano.shared(np.ones((10, 10), dtype=floatX))
         j = T.sum(T.sum(T.sum(m ** 2 + n) + p) + q)
-        f2 = theano.function([m, n], j, mode=mode)
+        profile = theano.compile.ProfileStats(atexit_print=False)
+        with theano.change_flags(profile_optimizer=True):
+            f2 = theano.function([m, n], j, mode=mode, profile=profile)
+        assert profile.optimizer_cache_hits == 1
+        assert profile.optimizer_cache_misses == 0
+        # The optimizer did not run, so there is no optimizer profile.
+        assert profile.optimizer_profile is None
 
         in1 = np.ones((10, 10), dtype=floatX)
         in2 = np.ones((10, 10), dtype=floatX)
         assert f1(in1, in2) == f2(in1, in2)
+
+        # The shared values are not stored in the cache, the function
+        # must use the values of its own shared variables.
+        q.set_value(np.zeros((10, 10), dtype=floatX))
+        assert f2(in1, in2) == f1(in1, in2) - 100
+
+        # A different graph must not be taken from the cache.
+        k = T.sum(T.sum(T.sum(m ** 3 + n) + p) + q)
+        profile = theano.compile.ProfileStats(atexit_print=False)
+        f3 = theano.function([m, n], k, mode=mode, profile=profile)
+        assert profile.optimizer_cache_hits == 0
+        assert profile.optimizer_cache_misses == 1
+        assert f3(in1, in2) == f2(in1, in2)
     finally:
         theano.config.cache_optimizations = default
 
+
+def test_graph_opt_caching_eviction():
+    cache = optcache.get_optimized_graph_cache()
+    cache.clear()
+    max_entries = cache.max_entries
+    default = theano.config.cache_optimizations
+    try:
+        theano.config.cache_optimizations = True
+        cache.max_entries = 2
+        x = T.dvector('x')
+        for i in range(4):
+            theano.function([x], x + i + 1)
+        entries = cache.entries()
+        assert len(entries) == 2
+        assert all(os.path.dirname(e[2]) == cache.dirname for e in entries)
+
+        # The temporary files of the writers that did not finish are
+        # removed once they are old enough.
+        stale = os.path.join(cache.dirname, 'stale.tmp')
+        fresh = os.path.join(cache.dirname, 'fresh.tmp')
+        for path in [stale, fresh]:
+            with open(path, 'wb') as f:
+                f.write(b'partial')
+        old = time.time() - cache.tmp_age_thresh - 10
+        os.utime(stale, (old, old))
+        cache.evict()
+        assert not os.path.exists(stale)
+        assert os.path.exists(fresh)
+        os.remove(fresh)
+    finally:
+        cache.max_entries = max_entries
+        theano.config.cache_optimizations = default
+
+
 if __name__ == '__main__':
     test_graph_opt_caching()
@@ -595,6 +595,35 @@ class TestEquilibrium(object):
         # print 'after', g
         assert str(g) == '[Op1(x, y)]'
 
+    def test_worklist(self):
+        x, y, z = map(MyVariable, 'xyz')
+        outs = [op1(op1(op3(x, y)))]
+        # Nodes that no optimizer changes
+        v = z
+        for i in range(20):
+            v = op5(v, y)
+        outs.append(v)
+        results = []
+        for worklist in [False, True]:
+            g = FunctionGraph([x, y, z], outs, clone=True)
+            opt = EquilibriumOptimizer(
+                [PatternSub((op1, (op2, 'x', 'y')), (op4, 'x', 'y')),
+                 PatternSub((op3, 'x', 'y'), (op4, 'x', 'y')),
+                 PatternSub((op4, 'x', 'y'), (op6, 'x', 'y')),
+                 PatternSub((op6, 'x', 'y'), (op2, 'x', 'y'))],
+                max_use_ratio=10, worklist=worklist)
+            prof = opt.optimize(g)
+            results.append(str(g))
+            nb_nodes = prof[5]
+            if worklist:
+                # The iterations after the first one only visit the nodes
+                # near the changes, and the last one the whole graph.
+                assert len(nb_nodes) > 2
+                assert all(n < 10 for n in nb_nodes[1:-1]), nb_nodes
+                assert nb_nodes[-1] >= len(g.apply_nodes)
+        assert results[0] == results[1], results
+        assert results[1].startswith('[Op2(x, y), ')
+
 
 def test_pre_constant_merge_slice():
     ms = theano.tensor.type_other.MakeSlice()(1)
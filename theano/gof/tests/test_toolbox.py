@@ -1,11 +1,15 @@
 from __future__ import absolute_import, print_function, division
 
+from collections import OrderedDict
+
+import numpy as np
+
 from theano.gof.graph import Variable, Apply
 from theano.gof.type import Type
 from theano.gof.op import Op
 
 from theano.gof.fg import FunctionGraph
-from theano.gof.toolbox import NodeFinder
+from theano.gof.toolbox import NodeFinder, Feature, IncrementalToposort
 
 
 def as_variable(x):
@@ -86,3 +90,126 @@ class TestNodeFinder:
         for type, num in ((add, 4), (sigmoid, 3), (dot, 1)):
             if not len([t for t in g.get_nodes(type)]) == num:
                 raise Exception("Expected: %i times %s" % (num, type))
+
+
+class Orderings(Feature):
+
+    def __init__(self, ords):
+        self.ords = ords
+
+    def orderings(self, fgraph):
+        return self.ords
+
+
+class TestIncrementalToposort:
+
+    def check_order(self, g, order):
+        assert set(order) == g.apply_nodes
+        assert len(order) == len(g.apply_nodes)
+        position = dict((node, i) for i, node in enumerate(order))
+        for node in order:
+            for inp in node.inputs:
+                if inp.owner is not None:
+                    assert position[inp.owner] < position[node]
+        return position
+
+    def test_change_input(self):
+        x, y, z = inputs()
+        a = sigmoid(x)
+        b = sigmoid(sigmoid(y))
+        g = FunctionGraph([x, y, z], [a, b], clone=False)
+        g.attach_feature(IncrementalToposort())
+        assert g.toposort().index(a.owner) == 0
+        # a now depends on b, which comes after it.
+        g.change_input(a.owner, 0, b)
+        position = self.check_order(g, g.toposort())
+        assert position[b.owner] < position[a.owner]
+        # A new node is put at the end.
+        c = add(a, z)
+        g.change_input('output', 0, c)
+        order = g.toposort()
+        self.check_order(g, order)
+        assert order[-1] is c.owner
+
+    def test_clone(self):
+        x, y, z = inputs()
+        g = FunctionGraph([x, y, z], [sigmoid(add(x, y))], clone=False)
+        feature = IncrementalToposort()
+        g.attach_feature(feature)
+        g2 = g.clone()
+        assert g.incremental_toposort is feature
+        assert isinstance(g2.incremental_toposort, IncrementalToposort)
+        assert g2.incremental_toposort is not feature
+        assert g2.incremental_toposort.fgraph is g2
+        self.check_order(g2, g2.toposort())
+
+    def test_many_imports(self):
+        # Each new node goes between the last one and a.owner, until
+        # there is no room left between their positions.
+        x, y, z = inputs()
+        a = sigmoid(x)
+        g = FunctionGraph([x, y, z], [a], clone=False)
+        g.attach_feature(IncrementalToposort())
+        for i in range(200):
+            g.change_input(a.owner, 0, sigmoid(a.owner.inputs[0]))
+        order = g.toposort()
+        self.check_order(g, order)
+        assert order[-1] is a.owner
+        assert len(order) == 201
+
+    def test_random_replacements(self):
+        rng = np.random.RandomState(42)
+        x, y, z = inputs()
+        variables = [x, y, z]
+        for i in range(40):
+            op = [sigmoid, add, dot][rng.randint(3)]
+            args = [variables[rng.randint(len(variables))]
+                    for j in range(op.nin)]
+            variables.append(op(*args))
+        g = FunctionGraph([x, y, z], variables[-5:], clone=False)
+        g.attach_feature(IncrementalToposort())
+        for i in range(100):
+            order = g.toposort()
+            self.check_order(g, order)
+            node = order[rng.randint(len(order))]
+            j = rng.randint(len(node.inputs))
+            # Any variable that does not depend on node can be used.
+            candidates = [x, y, z] + [n.outputs[0] for n in order
+                                      if not depends(n, node)]
+            g.change_input(node, j, candidates[rng.randint(len(candidates))])
+
+    def test_cycle(self):
+        x, y, z = inputs()
+        a = sigmoid(x)
+        b = sigmoid(a)
+        g = FunctionGraph([x, y, z], [b], clone=False)
+        g.attach_feature(IncrementalToposort())
+        # A change making a cycle, reverted as by a failed validation.
+        g.change_input(a.owner, 0, b)
+        g.change_input(a.owner, 0, x)
+        assert g.toposort() == [a.owner, b.owner]
+
+    def test_orderings(self):
+        x, y, z = inputs()
+        a = sigmoid(x)
+        b = sigmoid(y)
+        g = FunctionGraph([x, y, z], [a, b], clone=False)
+        g.attach_feature(IncrementalToposort())
+        assert g.toposort() == [a.owner, b.owner]
+        g.attach_feature(Orderings(OrderedDict([(a.owner, [b.owner])])))
+        assert g.toposort() == [b.owner, a.owner]
+
+
+def depends(node, other):
+    # True if node is other or depends on it.
+    todo = [node]
+    seen = set()
+    while todo:
+        n = todo.pop()
+        if n is other:
+            return True
+        if n in seen:
+            continue
+        seen.add(n)
+        todo.extend(i.owner for i in n.inputs if i.owner is not None)
+    return False
@@ -3,6 +3,7 @@ import gc
 import sys
 import time
 import unittest
+import warnings
 
 from nose.plugins.skip import SkipTest
 import numpy as np
@@ -17,6 +18,7 @@ from theano.compile import Mode
 from theano import tensor
 from theano.ifelse import ifelse
 import theano
+from theano.tests import unittest_tools as utt
 
 
 class TestCallbacks(unittest.TestCase):
@@ -438,6 +440,140 @@ def test_reallocation():
                        itervalues(storage_map))) < len(storage_map)
 
 
+@theano.change_flags(**{'vm.memory_plan': True})
+def test_memory_plan():
+    x = tensor.specify_shape(tensor.matrix('x'), (10, 20))
+    w = tensor.specify_shape(
+        theano.shared(np.ones((20, 20), dtype=theano.config.floatX)),
+        (20, 20))
+    h = x
+    for i in range(4):
+        h = tensor.tanh(tensor.dot(h, w) * 2 + 1)
+        h = tensor.exp(h) + h
+    out = h.sum()
+    v = np.random.rand(10, 20).astype(theano.config.floatX)
+    expected = theano.function([x.owner.inputs[0]], out,
+                               mode=Mode(linker='py'))(v)
+    linkers = [vm.VM_Linker(allow_gc=False, use_cloop=False),
+               vm.VM_Linker(allow_gc=False, use_cloop=False, lazy=True)]
+    if theano.config.cxx:
+        linkers.append(vm.VM_Linker(allow_gc=False, use_cloop=True))
+    for lnk in linkers:
+        f = theano.function([x.owner.inputs[0]], out,
+                            mode=Mode(linker=lnk, optimizer='fast_run'))
+        plan = f.fn.memory_plan
+        assert plan is not None
+        assert len(plan.offsets) > 1
+        # The variables are not all alive at the same time
+        assert plan.size < plan.total_size()
+        for i in range(3):
+            utt.assert_allclose(f(v), expected)
+
+        # Two variables overlap only if one is not needed anymore when the
+        # other is computed.
+        order = f.fn.nodes
+        idx = dict((node, i) for i, node in enumerate(order))
+        last_use = dict((var, max([idx[c] for c, _ in var.clients
+                                   if c != 'output'] + [idx[var.owner]]))
+                        for var in plan.offsets)
+        items = list(plan.offsets.items())
+        for a, a_off in items:
+            a_end = a_off + np.prod(plan.shapes[a]) * np.dtype(
+                a.dtype).itemsize
+            for b, b_off in items:
+                b_end = b_off + np.prod(plan.shapes[b]) * np.dtype(
+                    b.dtype).itemsize
+                if a is not b and a_off < b_end and b_off < a_end:
+                    assert (last_use[a] < idx[b.owner] or
+                            last_use[b] < idx[a.owner])
+
+    # The plan is only done without gc
+    f = theano.function([x.owner.inputs[0]], out,
+                        mode=Mode(linker=vm.VM_Linker(allow_gc=True)))
+    assert f.fn.memory_plan is None
+
+
+def test_threaded_loop():
+    x = tensor.matrix('x')
+    y = tensor.matrix('y')
+    # Independent branches, with inplace ops
+    outs = [tensor.dot(tensor.tanh(x + i), y).sum(axis=0) * 2
+            for i in range(6)]
+    outs.append(tensor.exp(x) + y)
+    vx = np.random.rand(20, 20).astype(theano.config.floatX)
+    vy = np.random.rand(20, 20).astype(theano.config.floatX)
+    expected = theano.function([x, y], outs, mode=Mode(linker='py'))(vx, vy)
+    for allow_gc in [True, False]:
+        for threads in [1, 3]:
+            lnk = vm.VM_Linker(allow_gc=allow_gc, use_cloop=False,
+                               threads=threads)
+            f = theano.function([x, y], outs, mode=Mode(linker=lnk))
+            assert isinstance(f.fn, vm.ThreadedLoop)
+            for i in range(3):
+                for r, e in zip(f(vx, vy), expected):
+                    utt.assert_allclose(r, e)
+            if allow_gc:
+                for node in f.maker.fgraph.apply_nodes:
+                    for out in node.outputs:
+                        if out not in f.maker.fgraph.outputs:
+                            assert f.fn.storage_map[out][0] is None
+
+    # Errors are raised with the node that failed
+    lnk = vm.VM_Linker(use_cloop=False, threads=0)
+    a = tensor.vector('a')
+    f = theano.function([a, x], [tensor.exp(x), a + tensor.arange(3)],
+                        mode=Mode(linker=lnk))
+    try:
+        f(np.ones(4, dtype=theano.config.floatX), vx)
+        assert False
+    except ValueError as e:
+        assert 'Apply node that caused the error' in str(e)
+    f(np.ones(3, dtype=theano.config.floatX), vx)
+
+    # The thread time is reported in the profile
+    profile = theano.compile.ProfileStats(atexit_print=False)
+    f = theano.function([x, y], outs, mode=Mode(linker=lnk),
+                        profile=profile)
+    f(vx, vy)
+    assert 0 < sum(profile.vm_thread_time)
+
+
+def test_threaded_loop_nested():
+    # A function using the threaded linker called by a thunk running on the
+    # threads of the linker.
+    x = tensor.vector('x')
+    mode = Mode(linker=vm.VM_Linker(use_cloop=False, threads=0),
+                optimizer='fast_compile')
+    inner = theano.function([x], x * 2, mode=mode)
+
+    class CallInner(theano.Op):
+        __props__ = ()
+
+        def make_node(self, x):
+            return theano.Apply(self, [x], [x.type()])
+
+        def perform(self, node, inputs, outputs):
+            outputs[0][0] = inner(inputs[0])
+
+    f = theano.function([x], [CallInner()(x + i) for i in range(4)],
+                        mode=mode)
+    v = np.arange(3, dtype=theano.config.floatX)
+    for i, r in enumerate(f(v)):
+        utt.assert_allclose(r, (v + i) * 2)
+
+
+def test_threaded_loop_c_thunks_warning():
+    if theano.config.cxx == '':
+        raise SkipTest('need c++')
+    x = tensor.vector('x')
+    lnk = vm.VM_Linker(use_cloop=False, threads=2)
+    with warnings.catch_warnings(record=True) as w:
+        warnings.simplefilter('always')
+        theano.function([x], [tensor.exp(x), tensor.tanh(x)],
+                        mode=Mode(linker=lnk, optimizer='fast_compile'))
+    assert any('release the GIL' in str(i.message) for i in w)
+
+
 def test_no_recycling():
     if theano.config.cxx == '':
         raise SkipTest('need c++')
@@ -453,3 +589,68 @@ def test_no_recycling():
         m1 = f.fn.thunks[0].thunk.module
         m2 = f2.fn.thunks[0].thunk.module
         assert m1 is m2
+
+
+class AddOneTagged(theano.Op):
+    # The tag goes in the C code, so each instance needs its own module.
+
+    __props__ = ("tag",)
+
+    def __init__(self, tag):
+        self.tag = tag
+
+    def make_node(self, x):
+        x = tensor.as_tensor_variable(x)
+        assert x.dtype == 'float64'
+        return theano.Apply(self, [x], [x.type()])
+
+    def perform(self, node, inputs, outputs):
+        outputs[0][0] = inputs[0] + 1
+
+    def c_code_cache_version(self):
+        return ()
+
+    def c_code(self, node, name, inputs, outputs, sub):
+        x, = inputs
+        z, = outputs
+        fail = sub['fail']
+        tag = self.tag
+        return """
+        /* %(tag)s */
+        Py_XDECREF(%(z)s);
+        %(z)s = (PyArrayObject*)PyArray_NewCopy(%(x)s, NPY_CORDER);
+        if (!%(z)s)
+            %(fail)s
+        {
+            double* data = (double*)PyArray_DATA(%(z)s);
+            for (npy_intp i = 0; i < PyArray_SIZE(%(z)s); ++i)
+                data[i] += 1;
+        }
+        """ % locals()
+
+
+def test_parallel_compilation():
+    if theano.config.cxx == '':
+        raise SkipTest('need c++')
+    cache = theano.gof.cc.get_module_cache()
+    tag = 'test_parallel_compilation %f' % time.time()
+    x = tensor.dvector()
+    y = x
+    for i in range(3):
+        y = AddOneTagged('%s %d' % (tag, i))(y)
+    # The same module is needed twice, it must be compiled once.
+    y = AddOneTagged('%s %d' % (tag, 0))(y)
+
+    workers = theano.config.cmodule.compile_workers
+    nb_compiled = cache.stats[2]
+    try:
+        theano.config.cmodule.compile_workers = 3
+        mode = theano.Mode(optimizer=None, linker=vm.VM_Linker())
+        f = function([x], y, mode=mode)
+    finally:
+        theano.config.cmodule.compile_workers = workers
+    assert cache.stats[2] - nb_compiled == 3
+    assert np.allclose(f([1, 2]), [5, 6])
+
+    # Nothing is missing from the cache anymore.
+    assert theano.gof.cc.compile_nodes(f.maker.fgraph.toposort(), 3) == []
@@ -1,5 +1,6 @@
 from __future__ import absolute_import, print_function, division
 from functools import partial
+import bisect
 from collections import OrderedDict
 
 import sys
@@ -7,10 +8,12 @@ import time
 import inspect
 
 import numpy as np
-from six.moves import StringIO
+from six import iteritems
+from six.moves import StringIO, xrange
 
 import theano
 from theano import config
+from theano.compat import izip
 from theano.gof import graph
 
 
@@ -289,6 +292,18 @@ class Feature(object):
         """
         return OrderedDict()
 
+    def clone(self):
+        """
+        Called by FunctionGraph.clone. It should return the feature to
+        attach to the cloned FunctionGraph.
+
+        Features that keep state about the FunctionGraph they are attached
+        to should return a new instance. By default, the same instance is
+        attached to both FunctionGraphs.
+
+        """
+        return self
+
 
 class Bookkeeper(Feature):
 
@@ -661,6 +676,268 @@ class NodeFinder(Bookkeeper):
         return all
 
 
+class TopoOrder(object):
+    """
+    A topological order of Apply nodes, maintained as nodes and edges are
+    added and removed.
+
+    This is the algorithm of Pearce and Kelly ("A dynamic topological sort
+    algorithm for directed acyclic graphs", 2006). When an edge x -> y is
+    added while y is before x, only the nodes placed between y and x are
+    searched, for a path from y to x, and reordered if there is none.
+    Several edges can be added to the graph before they are added to the
+    order: the searches stay between y and x, where the edges not added
+    yet may lead, so the order stays valid for the edges already added.
+
+    The positions of the nodes are floats, also kept in the sorted list
+    `positions`, so that a new node can be placed right after its last
+    predecessor. `nodes` is the list of the nodes sorted by position.
+
+    The dependencies followed by the searches are given to `add_edge`, so
+    that the order can respect other dependencies than the data ones.
+
+    Parameters
+    ----------
+    nodes
+        Nodes in topological order.
+
+    """
+
+    def __init__(self, nodes=()):
+        self.reset(nodes)
+
+    def reset(self, nodes):
+        """Use the order of `nodes`, which must be topological."""
+        self.nodes = list(nodes)
+        self.positions = [float(i) for i in xrange(len(self.nodes))]
+        self.pos = dict(izip(self.nodes, self.positions))
+
+    def renumber(self):
+        """Spread the positions again, keeping the order."""
+        self.reset(self.nodes)
+
+    def insert(self, node, preds):
+        """
+        Place `node` right after the last of the nodes of `preds` that are
+        in the order, or first if there is none.
+
+        """
+        preds = list(preds)
+        while True:
+            positions = self.positions
+            after = [self.pos[p] for p in preds if p in self.pos]
+            if after:
+                lower = max(after)
+                i = bisect.bisect_right(positions, lower)
+            else:
+                i = 0
+                lower = positions[0] - 2. if positions else -1.
+            upper = positions[i] if i < len(positions) else lower + 2.
+            p = (lower + upper) / 2.
+            if lower < p < upper:
+                break
+            # No float left in between.
+            self.renumber()
+        positions.insert(i, p)
+        self.nodes.insert(i, node)
+        self.pos[node] = p
+
+    def remove(self, node):
+        i = bisect.bisect_left(self.positions, self.pos.pop(node))
+        del self.positions[i]
+        del self.nodes[i]
+
+    def add_edge(self, x, y, successors, predecessors):
+        """
+        Make `x` come before `y`.
+
+        Return False, and leave the order unchanged, if this would make a
+        cycle: `y` is `x` or `x` can be reached from `y`. The functions
+        `successors` and `predecessors` return the nodes following and
+        preceding a node in the graph.
+
+        """
+        pos = self.pos
+        lb = pos[y]
+        ub = pos[x]
+        if lb > ub:
+            return True
+        if x is y:
+            return False
+        # The nodes reachable from y, placed before x
+        forward = set([y])
+        stack = [y]
+        while stack:
+            for n in successors(stack.pop()):
+                if n is x:
+                    return False
+                p = pos.get(n)
+                if p is not None and lb < p < ub and n not in forward:
+                    forward.add(n)
+                    stack.append(n)
+        # The nodes x can be reached from, placed after y
+        backward = set([x])
+        stack = [x]
+        while stack:
+            for n in predecessors(stack.pop()):
+                if n in forward:
+                    # Only possible when the edges not added yet reach x.
+                    return False
+                p = pos.get(n)
+                if p is not None and lb < p < ub and n not in backward:
+                    backward.add(n)
+                    stack.append(n)
+        # Give their positions to the backward nodes first, then to the
+        # forward ones, keeping the order of each group.
+        moved = (sorted(backward, key=pos.get) +
+                 sorted(forward, key=pos.get))
+        slots = sorted(pos[n] for n in moved)
+        for n, p in izip(moved, slots):
+            pos[n] = p
+            self.nodes[bisect.bisect_left(self.positions, p)] = n
+        return True
+
+
+def data_successors(node):
+    """Return the Apply nodes that use an output of `node`."""
+    for out in node.outputs:
+        for client, _ in out.clients:
+            if client != 'output':
+                yield client
+
+
+def data_predecessors(node):
+    """Return the Apply nodes that compute an input of `node`."""
+    for inp in node.inputs:
+        if inp.owner is not None:
+            yield inp.owner
+
+
+class IncrementalToposort(Feature):
+    """
+    Keep a topological order of the nodes of a FunctionGraph up to date.
+
+    An imported node is put just after the last of its inputs, so
+    replacing a variable by a new graph built from the same inputs seldom
+    breaks the order. When `change_input` adds a dependency that goes
+    against the order, only the nodes between the two ends of that
+    dependency that are connected to them are moved (see `TopoOrder`).
+
+    Once attached, `FunctionGraph.toposort` returns this order, fixed to
+    respect the orderings of the other features, instead of sorting the
+    whole graph again.
+
+    """
+
+    def __init__(self):
+        self.fgraph = None
+        # A TopoOrder, None when the whole graph must be sorted again.
+        self.topo_order = None
+
+    def on_attach(self, fgraph):
+        if (self.fgraph is not None or
+                hasattr(fgraph, 'incremental_toposort')):
+            raise AlreadyThere("IncrementalToposort is already present or "
+                               "in conflict with another plugin.")
+        self.fgraph = fgraph
+        fgraph.incremental_toposort = self
+        self.reset()
+
+    def clone(self):
+        return IncrementalToposort()
+
+    def on_detach(self, fgraph):
+        if self.fgraph is not fgraph:
+            raise Exception("This IncrementalToposort instance was not "
+                            "attached to the provided fgraph.")
+        self.fgraph = None
+        self.topo_order = None
+        del fgraph.incremental_toposort
+
+    def reset(self):
+        """
+        Sort the whole graph again.
+
+        """
+        fgraph = self.fgraph
+        self.topo_order = TopoOrder(graph.io_toposort(fgraph.inputs,
+                                                      fgraph.outputs))
+
+    def on_import(self, fgraph, node, reason):
+        order = self.topo_order
+        if order is None:
+            return
+        # The outputs of an imported node have no clients yet, unless
+        # they were still known to the graph when one of their clients was
+        # imported. Sort the whole graph again in that rare case.
+        for client in data_successors(node):
+            if client in order.pos:
+                self.topo_order = None
+                return
+        order.insert(node, data_predecessors(node))
+
+    def on_prune(self, fgraph, node, reason):
+        if self.topo_order is not None:
+            self.topo_order.remove(node)
+
+    def on_change_input(self, fgraph, node, i, r, new_r, reason=None):
+        if (self.topo_order is None or node == 'output' or
+                new_r.owner is None):
+            return
+        if not self.topo_order.add_edge(new_r.owner, node, data_successors,
+                                        data_predecessors):
+            # The change introduced a cycle. It should be reverted, so
+            # the next toposort will sort the whole graph again.
+            self.topo_order = None
+
+    def data_toposort(self):
+        """
+        Return the nodes in an order that respects their data dependencies.
+
+        This is the order `graph.io_toposort(fgraph.inputs, fgraph.outputs)`
+        would respect, without the orderings of the features.
+
+        """
+        if self.topo_order is None:
+            self.reset()
+        return list(self.topo_order.nodes)
+
+    def toposort(self, orderings):
+        """
+        Return the nodes in an order that respects their data dependencies
+        and `orderings`, as returned by `FunctionGraph.orderings`.
+
+        """
+        if self.topo_order is None:
+            self.reset()
+        order = self.topo_order
+        # The orderings already added to the order are followed by the
+        # searches too.
+        succ = {}
+        pred = {}
+
+        def successors(node):
+            for client in data_successors(node):
+                yield client
+            for client in succ.get(node, ()):
+                yield client
+
+        def predecessors(node):
+            for owner in data_predecessors(node):
+                yield owner
+            for owner in pred.get(node, ()):
+                yield owner
+
+        for node, prereqs in iteritems(orderings):
+            for prereq in prereqs:
+                if not order.add_edge(prereq, node, successors,
+                                      predecessors):
+                    raise ValueError('graph contains cycles')
+                succ.setdefault(prereq, []).append(node)
+                pred.setdefault(node, []).append(prereq)
+        return list(order.nodes)
+
+
 class PrintListener(Feature):
 
     def __init__(self, active=True):
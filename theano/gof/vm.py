@@ -10,16 +10,22 @@ from __future__ import absolute_import, print_function, division
 from . import link
 from collections import defaultdict
 import logging
+import multiprocessing
+from multiprocessing.pool import ThreadPool
 import sys
+import threading
 import time
 import warnings
 
+import numpy as np
+
 from theano.configparser import (config, _config_var_list)
 
 import theano.gof.cmodule
 
 from six import iteritems, itervalues
 from six.moves import xrange
+from six.moves._thread import get_ident
 
 logger = logging.getLogger(__name__)
 
@@ -113,6 +119,169 @@ def calculate_reallocate_info(order, fgraph, storage_map, compute_map_re,
     return reallocated_info
 
 
+class MemoryPlan(object):
+    """
+    Static assignment of intermediate results into one preallocated buffer.
+
+    Each planned variable gets an offset in the buffer (the arena). Two
+    variables overlap in the arena only if one of them is computed after
+    all the uses of the other in every valid execution order.
+
+    Parameters
+    ----------
+    offsets
+        Dict variable -> offset in bytes of its value in the arena.
+    shapes
+        Dict variable -> static shape of its value.
+    size
+        Size in bytes of the arena.
+
+    """
+    alignment = 64
+
+    def __init__(self, offsets, shapes, size):
+        self.offsets = offsets
+        self.shapes = shapes
+        self.size = size
+
+    def total_size(self):
+        """
+        Return the memory needed by the planned variables without the plan.
+
+        """
+        return sum(_nbytes(var, shape) for var, shape in iteritems(self.shapes))
+
+    def allocate(self):
+        """
+        Allocate an arena and return a dict variable -> ndarray, where the
+        ndarray is the view of the arena that holds the variable value.
+
+        """
+        buf = np.empty(self.size + self.alignment, dtype='uint8')
+        start = -buf.ctypes.data % self.alignment
+        arena = buf[start:start + self.size]
+        return dict((var, np.ndarray(self.shapes[var], dtype=var.type.dtype,
+                                     buffer=arena, offset=offset))
+                    for var, offset in iteritems(self.offsets))
+
+
+def _nbytes(var, shape):
+    return int(np.prod(shape, dtype='int64')) * np.dtype(var.type.dtype).itemsize
+
+
+def _static_shape(fgraph, var):
+    # Return the shape of var if the ShapeFeature can infer it as constants.
+    shape = fgraph.shape_feature.shape_of.get(var)
+    if shape is None:
+        return None
+    try:
+        return tuple(int(theano.tensor.get_scalar_constant_value(s))
+                     for s in shape)
+    except theano.tensor.NotScalarConstantError:
+        return None
+
+
+def plan_memory(order, fgraph, exclude=()):
+    """
+    Plan the memory of the intermediate results of `fgraph`.
+
+    Only the dense tensors whose shape the ShapeFeature infers as constants
+    are planned. The variables that are, or are aliased (through the
+    view_map and destroy_map of the ops) to, an input or output of `fgraph`
+    or a variable in `exclude` are not planned.
+
+    Parameters
+    ----------
+    order
+        The order of execution of the nodes. The plan is valid for any other
+        topological order, so it can be used by the lazy VMs.
+    fgraph
+        The FunctionGraph to plan.
+    exclude
+        Variables that must not be planned.
+
+    Returns
+    -------
+    MemoryPlan or None
+        None if the ShapeFeature is not attached to `fgraph`.
+
+    """
+    if not hasattr(fgraph, 'shape_feature'):
+        return None
+    index = dict((node, i) for i, node in enumerate(order))
+
+    # ancestors[i] is the bit set of the nodes that are computed before
+    # order[i] in every execution order.
+    ancestors = []
+    for node in order:
+        anc = 0
+        for inp in node.inputs:
+            if inp.owner is not None:
+                j = index[inp.owner]
+                anc |= ancestors[j] | (1 << j)
+        ancestors.append(anc)
+
+    # Group the variables that share the storage of the same root variable.
+    root_of = {}
+    unplannable = set(exclude)
+    unplannable.update(fgraph.outputs)
+    uses = {}
+    for i, node in enumerate(order):
+        dmap = getattr(node.op, 'destroy_map', {})
+        vmap = getattr(node.op, 'view_map', {})
+        for inp in node.inputs:
+            root = root_of.get(inp, inp)
+            uses[root] = uses.get(root, 0) | (1 << i)
+        for idx, out in enumerate(node.outputs):
+            aliased = dmap.get(idx, []) + vmap.get(idx, [])
+            if not aliased:
+                continue
+            roots = [root_of.get(node.inputs[j], node.inputs[j])
+                     for j in aliased]
+            root_of[out] = roots[0]
+            if len(roots) > 1:
+                unplannable.update(roots)
+    for var, root in iteritems(root_of):
+        if var in unplannable:
+            unplannable.add(root)
+
+    shapes = {}
+    nbytes = {}
+    for node in order:
+        for out in node.outputs:
+            if (out in root_of or out in unplannable or
+                    not isinstance(out.type, theano.tensor.TensorType)):
+                continue
+            shape = _static_shape(fgraph, out)
+            if shape is None or not _nbytes(out, shape):
+                continue
+            shapes[out] = shape
+            nbytes[out] = _nbytes(out, shape)
+            uses[out] = uses.get(out, 0) | (1 << index[node])
+
+    def disjoint(a, b):
+        # True if the lifetimes of a and b never overlap.
+        return ((ancestors[index[b.owner]] & uses[a]) == uses[a] or
+                (ancestors[index[a.owner]] & uses[b]) == uses[b])
+
+    # Place the largest variables first, each one at the lowest offset that
+    # does not overlap a placed variable whose lifetime overlaps its own.
+    align = MemoryPlan.alignment
+    offsets = {}
+    size = 0
+    for var in sorted(shapes, key=lambda v: (-nbytes[v], index[v.owner])):
+        taken = sorted((offsets[other], offsets[other] + nbytes[other])
+                       for other in offsets if not disjoint(var, other))
+        offset = 0
+        for begin, end in taken:
+            if offset + nbytes[var] <= begin:
+                break
+            offset = max(offset, -(-end // align) * align)
+        offsets[var] = offset
+        size = max(size, offset + nbytes[var])
+    return MemoryPlan(offsets, shapes, size)
+
+
 class VM(object):
     """
     A VM object's __call__ method evaluates a Theano program.
@@ -150,8 +319,17 @@ class VM(object):
         True indicates that Function.__call__ must implement the feedback from
         output storage to input storage. False means it *must not* repeat that
         feedback.
+    timeline
+        None, or a deque to which the Python VMs append a tuple (node,
+        start, end, thread ident) for each thunk they run, and one with
+        node None for each of their calls (see config.profiling.timeline).
+    memory
+        None, or a MeasuredMemory the Stack VM tells about each call and
+        each node it runs (see config.profiling.measure_memory).
 
     """
+    timeline = None
+    memory = None
 
     def __init__(self, nodes, thunks, pre_call_clear):
 
@@ -234,7 +412,10 @@ class Loop(VM):
     allow_gc = False
 
     def __call__(self):
-        if self.time_thunks:
+        if self.time_thunks or self.timeline is not None:
+            timeline = self.timeline
+            ident = get_ident()
+            t_call = time.time()
             for cont in self.pre_call_clear:
                 cont[0] = None
             try:
@@ -243,10 +424,15 @@ class Loop(VM):
                     t0 = time.time()
                     thunk()
                     t1 = time.time()
-                    self.call_counts[i] += 1
-                    self.call_times[i] += t1 - t0
+                    if self.time_thunks:
+                        self.call_counts[i] += 1
+                        self.call_times[i] += t1 - t0
+                    if timeline is not None:
+                        timeline.append((node, t0, t1, ident))
             except:
                 link.raise_with_op(node, thunk)
+            if timeline is not None:
+                timeline.append((None, t_call, time.time(), ident))
         else:
             for cont in self.pre_call_clear:
                 cont[0] = None
@@ -273,7 +459,10 @@ class LoopGC(VM):
             raise ValueError()
 
     def __call__(self):
-        if self.time_thunks:
+        if self.time_thunks or self.timeline is not None:
+            timeline = self.timeline
+            ident = get_ident()
+            t_call = time.time()
             for cont in self.pre_call_clear:
                 cont[0] = None
             try:
@@ -284,13 +473,18 @@ class LoopGC(VM):
                     t0 = time.time()
                     thunk()
                     t1 = time.time()
-                    self.call_counts[i] += 1
-                    self.call_times[i] += t1 - t0
+                    if self.time_thunks:
+                        self.call_counts[i] += 1
+                        self.call_times[i] += t1 - t0
+                    if timeline is not None:
+                        timeline.append((node, t0, t1, ident))
                     for old_s in old_storage:
                         old_s[0] = None
                     i += 1
             except:
                 link.raise_with_op(node, thunk)
+            if timeline is not None:
+                timeline.append((None, t_call, time.time(), ident))
         else:
             for cont in self.pre_call_clear:
                 cont[0] = None
@@ -304,6 +498,175 @@ class LoopGC(VM):
                 link.raise_with_op(node, thunk)
 
 
+# Thread pools of the ThreadedLoop VMs, by number of threads.
+_thread_pools = {}
+_thread_pools_lock = threading.Lock()
+# Set in the threads of the pools.
+_vm_thread = threading.local()
+
+
+def _get_thread_pool(n_threads):
+    with _thread_pools_lock:
+        pool = _thread_pools.get(n_threads)
+        if pool is None:
+            pool = ThreadPool(n_threads)
+            _thread_pools[n_threads] = pool
+        return pool
+
+
+class ThreadedLoop(VM):
+    """
+    Unconditional execution of the thunks by a pool of threads.
+
+    A node is run as soon as the nodes it depends on are done, either
+    through its inputs or through the orderings of the graph (like the ones
+    of the DestroyHandler). The thunks of independent nodes that release the
+    GIL (like the numpy implementations of dot or of large elemwise
+    operations) thus run concurrently. The C thunks of the CPU ops keep the
+    GIL, so they do not run concurrently.
+
+    Parameters
+    ----------
+    predecessors
+        For each node, the indices of the nodes that must be done before it
+        runs.
+    gc_inputs
+        None, or for each node the storage of its inputs that can be freed
+        when all the nodes that use them are done.
+    n_threads
+        The number of threads.
+
+    """
+
+    def __init__(self, nodes, thunks, pre_call_clear, predecessors,
+                 gc_inputs, n_threads):
+        super(ThreadedLoop, self).__init__(nodes, thunks, pre_call_clear)
+        if len(predecessors) != len(nodes):
+            raise ValueError()
+        self.allow_gc = gc_inputs is not None
+        self.gc_inputs = gc_inputs
+        self.n_threads = n_threads
+        self.n_predecessors = [len(p) for p in predecessors]
+        self.successors = [[] for node in nodes]
+        for i, preds in enumerate(predecessors):
+            for j in preds:
+                self.successors[j].append(i)
+        self.first = [i for i, n in enumerate(self.n_predecessors) if n == 0]
+        # id of the storage -> number of nodes that use it
+        self.n_users = {}
+        if gc_inputs is not None:
+            for storages in gc_inputs:
+                for s in storages:
+                    self.n_users[id(s)] = self.n_users.get(id(s), 0) + 1
+        # thread ident -> time spent in thunks, when time_thunks is True
+        self.thread_times = {}
+        self._cond = threading.Condition()
+
+    def __call__(self):
+        t_call = time.time()
+        for cont in self.pre_call_clear:
+            cont[0] = None
+        self._users_left = dict(self.n_users)
+        self._error = None
+        if getattr(_vm_thread, 'running', False):
+            # We are called from a thunk run by a pool, like the inner
+            # function of a Scan. Waiting for the pool could deadlock.
+            for i in xrange(len(self.nodes)):
+                if not self._run_node(i):
+                    break
+                self._done(i, False)
+        else:
+            self._preds_left = list(self.n_predecessors)
+            self._pending = len(self.first)
+            pool = _get_thread_pool(self.n_threads)
+            with self._cond:
+                for i in self.first:
+                    pool.apply_async(self._run_from, (i, pool))
+                while self._pending:
+                    self._cond.wait()
+        if self._error is not None:
+            i, exc_info = self._error
+            self._error = None
+            link.raise_with_op(self.nodes[i], self.thunks[i], exc_info)
+        if self.timeline is not None:
+            self.timeline.append((None, t_call, time.time(), get_ident()))
+
+    def _run_node(self, i):
+        # Run the thunk of node i, return False if it failed.
+        try:
+            if self.time_thunks or self.timeline is not None:
+                t0 = time.time()
+                self.thunks[i]()
+                t1 = time.time()
+                dt = t1 - t0
+                ident = get_ident()
+                if self.timeline is not None:
+                    self.timeline.append((self.nodes[i], t0, t1, ident))
+                if self.time_thunks:
+                    with self._cond:
+                        self.call_counts[i] += 1
+                        self.call_times[i] += dt
+                        self.thread_times[ident] = (
+                            self.thread_times.get(ident, 0) + dt)
+            else:
+                self.thunks[i]()
+            return True
+        except:
+            self._error = (i, sys.exc_info())
+            return False
+
+    def _done(self, i, schedule=True):
+        # Free the inputs of node i that are not needed anymore and, if
+        # schedule is True, return the nodes that can run now. The caller
+        # must hold self._cond or be the only thread running nodes.
+        if self.gc_inputs is not None:
+            users_left = self._users_left
+            for s in self.gc_inputs[i]:
+                users_left[id(s)] -= 1
+                if not users_left[id(s)]:
+                    s[0] = None
+        ready = []
+        if schedule:
+            preds_left = self._preds_left
+            for j in self.successors[i]:
+                preds_left[j] -= 1
+                if not preds_left[j]:
+                    ready.append(j)
+        return ready
+
+    def _run_from(self, i, pool):
+        # Run node i, then keep running one of the nodes it made ready and
+        # give the others to the pool.
+        _vm_thread.running = True
+        while i is not None:
+            ok = self._error is None and self._run_node(i)
+            with self._cond:
+                done, i = i, None
+                if ok and self._error is None:
+                    ready = self._done(done)
+                    if ready:
+                        i = ready[0]
+                        self._pending += len(ready) - 1
+                        for j in ready[1:]:
+                            pool.apply_async(self._run_from, (j, pool))
+                if i is None:
+                    self._pending -= 1
+                    if not self._pending:
+                        self._cond.notify()
+
+    def update_profile(self, profile):
+        super(ThreadedLoop, self).update_profile(profile)
+        # The busiest thread first
+        times = sorted(itervalues(self.thread_times), reverse=True)
+        times += [0.] * (self.n_threads - len(times))
+        if len(profile.vm_thread_time) < len(times):
+            extra = len(times) - len(profile.vm_thread_time)
+            profile.vm_thread_time += [0.] * extra
+        for j, t in enumerate(times):
+            profile.vm_thread_time[j] += t
+        self.thread_times = {}
+
+
 class Stack(VM):
     """
     Finish-to-start evalution order of thunks.
@@ -396,6 +759,11 @@ class Stack(VM):
         # Profile output looks buggy if a node has run but takes 0 time.
         # (and profile code might hide real bugs if it rounds up 0)
         dt = max(time.time() - t0, 1e-10)
+        if self.timeline is not None:
+            self.timeline.append((node, t0, t0 + dt, get_ident()))
+        if self.memory is not None and not rval:
+            # The lazy thunks return the inputs they still need
+            self.memory.node_done(node, self.thunks[idx])
         if self.callback is not None:
             self.callback(
                 node=node,
@@ -406,6 +774,7 @@ class Stack(VM):
         return rval, dt
 
     def __call__(self, output_subset=None):
+        t_call = time.time()
         storage_map = self.storage_map
         compute_map = self.compute_map
         thunks = self.thunks
@@ -415,6 +784,8 @@ class Stack(VM):
 
         for cont in self.pre_call_clear:
             cont[0] = None
+        if self.memory is not None:
+            self.memory.start_call(storage_map)
 
         for k in self.storage_map:
             compute_map[k][0] = (k.owner is None)
@@ -490,8 +861,9 @@ class Stack(VM):
                         del _
                         if config.profile or config.print_global_stats:
                             current_idx = self.node_idx[current_apply]
-                            self.call_counts[current_idx] += 1
-                            self.call_times[current_idx] += dt
+                            if self.time_thunks:
+                                self.call_counts[current_idx] += 1
+                                self.call_times[current_idx] += dt
                             # Computing the memory footprint of the the op
                             # ?? What about inplace .. if the op is inplace
                             # you don't actually ask for more memory!
@@ -585,9 +957,10 @@ class Stack(VM):
 
                 try:
                     requires, dt = self.run_thunk_of_node(current_apply)
-                    current_idx = self.node_idx[current_apply]
-                    self.call_counts[current_idx] += 1
-                    self.call_times[current_idx] += dt
+                    if self.time_thunks:
+                        current_idx = self.node_idx[current_apply]
+                        self.call_counts[current_idx] += 1
+                        self.call_times[current_idx] += dt
 
                 except Exception:
                     link.raise_with_op(
@@ -663,6 +1036,8 @@ class Stack(VM):
                         compute_map[v][0] = 2
 
         self.node_cleared_order.append(final_index)
+        if self.timeline is not None:
+            self.timeline.append((None, t_call, time.time(), get_ident()))
 
 
 try:
@@ -723,12 +1098,17 @@ class VM_Linker(link.LocalLinker):
     allow_partial_eval
         If True, enforces usage of Stack or CVM, to allow for partial
         evaluation of functions (calculating a subset of outputs).
+    threads
+        If not None, run the thunks of independent nodes concurrently on
+        that many threads (see ThreadedLoop). 0 means the value of the
+        Theano flag vm.threads. Lazy graphs, callbacks and partial
+        evaluation still use the Stack VM.
 
     """
 
     def __init__(self, allow_gc=None, use_cloop=False, callback=None,
                  callback_input=None, lazy=None, schedule=None,
-                 c_thunks=None, allow_partial_eval=None):
+                 c_thunks=None, allow_partial_eval=None, threads=None):
         # Note: if more parameters are added to __init__, make sure to forward
         # them in the "type(self)(...)" call in the "accept" method below.
         if allow_gc is None:
@@ -743,6 +1123,7 @@ class VM_Linker(link.LocalLinker):
             c_thunks = bool(theano.config.cxx)
         self.c_thunks = c_thunks
         self.allow_partial_eval = allow_partial_eval
+        self.threads = threads
         self.updated_vars = {}
         if schedule:
             self.schedule = schedule
@@ -805,7 +1186,8 @@ class VM_Linker(link.LocalLinker):
                 lazy=self.lazy,
                 schedule=self.schedule,
                 c_thunks=self.c_thunks,
-                allow_partial_eval=self.allow_partial_eval
+                allow_partial_eval=self.allow_partial_eval,
+                threads=self.threads
             ).accept(fgraph, no_recycling, profile)
         self.fgraph = fgraph
         self.no_recycling = no_recycling
@@ -864,6 +1246,40 @@ class VM_Linker(link.LocalLinker):
                 dependencies[k] += ls
         return dependencies
 
+    def make_threaded_loop(self, nodes, thunks, pre_call_clear,
+                           storage_map, computed):
+        n_threads = (self.threads or config.vm.threads or
+                     multiprocessing.cpu_count())
+        # The C thunks of the CPU ops keep the GIL while they run, so
+        # with only them the nodes are run one at a time.
+        if len(thunks) > 1 and all(hasattr(t, 'cthunk') for t in thunks):
+            warnings.warn(
+                "The threaded VM_Linker runs the nodes concurrently only "
+                "when their thunks release the GIL, but all the thunks of "
+                "this graph are C thunks that keep it. The nodes will be "
+                "run one at a time. Use the cvm linker instead.",
+                stacklevel=2)
+        ords = self.fgraph.orderings()
+        idx = dict((node, i) for i, node in enumerate(nodes))
+        predecessors = []
+        for node in nodes:
+            preds = set(idx[i.owner] for i in node.inputs
+                        if i.owner is not None)
+            preds.update(idx[n] for n in ords.get(node, []))
+            predecessors.append(sorted(preds))
+        gc_inputs = None
+        if self.allow_gc:
+            gc_inputs = []
+            for node in nodes:
+                storages = []
+                for i in node.inputs:
+                    if (i in computed and i not in self.fgraph.outputs and
+                            not any(s is storage_map[i] for s in storages)):
+                        storages.append(storage_map[i])
+                gc_inputs.append(storages)
+        return ThreadedLoop(nodes, thunks, pre_call_clear, predecessors,
+                            gc_inputs, n_threads)
+
     def make_vm(self, nodes, thunks,
                 input_storage, output_storage, storage_map,
                 post_thunk_clear,
@@ -873,10 +1289,14 @@ class VM_Linker(link.LocalLinker):
                 ):
 
         pre_call_clear = [storage_map[v] for v in self.no_recycling]
+        timeline = getattr(self.profile, 'timeline', None) is not None
+        memory = getattr(self.profile, 'measured_memory', None)
 
         if (self.callback is not None or self.callback_input is not None or
                 ((config.profile or config.print_global_stats) and config.profile_memory) or
-                (self.allow_partial_eval and not self.use_cloop)):
+                (self.allow_partial_eval and not self.use_cloop) or
+                (timeline and self.use_cloop and self.threads is None) or
+                memory is not None):
 
             if self.use_cloop and (self.callback is not None or
                                    self.callback_input is not None):
@@ -884,6 +1304,12 @@ class VM_Linker(link.LocalLinker):
             if self.use_cloop and config.profile_memory:
                 warnings.warn(
                     'CVM does not support memory profile, using Stack VM.')
+            elif self.use_cloop and timeline:
+                warnings.warn(
+                    'CVM does not support the timeline, using Stack VM.')
+            elif self.use_cloop and memory is not None:
+                warnings.warn(
+                    'CVM does not measure the memory, using Stack VM.')
             if not self.use_cloop and self.allow_partial_eval:
                 warnings.warn(
                     'LoopGC does not support partial evaluation, '
@@ -898,7 +1324,8 @@ class VM_Linker(link.LocalLinker):
                 dependencies=deps,
                 callback=self.callback,
                 callback_input=self.callback_input)
-        elif self.use_cloop:
+            vm.memory = memory
+        elif self.use_cloop and self.threads is None:
             # create a map from nodes to ints and vars to ints
             nodes_idx = {}
             vars_idx = {}
@@ -1007,6 +1434,9 @@ class VM_Linker(link.LocalLinker):
                 dependencies=dependency_map_list,
             )
             assert c0 == sys.getrefcount(node_n_inputs)
+            # The C code reads this list at each call, Function.__call__
+            # edits it to keep the output buffers of the caller.
+            vm.pre_call_clear = pre_call_clear
         else:
             lazy = self.lazy
             if lazy is None:
@@ -1015,7 +1445,11 @@ class VM_Linker(link.LocalLinker):
                 lazy = not all([(not th.lazy) for th in thunks])
             if not lazy:
                 # there is no conditional in the graph
-                if self.allow_gc:
+                if self.threads is not None:
+                    vm = self.make_threaded_loop(nodes, thunks,
+                                                 pre_call_clear,
+                                                 storage_map, computed)
+                elif self.allow_gc:
                     vm = LoopGC(
                         nodes,
                         thunks,
@@ -1071,6 +1505,11 @@ class VM_Linker(link.LocalLinker):
         impl = None
         if self.c_thunks is False:
             impl = 'py'
+        elif config.cxx and config.cmodule.compile_workers > 1:
+            # Compile all the missing C modules concurrently. The
+            # make_thunk calls below then find them in the cache.
+            theano.gof.cc.compile_nodes(order, config.cmodule.compile_workers,
+                                        storage_map, compute_map)
         for node in order:
             try:
                 thunk_start = time.time()
@@ -1108,10 +1547,28 @@ class VM_Linker(link.LocalLinker):
         if lazy is None:
             lazy = not all([(not th.lazy) for th in thunks])
         if not (lazy or ((config.profile or config.print_global_stats) and config.profile_memory) or
-                self.use_cloop or self.callback or self.callback_input):
+                self.use_cloop or self.callback or self.callback_input or
+                self.threads is not None):
             for pair in itervalues(reallocated_info):
                 storage_map[pair[1]] = storage_map[pair[0]]
 
+        memory_plan = None
+        if config.vm.memory_plan and not self.allow_gc:
+            # Without gc, the storage of the intermediate results is kept
+            # between calls and the ops that can reuse it write in place.
+            # Fill it with the views of one arena.
+            no_recycling = set(id(s) for s in self.no_recycling)
+            exclude = [v for v in storage_map
+                       if id(storage_map[v]) in no_recycling]
+            for pair in itervalues(reallocated_info):
+                exclude.extend(pair)
+            memory_plan = plan_memory(order, fgraph, exclude)
+            if memory_plan is not None:
+                for var, value in iteritems(memory_plan.allocate()):
+                    storage_map[var][0] = value
+                if self.profile:
+                    self.profile.memory_plan = memory_plan
+
         computed, last_user = link.gc_helper(order)
         if self.allow_gc:
             post_thunk_clear = []
@@ -1137,6 +1594,8 @@ class VM_Linker(link.LocalLinker):
 
         vm.storage_map = storage_map
         vm.compute_map = compute_map
+        vm.memory_plan = memory_plan
+        vm.timeline = getattr(self.profile, 'timeline', None)
 
         return (vm,
                 [link.Container(input, storage)
@@ -1154,3 +1613,5 @@ class VM_Linker(link.LocalLinker):
             self.allow_partial_eval = None
         if not hasattr(self, 'callback_input'):
             self.callback_input = None
+        if not hasattr(self, 'threads'):
+            self.threads = None
@@ -520,7 +520,7 @@ class GpuCAReduceCuda(GpuKernelBase, HideC, CAReduceDtype):
         return "GpuCAReduceCuda{%s%s}%s" % (pre, str(self.scalar_op), ax)
 
     def __setstate__(self, d):
-        self.__dict__.update(d)
+        super(GpuCAReduceCuda, self).__setstate__(d)
         # For unpickling of old ops.
         if not hasattr(self, "pre_scalar_op"):
             self.pre_scalar_op = None
@@ -0,0 +1,93 @@
+#!/usr/bin/env python
+"""
+Compare the number of calls per second of tiny Theano functions called in
+a Python loop and with `Function.call_many`, with and without
+`Function.trust_input`.
+"""
+from __future__ import absolute_import, print_function, division
+
+import time
+from optparse import OptionParser
+
+import numpy as np
+
+import theano
+import theano.tensor as T
+from theano import config
+
+
+def build_scalar():
+    x = T.scalar('x')
+    y = T.scalar('y')
+    return [x, y], x * y + 1
+
+
+def build_vector():
+    x = T.vector('x')
+    y = T.vector('y')
+    return [x, y], T.exp(x) + y
+
+
+def build_dot():
+    x = T.matrix('x')
+    w = theano.shared(np.ones((4, 4), dtype=config.floatX), 'w')
+    y = T.vector('y')
+    return [x, y], T.tanh(T.dot(x, w) + y).sum()
+
+
+builders = {'scalar': (build_scalar, [(), ()]),
+            'vector': (build_vector, [(10,), (10,)]),
+            'dot': (build_dot, [(4, 4), (4,)])}
+
+
+def calls_per_second(name, n_calls, linker):
+    """
+    Return the number of calls per second of the function `name` called
+    in a loop and with call_many, without and with trust_input.
+
+    """
+    build, shapes = builders[name]
+    inputs, output = build()
+    f = theano.function(inputs, output,
+                        mode=theano.compile.Mode(linker=linker))
+    rng = np.random.RandomState(0)
+    args = [tuple(np.asarray(rng.rand(*shape), dtype=config.floatX)
+                  for shape in shapes)
+            for i in range(n_calls)]
+    rates = []
+    for trust_input in [False, True]:
+        f.trust_input = trust_input
+        t0 = time.time()
+        for a in args:
+            f(*a)
+        t1 = time.time()
+        f.call_many(args)
+        t2 = time.time()
+        rates += [n_calls / (t1 - t0), n_calls / (t2 - t1)]
+    return rates
+
+
+parser = OptionParser(
+    usage='%prog <options>\nCompare the number of calls per second of '
+    'tiny functions called in a loop and with Function.call_many.')
+parser.add_option('-g', '--graphs', action='store', dest='graphs',
+                  default='scalar,vector,dot', type="string",
+                  help="Comma separated list of graphs, among %s" %
+                  ', '.join(sorted(builders)))
+parser.add_option('-n', '--calls', action='store', dest='calls',
+                  default=20000, type="int",
+                  help="Number of calls")
+parser.add_option('-l', '--linker', action='store', dest='linker',
+                  default=config.linker, type="string",
+                  help="The linker to use")
+
+if __name__ == '__main__':
+    options, arguments = parser.parse_args()
+    print("Calls per second, linker %s" % options.linker)
+    print("%-8s %10s %10s %10s %10s" % ('', 'loop', 'call_many',
+                                        'loop', 'call_many'))
+    print("%-8s %21s %21s" % ('graph', '', 'trust_input'))
+    for name in options.graphs.split(','):
+        print("%-8s %10.0f %10.0f %10.0f %10.0f" % (
+            (name,) + tuple(calls_per_second(name, options.calls,
+                                             options.linker))))
@@ -0,0 +1,112 @@
+#!/usr/bin/env python
+"""
+Compile the training function of a logistic regression for several values
+of its learning rate and weight decay, as done by a hyper-parameter sweep,
+and report how often the C modules were found in the cache by their key,
+with and without the Theano flag cmodule.hoist_constants.
+
+Each run is done in a new process with an empty compiledir.
+"""
+from __future__ import absolute_import, print_function, division
+
+import json
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+from optparse import OptionParser
+
+
+def sweep(n_values, linker):
+    """
+    Compile the functions of the sweep and return the number of functions,
+    of C module lookups, of new keys, of compiled modules and the time.
+
+    """
+    import numpy as np
+    import theano
+    import theano.tensor as T
+    from theano.gof.cc import get_module_cache
+
+    cache = get_module_cache()
+    lookups = [0]
+    module_from_key = cache.module_from_key
+
+    def counted_module_from_key(*args, **kwargs):
+        lookups[0] += 1
+        return module_from_key(*args, **kwargs)
+    cache.module_from_key = counted_module_from_key
+
+    x = T.matrix('x')
+    y = T.vector('y')
+    w = theano.shared(np.zeros(20, dtype=theano.config.floatX), 'w')
+    b = theano.shared(np.asarray(0., dtype=theano.config.floatX), 'b')
+    mode = theano.compile.Mode(linker=linker, optimizer='fast_run')
+    n_keys = len(cache.entry_from_key)
+    n_functions = 0
+    t0 = time.time()
+    for lr in np.logspace(-4, -1, n_values):
+        for wd in [0, 1e-4, 1e-3]:
+            p = T.nnet.sigmoid(T.dot(x, w) + b)
+            cost = (T.nnet.binary_crossentropy(p, y).mean() +
+                    wd * (w ** 2).sum())
+            gw, gb = T.grad(cost, [w, b])
+            theano.function([x, y], cost, mode=mode,
+                            updates=[(w, w - lr * gw), (b, b - lr * gb)])
+            n_functions += 1
+    return dict(functions=n_functions, lookups=lookups[0],
+                keys=len(cache.entry_from_key) - n_keys,
+                compiled=cache.stats[2], time=time.time() - t0)
+
+
+def run(hoist_constants, n_values, linker):
+    """
+    Run `sweep` in a new process with an empty compiledir.
+
+    """
+    tmpdir = tempfile.mkdtemp()
+    try:
+        env = dict(os.environ)
+        env['THEANO_FLAGS'] = ','.join(filter(None, [
+            env.get('THEANO_FLAGS', ''), 'base_compiledir=' + tmpdir,
+            'cmodule.hoist_constants=%d' % hoist_constants]))
+        out = subprocess.check_output(
+            [sys.executable, __file__, '--child', '-n', str(n_values),
+             '-l', linker], env=env)
+    finally:
+        shutil.rmtree(tmpdir)
+    return json.loads(out.decode().strip().splitlines()[-1])
+
+
+parser = OptionParser(
+    usage='%prog <options>\nCompile the functions of a hyper-parameter '
+    'sweep with and without cmodule.hoist_constants.')
+parser.add_option('-n', '--values', action='store', dest='values',
+                  default=5, type="int",
+                  help="Number of learning rates in the sweep")
+parser.add_option('-l', '--linker', action='store', dest='linker',
+                  default='cvm', type="string",
+                  help="The linker to use")
+parser.add_option('-s', '--size', action='store', dest='size',
+                  default=16, type="int",
+                  help="The value of cmodule.hoist_constants to compare "
+                  "with 0")
+parser.add_option('--child', action='store_true', dest='child',
+                  default=False, help="Internal: run the sweep")
+
+if __name__ == '__main__':
+    options, arguments = parser.parse_args()
+    if options.child:
+        print(json.dumps(sweep(options.values, options.linker)))
+        sys.exit(0)
+    print("%-16s %9s %9s %9s %9s %9s %8s" % (
+        'hoist_constants', 'functions', 'lookups', 'new keys',
+        'key hits', 'compiled', 'time (s)'))
+    for size in [0, options.size]:
+        res = run(size, options.values, options.linker)
+        print("%-16d %9d %9d %9d %8.0f%% %9d %8.1f" % (
+            size, res['functions'], res['lookups'], res['keys'],
+            100. * (res['lookups'] - res['keys']) / max(res['lookups'], 1),
+            res['compiled'], res['time']))
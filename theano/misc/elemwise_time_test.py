@@ -17,6 +17,20 @@ parser.add_option('-N', '--N', action='store', dest='N',
 parser.add_option('--script', action='store_true', dest='script',
                   default=False,
                   help="Run program as script and print results on stdoutput")
+parser.add_option('--dtypes', action='store', dest='dtypes',
+                  default=None, type="string",
+                  help="Comma separated list of dtypes: compare the time of "
+                  "the fast op on contiguous and strided vectors of these "
+                  "dtypes, for each of the sizes of --sizes")
+parser.add_option('--sizes', action='store', dest='sizes',
+                  default='1000,100000,10000000', type="string",
+                  help="Comma separated list of numbers of vector elements, "
+                  "used with --dtypes")
+parser.add_option('--layouts', action='store', dest='layouts',
+                  default=None, type="string",
+                  help="Comma separated list of matrix sizes: compare the "
+                  "time of an addition of two matrices of each size, for "
+                  "several layouts of the inputs, with a copy by NumPy")
 
 
 def evalTime(f, v, script=False, loops=1000):
@@ -47,12 +61,117 @@ def ElemwiseOpTime(N, script=False, loops=1000):
     costlyTime = evalTime(f1, v, script=script, loops=loops)
     return (ceapTime, costlyTime)
 
+
+def ContiguousTime(dtype, N, loops=None):
+    """
+    Return the time of the fast op on a contiguous vector of `N` elements of
+    `dtype`, on a strided one, and the time of NumPy on the contiguous one.
+
+    The contiguous vectors use the flat loop of the Elemwise C code, the
+    strided ones its generic loop.
+
+    """
+    if loops is None:
+        loops = max(10, min(1000, 10 ** 8 // N))
+    x = T.vector('x', dtype=dtype)
+    y = T.vector('y', dtype=dtype)
+    f = theano.function([x, y], 2 * x + x * y)
+    rng = np.random.RandomState(1235)
+    v = (rng.random_sample(2 * N) * 10).astype(dtype)
+    w = (rng.random_sample(2 * N) * 10).astype(dtype)
+
+    def best_time(fn, *args):
+        best = 1e10
+        for i in xrange(loops):
+            t0 = time.time()
+            fn(*args)
+            dt = time.time() - t0
+            best = dt if dt < best else best
+        return best
+    return (best_time(f, v[:N], w[:N]), best_time(f, v[::2], w[::2]),
+            best_time(lambda a, b: 2 * a + a * b, v[:N], w[:N]))
+
+
+def ContiguousTable(dtypes, sizes):
+    print("%-8s %10s %14s %12s %8s %12s" % (
+        'dtype', 'size', 'contiguous', 'strided', 'speedup', 'numpy'))
+    for dtype in dtypes:
+        for N in sizes:
+            contiguous, strided, numpy_time = ContiguousTime(dtype, N)
+            print("%-8s %10d %12.2fus %10.2fus %8.2f %10.2fus" % (
+                dtype, N, contiguous * 1e6, strided * 1e6,
+                strided / contiguous, numpy_time * 1e6))
+
+
+def LayoutTime(N, loops=None):
+    """
+    Return the time of the addition of two `N` x `N` matrices for several
+    layouts of the inputs, as a list of (layout, time) pairs, followed by
+    the time of a copy of one of the matrices by NumPy.
+
+    The layouts other than the contiguous ones use the general loop of the
+    Elemwise C code, which orders and tiles its loops with the strides of
+    all the inputs and the output.
+
+    """
+    if loops is None:
+        loops = max(5, min(1000, 10 ** 8 // (N * N)))
+    x = T.matrix('x')
+    y = T.matrix('y')
+    r = T.row('r')
+    f = theano.function([x, y], x + y)
+    g = theano.function([x, r], x + r)
+    rng = np.random.RandomState(1235)
+    a = rng.random_sample((N, N)).astype(theano.config.floatX)
+    b = rng.random_sample((N, N)).astype(theano.config.floatX)
+    row = rng.random_sample((1, N)).astype(theano.config.floatX)
+    b_2 = rng.random_sample((N, 2 * N)).astype(theano.config.floatX)
+
+    def best_time(fn, *args):
+        best = 1e10
+        for i in xrange(loops):
+            t0 = time.time()
+            fn(*args)
+            dt = time.time() - t0
+            best = dt if dt < best else best
+        return best
+    cases = [('C + C', f, a, b),
+             ('F + F', f, a.T, b.T),
+             ('C + F', f, a, b.T),
+             ('F + C', f, a.T, b),
+             ('C + strided', f, a, b_2[:, ::2]),
+             ('F + strided', f, a.T, b_2[:, ::2]),
+             ('C + row', g, a, row),
+             ('F + row', g, a.T, row)]
+    times = [(name, best_time(fn, u, v)) for name, fn, u, v in cases]
+    return times, best_time(np.copy, a)
+
+
+def LayoutTable(sizes):
+    print("%-12s %8s %12s %12s" % ('layout', 'size', 'time', 'vs copy'))
+    for N in sizes:
+        times, copy_time = LayoutTime(N)
+        for name, t in times:
+            print("%-12s %8d %10.2fus %12.2f" % (
+                name, N, t * 1e6, t / copy_time))
+        print("%-12s %8d %10.2fus" % ('numpy copy', N, copy_time * 1e6))
+
+
 if __name__ == '__main__':
     options, arguments = parser.parse_args(sys.argv)
     if hasattr(options, "help"):
         print(options.help)
         sys.exit(0)
 
+    if options.dtypes:
+        ContiguousTable(options.dtypes.split(','),
+                        [int(N) for N in options.sizes.split(',')])
+        sys.exit(0)
+
+    if options.layouts:
+        LayoutTable([int(N) for N in options.layouts.split(',')])
+        sys.exit(0)
+
     (cheapTime, costlyTime) = ElemwiseOpTime(N=options.N,
                                              script=options.script)
 
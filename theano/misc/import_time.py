@@ -0,0 +1,125 @@
+#!/usr/bin/env python
+"""
+Measure the time spent importing Theano, and the part of it spent in each
+submodule.
+
+Each measure is done in a new Python process, so that nothing is already
+imported. The time of a module is split between its own code (self) and
+the modules it imports first (cumulative).
+"""
+from __future__ import absolute_import, print_function, division
+
+import json
+import subprocess
+import sys
+from optparse import OptionParser
+
+# Run in the child process: time each module the first time it is
+# imported and print the times as JSON.
+child_code = """
+import json
+import sys
+import time
+
+times = {}
+stack = []
+
+
+def timed(name, load, *args):
+    stack.append(0.)
+    t0 = time.time()
+    try:
+        return load(*args)
+    finally:
+        dt = time.time() - t0
+        children = stack.pop()
+        if stack:
+            stack[-1] += dt
+        cum, own = times.get(name, (0., 0.))
+        times[name] = (cum + dt, own + dt - children)
+
+try:
+    # Python 3: every module is loaded by _find_and_load, including the
+    # submodules of a "from package import submodule".
+    import importlib._bootstrap as bootstrap
+    real_find_and_load = bootstrap._find_and_load
+
+    def timed_find_and_load(name, import_):
+        return timed(name, real_find_and_load, name, import_)
+
+    bootstrap._find_and_load = timed_find_and_load
+except (ImportError, AttributeError):
+    from six.moves import builtins
+    real_import = builtins.__import__
+
+    def timed_import(name, globals=None, locals=None, fromlist=(), level=0):
+        if level > 0 and globals:
+            package = (globals.get('__package__') or
+                       globals.get('__name__', ''))
+            if level > 1:
+                package = package.rsplit('.', level - 1)[0]
+            full_name = package + '.' + name if name else package
+        else:
+            full_name = name
+        if full_name in sys.modules:
+            return real_import(name, globals, locals, fromlist, level)
+        return timed(full_name, real_import, name, globals, locals,
+                     fromlist, level)
+
+    builtins.__import__ = timed_import
+
+t0 = time.time()
+__import__(%(module)r)
+total = time.time() - t0
+n_modules = len([m for m in sys.modules if m.startswith('theano')])
+print(json.dumps({'total': total, 'times': times, 'n_modules': n_modules}))
+"""
+
+
+def import_times(module):
+    """
+    Import `module` in a new process and return the total time, the
+    number of theano modules imported and a dict module -> (cumulative
+    time, self time).
+
+    """
+    out = subprocess.check_output(
+        [sys.executable, '-c', child_code % dict(module=module)])
+    # The last line is ours, the imported modules can print before it.
+    res = json.loads(out.decode().strip().splitlines()[-1])
+    return res['total'], res['n_modules'], res['times']
+
+
+parser = OptionParser(
+    usage='%prog <options>\nMeasure the time spent importing Theano and '
+    'each of its submodules.')
+parser.add_option('-m', '--module', action='store', dest='module',
+                  default='theano', type="string",
+                  help="The module to import")
+parser.add_option('-n', '--repeat', action='store', dest='repeat',
+                  default=3, type="int",
+                  help="Keep the best time of this number of imports")
+parser.add_option('-t', '--top', action='store', dest='top',
+                  default=25, type="int",
+                  help="Number of modules to print")
+parser.add_option('-a', '--all', action='store_true', dest='all',
+                  default=False,
+                  help="Also print the modules outside of theano")
+
+if __name__ == '__main__':
+    options, arguments = parser.parse_args()
+    best = None
+    for i in range(options.repeat):
+        res = import_times(options.module)
+        if best is None or res[0] < best[0]:
+            best = res
+    total, n_modules, times = best
+    print("import %s: %.3fs, %d theano modules imported" % (
+        options.module, total, n_modules))
+    print()
+    print("%9s %9s  %s" % ('self (s)', 'cum. (s)', 'module'))
+    modules = [m for m in times
+               if options.all or m == 'theano' or m.startswith('theano.')]
+    modules.sort(key=lambda m: times[m][1], reverse=True)
+    for m in modules[:options.top]:
+        print("%9.3f %9.3f  %s" % (times[m][1], times[m][0], m))
@@ -0,0 +1,99 @@
+#!/usr/bin/env python
+"""
+Time the optimizer making the elemwise operations inplace, on graphs of
+increasing size, with the incremental cycle detection of the
+DestroyHandler and with the check of the whole graph at each validation
+(`DestroyHandler.incremental = False`).
+
+The graphs combine each new elemwise operation with random previous
+results, so that most of them are candidates to work inplace and the
+destroyed variables have several clients.
+"""
+from __future__ import absolute_import, print_function, division
+
+import time
+from optparse import OptionParser
+
+import numpy as np
+
+import theano
+import theano.tensor as T
+from theano.gof import DestroyHandler
+from theano.gof.fg import FunctionGraph
+from theano.tensor.opt import inplace_elemwise_optimizer
+
+
+def build(size, seed=1234):
+    """
+    Optimized graph of `size` elemwise operations, without the inplace and
+    fusion optimizations.
+
+    """
+    rng = np.random.RandomState(seed)
+    x = T.vector('x')
+    y = T.vector('y')
+    variables = [x, y]
+    ops = [T.add, T.mul, T.sub, lambda a, b: T.exp(a) * b,
+           lambda a, b: T.tanh(a) - b]
+    for i in range(size):
+        a, b = rng.randint(max(0, len(variables) - 50), len(variables),
+                           size=2)
+        op = ops[rng.randint(len(ops))]
+        variables.append(op(variables[a], variables[b]))
+    outputs = variables[-10:]
+    mode = theano.compile.Mode(linker='py', optimizer='fast_run').excluding(
+        'inplace', 'fusion')
+    f = theano.function([x, y], outputs, mode=mode)
+    return f.maker.fgraph.inputs, f.maker.fgraph.outputs
+
+
+def inplace_time(inputs, outputs, incremental):
+    """
+    Return the time spent in the inplace elemwise optimizer and the number
+    of nodes working inplace.
+
+    """
+    fgraph = FunctionGraph(inputs, outputs)
+    old = DestroyHandler.incremental
+    try:
+        DestroyHandler.incremental = incremental
+        t0 = time.time()
+        inplace_elemwise_optimizer.optimize(fgraph)
+        t = time.time() - t0
+    finally:
+        DestroyHandler.incremental = old
+    n_inplace = len([n for n in fgraph.apply_nodes
+                     if getattr(n.op, 'destroy_map', None)])
+    return t, len(fgraph.apply_nodes), n_inplace
+
+
+parser = OptionParser(
+    usage='%prog <options>\nTime the inplace elemwise optimizer with the '
+    'incremental and the global cycle detection.')
+parser.add_option('-s', '--sizes', action='store', dest='sizes',
+                  default='250,500,1000,2000,4000', type="string",
+                  help="Comma separated list of the numbers of elemwise "
+                  "operations in the graphs")
+parser.add_option('-n', '--repeat', action='store', dest='repeat',
+                  default=1, type="int",
+                  help="Keep the best time of this number of runs")
+
+if __name__ == '__main__':
+    options, arguments = parser.parse_args()
+    print("%6s %6s %8s %10s %12s %8s" % ('size', 'nodes', 'inplace',
+                                         'global (s)', 'incremental',
+                                         'speedup'))
+    for size in [int(s) for s in options.sizes.split(',')]:
+        inputs, outputs = build(size)
+        times = {}
+        inplace = {}
+        for incremental in [False, True]:
+            for i in range(options.repeat):
+                t, n_nodes, n_inplace = inplace_time(inputs, outputs,
+                                                     incremental)
+                times[incremental] = min(times.get(incremental, t), t)
+            inplace[incremental] = n_inplace
+        assert inplace[False] == inplace[True]
+        print("%6d %6d %8d %10.2f %12.2f %8.1f" % (
+            size, n_nodes, inplace[True], times[False], times[True],
+            times[False] / times[True]))
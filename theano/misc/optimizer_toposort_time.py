@@ -0,0 +1,120 @@
+#!/usr/bin/env python
+"""
+Compare the time spent sorting and optimizing large generated graphs with
+and without `IncrementalToposort` (the `optimizer_incremental_toposort`
+flag).
+
+The graphs are `width` chains of `depth` elemwise layers that mix their
+neighbours. Two times are reported:
+
+- replace + toposort: the time of `replacements` random replacements,
+  each followed by a `FunctionGraph.toposort`, as done by the global
+  optimizers.
+- optimizer: the time spent in the optimizer when compiling the graph.
+"""
+from __future__ import absolute_import, print_function, division
+
+import time
+from optparse import OptionParser
+
+import numpy as np
+
+import theano
+import theano.tensor as T
+from theano import config
+from theano.gof import FunctionGraph, IncrementalToposort
+
+
+def build_graph(depth, width):
+    x = T.matrix('x')
+    h = [x * (i + 1) for i in range(width)]
+    for d in range(depth):
+        h = [T.tanh(h[i] + 2 * h[(i + 1) % width] - 1) * T.exp(-h[i])
+             for i in range(width)]
+    return [x], h
+
+
+def replace_time(depth, width, replacements, incremental):
+    """
+    Return the time spent replacing random nodes by a copy of themselves
+    and sorting the graph after each replacement.
+
+    """
+    inputs, outputs = build_graph(depth, width)
+    fgraph = FunctionGraph(inputs, outputs)
+    if incremental:
+        fgraph.attach_feature(IncrementalToposort())
+    rng = np.random.RandomState(0)
+    t0 = time.time()
+    for i in range(replacements):
+        order = fgraph.toposort()
+        node = order[rng.randint(len(order))]
+        fgraph.replace(node.outputs[0], node.op(*node.inputs),
+                       reason='benchmark')
+    return time.time() - t0
+
+
+def optimizer_time(depth, width, incremental, optimizer='fast_run'):
+    """
+    Return the time spent in the optimizer and the number of nodes of the
+    optimized graph.
+
+    """
+    inputs, outputs = build_graph(depth, width)
+    mode = theano.compile.Mode(linker='py', optimizer=optimizer)
+    profile = theano.compile.ProfileStats(atexit_print=False)
+    old = (config.optimizer_incremental_toposort, config.cache_optimizations)
+    try:
+        config.optimizer_incremental_toposort = incremental
+        config.cache_optimizations = False
+        f = theano.function(inputs, [T.sum(o) for o in outputs], mode=mode,
+                            profile=profile)
+    finally:
+        (config.optimizer_incremental_toposort,
+         config.cache_optimizations) = old
+    return profile.optimizer_time, len(f.maker.fgraph.apply_nodes)
+
+
+parser = OptionParser(
+    usage='%prog <options>\nCompare the time spent sorting and optimizing '
+    'large graphs with and without optimizer_incremental_toposort.')
+parser.add_option('-d', '--depth', action='store', dest='depth',
+                  default='10,50,100', type="string",
+                  help="Comma separated list of graph depths")
+parser.add_option('-w', '--width', action='store', dest='width',
+                  default=20, type="int",
+                  help="Number of parallel chains in the graph")
+parser.add_option('-r', '--replacements', action='store',
+                  dest='replacements', default=200, type="int",
+                  help="Number of replacements followed by a toposort")
+parser.add_option('-o', '--optimizer', action='store', dest='optimizer',
+                  default='fast_run', type="string",
+                  help="The optimizer to use")
+parser.add_option('--no-optimizer', action='store_false', dest='optimize',
+                  default=True,
+                  help="Only time the replacements")
+
+if __name__ == '__main__':
+    options, arguments = parser.parse_args()
+    print("%6s %6s %8s | %-27s | %-27s" % (
+        '', '', '', 'replace + toposort (s)', 'optimizer (s)'))
+    print("%6s %6s %8s | %8s %8s %9s | %8s %8s %9s" % (
+        'depth', 'width', 'nodes', 'full', 'incr.', 'speedup',
+        'full', 'incr.', 'speedup'))
+    for depth in map(int, options.depth.split(',')):
+        nodes = len(FunctionGraph(*build_graph(depth,
+                                               options.width)).apply_nodes)
+        full = replace_time(depth, options.width, options.replacements,
+                            False)
+        incr = replace_time(depth, options.width, options.replacements,
+                            True)
+        line = "%6d %6d %8d | %8.3f %8.3f %9.2f |" % (
+            depth, options.width, nodes, full, incr, full / incr)
+        if options.optimize:
+            opt_full, _ = optimizer_time(depth, options.width, False,
+                                         options.optimizer)
+            opt_incr, _ = optimizer_time(depth, options.width, True,
+                                         options.optimizer)
+            line += " %8.3f %8.3f %9.2f" % (opt_full, opt_incr,
+                                            opt_full / opt_incr)
+        print(line)
@@ -0,0 +1,129 @@
+#!/usr/bin/env python
+"""
+Compare the time spent in the optimizer with and without the worklist of
+`EquilibriumOptimizer` (the `optimizer_worklist` flag), and check that both
+give the same optimized graph.
+
+The graphs are built with the models of theano/tensor/tests/mlp_test.py
+and with chains of elemwise operations that the canonicalization
+simplifies.
+"""
+from __future__ import absolute_import, print_function, division
+
+from optparse import OptionParser
+
+import numpy as np
+
+import theano
+import theano.tensor as T
+from theano import config
+from theano.tensor.tests.mlp_test import HiddenLayer, MLP
+
+
+def build_mlp(size):
+    """
+    Gradients of the cost of the MLP of mlp_test with respect to its
+    parameters.
+
+    """
+    x = T.matrix('x')
+    y = T.ivector('y')
+    rng = np.random.RandomState(1234)
+    classifier = MLP(rng=rng, input=x, n_in=28 * 28, n_hidden=size,
+                     n_out=10)
+    cost = classifier.negative_log_likelihood(y).mean()
+    return [x, y], [cost] + T.grad(cost, classifier.params)
+
+
+def build_deep_mlp(size):
+    """
+    Gradients of a cost over `size` stacked layers of mlp_test.
+
+    """
+    x = T.matrix('x')
+    rng = np.random.RandomState(1234)
+    h = x
+    params = []
+    for i in range(size):
+        layer = HiddenLayer(rng=rng, input=h, n_in=10, n_out=10,
+                            name_prefix='l%i_' % i)
+        h = T.tanh(layer.output + 1) * 2
+        params += layer.params
+    cost = T.sqr(h).mean()
+    return [x], [cost] + T.grad(cost, params)
+
+
+def build_elemwise(size):
+    """
+    `size` chains of elemwise operations on the same inputs with
+    expressions that the canonicalization simplifies.
+
+    """
+    x = T.matrix('x')
+    y = T.matrix('y')
+    outs = []
+    for i in range(size):
+        h = x
+        for j in range(5):
+            h = (h * y + (i + j)) / y - (x - x) + T.exp(T.log(h * 1.0))
+        outs.append(h.sum())
+    return [x, y], outs
+
+
+builders = {'mlp': build_mlp,
+            'deep_mlp': build_deep_mlp,
+            'elemwise': build_elemwise}
+
+
+def optimizer_time(builder, size, worklist, optimizer='fast_run'):
+    """
+    Return the time spent in the optimizer and the printed optimized graph.
+
+    """
+    inputs, outputs = builder(size)
+    mode = theano.compile.Mode(linker='py', optimizer=optimizer)
+    profile = theano.compile.ProfileStats(atexit_print=False)
+    old = (config.optimizer_worklist, config.cache_optimizations)
+    try:
+        config.optimizer_worklist = worklist
+        config.cache_optimizations = False
+        f = theano.function(inputs, outputs, mode=mode, profile=profile,
+                            on_unused_input='ignore')
+    finally:
+        config.optimizer_worklist, config.cache_optimizations = old
+    return (profile.optimizer_time,
+            theano.printing.debugprint(f, file='str'))
+
+
+parser = OptionParser(
+    usage='%prog <options>\nCompare the time spent in the optimizer with '
+    'and without optimizer_worklist.')
+parser.add_option('-g', '--graphs', action='store', dest='graphs',
+                  default='mlp:500,deep_mlp:10,deep_mlp:40,elemwise:10,'
+                  'elemwise:40', type="string",
+                  help="Comma separated list of builder:size, the builders "
+                  "are %s" % ', '.join(sorted(builders)))
+parser.add_option('-o', '--optimizer', action='store', dest='optimizer',
+                  default='fast_run', type="string",
+                  help="The optimizer to use")
+parser.add_option('-n', '--repeat', action='store', dest='repeat',
+                  default=3, type="int",
+                  help="Keep the best time of this number of compilations")
+
+if __name__ == '__main__':
+    options, arguments = parser.parse_args()
+    print("%-16s %8s %8s %9s %6s" % ('graph', 'full', 'worklist',
+                                     'speedup', 'same'))
+    for graph in options.graphs.split(','):
+        name, size = graph.split(':')
+        times = {}
+        graphs = {}
+        for worklist in [False, True]:
+            for i in range(options.repeat):
+                t, g = optimizer_time(builders[name], int(size), worklist,
+                                      options.optimizer)
+                times[worklist] = min(times.get(worklist, t), t)
+                graphs[worklist] = g
+        print("%-16s %8.3f %8.3f %9.2f %6s" % (
+            graph, times[False], times[True], times[False] / times[True],
+            graphs[False] == graphs[True]))
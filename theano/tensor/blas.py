@@ -1522,6 +1522,24 @@ class GemmOptimizer(Optimizer):
                 if i[1] > 0:
                     print(i)
 
+    @staticmethod
+    def profile_to_dict(prof):
+        return {'optimizer': 'GemmOptimizer',
+                'name': 'GemmOptimizer',
+                'iterations': prof[1],
+                'replacements': prof[2],
+                'replacements_not_removed': prof[3],
+                'inconsistent_makes': prof[4],
+                'inconsistent_replacements': prof[5],
+                'canonicalize_time': prof[6],
+                'factor_can_time': prof[7],
+                'factor_list_time': prof[8],
+                'toposort_time': prof[9],
+                'validate_time': prof[10],
+                'callback_time': prof[11],
+                'callbacks_time': dict((str(k), v)
+                                       for k, v in iteritems(prof[12]))}
+
 
 class Dot22(GemmRelated):
     """Compute a matrix-matrix product.
@@ -733,6 +733,12 @@ def blas_header_text():
 
     blas_code = ""
     if not config.blas.ldflags:
+        # Warn here and not at import time, as reading config.blas.ldflags
+        # the first time compiles and runs test programs.
+        if not blas_header_text.warned:
+            _logger.warning('Using NumPy C-API based implementation for '
+                            'BLAS functions.')
+            blas_header_text.warned = True
         # Include the Numpy version implementation of [sd]gemm_.
         current_filedir = dirname(__file__)
         blas_common_filepath = os.path.join(current_filedir, 'c_code', 'alt_blas_common.h')
@@ -983,9 +989,7 @@ def blas_header_text():
 
     return header + blas_code
 
-
-if not config.blas.ldflags:
-    _logger.warning('Using NumPy C-API based implementation for BLAS functions.')
+blas_header_text.warned = False
 
 
 def mkl_threads_text():
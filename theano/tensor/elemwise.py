@@ -2,14 +2,15 @@ from __future__ import absolute_import, print_function, division
 from copy import copy
 
 import numpy as np
-from six import iteritems, integer_types
+from numpy.lib.stride_tricks import as_strided
+from six import iteritems, itervalues, integer_types
 from six.moves import xrange
 
 import theano
 from theano import gof
 from theano.compat import izip
 from theano import change_flags
-from theano.gof import Apply, Op, COp, OpenMPOp, ParamsType
+from theano.gof import Apply, COp, OpenMPOp, ParamsType
 from theano import scalar
 from theano.scalar import get_scalar_type
 from theano.printing import pprint
@@ -335,6 +336,31 @@ pprint.assign(DimShuffle, DimShufflePrinter())
 #   Elemwise   #
 ################
 
+def _perform_loop(scalar_op, inputs, out_shape, dtypes):
+    """
+    Apply `scalar_op` to each element of the inputs broadcasted to
+    `out_shape`, and return its outputs, of the given dtypes.
+
+    NumPy ufuncs support up to 31 inputs, this supports any number of them.
+
+    """
+    # The inputs have as many dimensions as the outputs. The broadcasted
+    # ones get a stride of 0. np.broadcast_to needs NumPy 1.10 and
+    # np.broadcast_arrays is limited to 32 inputs in older versions.
+    inputs = [as_strided(i, shape=out_shape,
+                         strides=[s if d == o else 0 for d, o, s in
+                                  izip(i.shape, out_shape, i.strides)])
+              for i in inputs]
+    outputs = [np.empty(out_shape, dtype=dtype) for dtype in dtypes]
+    for idx in np.ndindex(*out_shape):
+        results = scalar_op.impl(*[i[idx] for i in inputs])
+        if len(outputs) == 1:
+            results = [results]
+        for o, r in izip(outputs, results):
+            o[idx] = r
+    return outputs
+
+
 class Elemwise(OpenMPOp):
     """
     Generalizes a scalar op to tensors.
@@ -386,6 +412,16 @@ second dimension
 
     __props__ = ("scalar_op", "inplace_pattern")
 
+    # Above this number of inputs and outputs, the C code of the general
+    # case keeps their pointers and strides in arrays, see
+    # elemwise_cgen.make_packed_loop.
+    packed_loop_min_operands = 32
+
+    # Size of the blocks of the two inner-most loops of the C code of the
+    # general case, when the inputs and outputs disagree on their order.
+    # 0 disables the tiling. See elemwise_cgen.make_reordered_loop.
+    loop_tile = 256
+
     def __init__(self, scalar_op, inplace_pattern=None, name=None,
                  nfunc_spec=None, openmp=None):
         if inplace_pattern is None:
@@ -710,13 +746,6 @@ second dimension
         self.scalar_op.prepare_node(node.tag.fake_node, None, None, impl)
 
     def perform(self, node, inputs, output_storage):
-        if len(node.inputs) >= 32:
-            # Some versions of NumPy will segfault, other will raise a
-            # ValueError, if the number of inputs to a ufunc is 32 or more.
-            # In that case, the C version should be used, or Elemwise fusion
-            # should be disabled.
-            super(Elemwise, self).perform(node, inputs, output_storage)
-
         for dims in izip(*[list(zip(input.shape, sinput.type.broadcastable))
                            for input, sinput in zip(inputs, node.inputs)]):
             if max(d for d, b in dims) != 1 and (1, False) in dims:
@@ -752,42 +781,56 @@ second dimension
 
         ufunc_args = inputs
         ufunc_kwargs = {}
-        # We supported in the past calling manually op.perform.
-        # To keep that support we need to sometimes call self.prepare_node
-        if self.nfunc is None and self.ufunc is None:
-            self.prepare_node(node, None, None, 'py')
-        if self.nfunc and len(inputs) == self.nfunc_spec[1]:
-            ufunc = self.nfunc
-            nout = self.nfunc_spec[2]
-            if hasattr(node.tag, 'sig'):
-                ufunc_kwargs['sig'] = node.tag.sig
-            # Unfortunately, the else case does not allow us to
-            # directly feed the destination arguments to the nfunc
-            # since it sometimes requires resizing. Doing this
-            # optimization is probably not worth the effort, since we
-            # should normally run the C version of the Op.
+        if len(inputs) >= 32:
+            # Some versions of NumPy will segfault, other will raise a
+            # ValueError, if the number of inputs to a ufunc is 32 or more.
+            # In that case, loop in Python. This is slow, the C version
+            # should normally be used.
+            # No ufunc is built, so the node is prepared only once.
+            if not hasattr(node.tag, 'fake_node'):
+                self.prepare_node(node, None, None, 'py')
+            variables = _perform_loop(self.scalar_op, inputs, out_shape,
+                                      [o.dtype for o in node.outputs])
+            nout = len(variables)
+            if nout == 1:
+                variables = variables[0]
         else:
-            # the second calling form is used because in certain versions of
-            # numpy the first (faster) version leads to segfaults
-            if self.ufunc:
-                ufunc = self.ufunc
-            elif not hasattr(node.tag, 'ufunc'):
-                # It happen that make_thunk isn't called, like in
-                # get_scalar_constant_value
+            # We supported in the past calling manually op.perform.
+            # To keep that support we need to sometimes call self.prepare_node
+            if self.nfunc is None and self.ufunc is None:
                 self.prepare_node(node, None, None, 'py')
-                # prepare_node will add ufunc to self or the tag
-                # depending if we can reuse it or not. So we need to
-                # test both again.
+            if self.nfunc and len(inputs) == self.nfunc_spec[1]:
+                ufunc = self.nfunc
+                nout = self.nfunc_spec[2]
+                if hasattr(node.tag, 'sig'):
+                    ufunc_kwargs['sig'] = node.tag.sig
+                # Unfortunately, the else case does not allow us to
+                # directly feed the destination arguments to the nfunc
+                # since it sometimes requires resizing. Doing this
+                # optimization is probably not worth the effort, since we
+                # should normally run the C version of the Op.
+            else:
+                # the second calling form is used because in certain versions of
+                # numpy the first (faster) version leads to segfaults
                 if self.ufunc:
                     ufunc = self.ufunc
+                elif not hasattr(node.tag, 'ufunc'):
+                    # It happen that make_thunk isn't called, like in
+                    # get_scalar_constant_value
+                    self.prepare_node(node, None, None, 'py')
+                    # prepare_node will add ufunc to self or the tag
+                    # depending if we can reuse it or not. So we need to
+                    # test both again.
+                    if self.ufunc:
+                        ufunc = self.ufunc
+                    else:
+                        ufunc = node.tag.ufunc
                 else:
                     ufunc = node.tag.ufunc
-            else:
-                ufunc = node.tag.ufunc
 
-            nout = ufunc.nout
+                nout = ufunc.nout
 
-        variables = ufunc(*ufunc_args, **ufunc_kwargs)
+            variables = ufunc(*ufunc_args, **ufunc_kwargs)
 
         if nout == 1:
             variables = [variables]
@@ -1049,13 +1092,20 @@ second dimension
                     dtypes=dtypes,
                     loop_tasks=all_code,
                     sub=sub, openmp=self.openmp)
+        elif len(loop_orders) > self.packed_loop_min_operands:
+            loop = cgen.make_packed_loop(
+                init_loop_orders=loop_orders,
+                olv_index=olv_index,
+                dtypes=dtypes,
+                inner_task=code,
+                sub=sub, openmp=self.openmp)
         else:
             loop = cgen.make_reordered_loop(
                 init_loop_orders=loop_orders,
                 olv_index=olv_index,
                 dtypes=dtypes,
                 inner_task=code,
-                sub=sub, openmp=self.openmp)
+                sub=sub, openmp=self.openmp, tile=self.loop_tile)
 
         # If all inputs and outputs are contiguous
         # and the scalar op define optimized code for that case
@@ -1064,6 +1114,7 @@ second dimension
             # Don't use the contig code for broadcasted scalar.
                 not all(node.outputs[0].broadcastable)):
             contig = None
+            no_overlap = None
             try:
                 contig = self.scalar_op.c_code_contiguous(
                     node,
@@ -1079,7 +1130,30 @@ second dimension
                         all(io.broadcastable)
                         for io in node.inputs + node.outputs]):
                     z = onames[0]
+                    # The pointers are restrict-qualified, except those of
+                    # the inputs destroyed by the outputs aliased to them,
+                    # so that the compiler can vectorize the loop without
+                    # checking for overlaps. The allocated outputs are
+                    # checked not to overlap the inputs at runtime.
+                    destroyed = [node.inputs[i] for i in
+                                 itervalues(self.inplace_pattern)]
+                    restrict = [x for x, var in zip(inames, inputs)
+                                if var not in destroyed] + list(real_onames)
+                    no_overlap = ' && '.join([
+                        "((char*)PyArray_DATA(%(o)s) >= "
+                        "(char*)PyArray_DATA(%(i)s) + PyArray_NBYTES(%(i)s) ||"
+                        " (char*)PyArray_DATA(%(i)s) >= "
+                        "(char*)PyArray_DATA(%(o)s) + PyArray_NBYTES(%(o)s))"
+                        % dict(o=o, i=i)
+                        for o in real_onames for i in inames])
                     contig = """
+#ifndef THEANO_RESTRICT
+#ifdef _MSC_VER
+#define THEANO_RESTRICT __restrict
+#else
+#define THEANO_RESTRICT __restrict__
+#endif
+#endif
                     // All output have the same size
                     npy_intp n = PyArray_SIZE(%(z)s);
                     """ % locals()
@@ -1087,8 +1161,10 @@ second dimension
                     for x, var in zip(inames + onames,
                                       inputs + node.outputs):
                         if not all(var.broadcastable):
+                            qual = 'THEANO_RESTRICT ' if x in restrict else ''
                             contig += """
-            dtype_%(x)s * %(x)s_ptr = (dtype_%(x)s*) PyArray_DATA(%(x)s);
+            dtype_%(x)s * %(qual)s%(x)s_ptr =
+                (dtype_%(x)s*) PyArray_DATA(%(x)s);
                             """ % locals()
                             index += """
             dtype_%(x)s& %(x)s_i = %(x)s_ptr[i];
@@ -1101,7 +1177,7 @@ second dimension
                         contig += """#pragma omp parallel for if(n>=%d)
                         """ % (config.openmp_elemwise_minsize)
                     contig += """
-                    for(int i=0; i<n; i++){
+                    for(npy_intp i=0; i<n; i++){
                         %(index)s
                         %(task_code)s;
                     }
@@ -1114,8 +1190,11 @@ second dimension
                 cond2 = ' && '.join(["PyArray_ISFORTRAN(%s)" % arr
                                     for arr, var in z
                                     if not all(var.broadcastable)])
+                cond = "(%s) || (%s)" % (cond1, cond2)
+                if no_overlap:
+                    cond = "(%s) && %s" % (cond, no_overlap)
                 loop = """
-            if((%(cond1)s) || (%(cond2)s)){
+            if(%(cond)s){
                 %(contig)s
             }else{
                 %(loop)s
@@ -1145,7 +1224,7 @@ second dimension
         return support_code
 
     def c_code_cache_version_apply(self, node):
-        version = [13]  # the version corresponding to the c code in this Op
+        version = [16]  # the version corresponding to the c code in this Op
 
         # now we insert versions for the ops on which we depend...
         scalar_node = Apply(
@@ -1177,7 +1256,7 @@ second dimension
 #   CAReduce   #
 ################
 
-class CAReduce(Op):
+class CAReduce(OpenMPOp):
     """
     CAReduce = Commutative Associative Reduce
     Reduces a scalar operation along the specified axis(es).
@@ -1196,6 +1275,10 @@ class CAReduce(Op):
         - The dimension along which we want to reduce
         - List of dimensions that we want to reduce
         - If None, all dimensions are reduced
+    openmp
+        Use OpenMP in the C code to reduce inputs of at least
+        config.openmp_careduce_minsize elements. If None, use
+        config.openmp.
 
     Note
     ----
@@ -1223,11 +1306,16 @@ class CAReduce(Op):
 
     __props__ = ("scalar_op", "axis")
 
-    def __init__(self, scalar_op, axis=None):
+    # Number of input elements reduced by each OpenMP task when
+    # config.deterministic is 'more'.
+    openmp_block = 2 ** 14
+
+    def __init__(self, scalar_op, axis=None, openmp=None):
         if scalar_op.nin not in [-1, 2] or scalar_op.nout != 1:
             raise NotImplementedError((
                 "CAReduce only supports binary functions with a single "
                 "output."))
+        super(CAReduce, self).__init__(openmp=openmp)
         self.scalar_op = scalar_op
 
         if axis is None:
@@ -1315,7 +1403,7 @@ class CAReduce(Op):
         return d
 
     def __setstate__(self, d):
-        self.__dict__.update(d)
+        super(CAReduce, self).__setstate__(d)
         self.set_ufunc(self.scalar_op)
 
     def __str__(self):
@@ -1465,27 +1553,9 @@ class CAReduce(Op):
                 [list(range(nnested)) + ['x'] * len(axis)],
                 [adtype], dict(sub, lv0=aname))
 
-        if hasattr(self.scalar_op, 'identity'):
-            identity = self.scalar_op.identity
-        elif self.scalar_op in [scalar.maximum, scalar.minimum]:
-            if self.scalar_op == scalar.maximum:
-                scal_name = 'maximum'
-                if input.type.dtype in ["float32", "float64"]:
-                    identity = "-__builtin_inf()"
-                elif input.type.dtype.startswith("uint") or input.type.dtype == 'bool':
-                    # numpy does not define NPY_MIN_UINT* and NPY_MIN_BOOL
-                    identity = "0"
-                else:
-                    identity = "NPY_MIN_" + str(input.type.dtype).upper()
-            if self.scalar_op == scalar.minimum:
-                scal_name = 'minimum'
-                if input.type.dtype in ["float32", "float64"]:
-                    identity = "__builtin_inf()"
-                elif input.type.dtype == 'bool':
-                    # numpy does not define NPY_MAX_BOOL
-                    identity = "1"
-                else:
-                    identity = "NPY_MAX_" + str(input.type.dtype).upper()
+        identity = self._c_identity(input.type.dtype)
+        if not hasattr(self.scalar_op, 'identity'):
+            scal_name = self.scalar_op.name
             fail = sub["fail"]
             pattern = [0] * len(node.inputs[0].broadcastable)
             axis = self.axis
@@ -1504,9 +1574,6 @@ class CAReduce(Op):
                         }
                     }
                     """ % locals()
-        else:
-            raise TypeError(
-                "The CAReduce.scalar_op must have an identity field.")
 
         task0_decl = ("%(dtype)s& %(name)s_i = *%(name)s_iter;\n"
                       "%(name)s_i = %(identity)s;"
@@ -1546,6 +1613,23 @@ class CAReduce(Op):
             [order, list(range(nnested)) + ['x'] * len(axis)],
             [idtype, adtype], all_code, sub)
 
+        if self.openmp and node.inputs[0].type.ndim:
+            ndim = node.inputs[0].type.ndim
+            parallel = self._c_reduce_tasks(
+                [(iname, idtype, (False,) * ndim)], "", "red_in0",
+                node.inputs[0].type.dtype,
+                ["PyArray_DIMS(%s)[%d]" % (iname, d) for d in range(ndim)],
+                aname, adtype, order1, order[nnested:], identity, sub, "1")
+            minsize = config.openmp_careduce_minsize
+            loop = """
+            if (PyArray_SIZE(%(iname)s) >= %(minsize)d &&
+                    PyArray_SIZE(%(iname)s) > 0) {
+                %(parallel)s
+            } else {
+                %(loop)s
+            }
+            """ % locals()
+
         end = ""
         if adtype != odtype:
             end = """
@@ -1555,17 +1639,291 @@ class CAReduce(Op):
 
         return decl, checks, alloc, loop, end
 
+    def _c_identity(self, dtype):
+        """
+        C expression of the identity of the scalar op for inputs of `dtype`.
+
+        """
+        if hasattr(self.scalar_op, 'identity'):
+            return self.scalar_op.identity
+        elif self.scalar_op == scalar.maximum:
+            if dtype in ["float32", "float64"]:
+                return "-__builtin_inf()"
+            elif dtype.startswith("uint") or dtype == 'bool':
+                # numpy does not define NPY_MIN_UINT* and NPY_MIN_BOOL
+                return "0"
+            else:
+                return "NPY_MIN_" + str(dtype).upper()
+        elif self.scalar_op == scalar.minimum:
+            if dtype in ["float32", "float64"]:
+                return "__builtin_inf()"
+            elif dtype == 'bool':
+                # numpy does not define NPY_MAX_BOOL
+                return "1"
+            else:
+                return "NPY_MAX_" + str(dtype).upper()
+        else:
+            raise TypeError(
+                "The CAReduce.scalar_op must have an identity field.")
+
+    def _c_reduce_tasks(self, inputs, map_code, mapped, mapped_dtype, dims,
+                        aname, adtype, kept, reduced, identity, sub,
+                        parallel):
+        """
+        C code reducing the inputs into the array `aname`.
+
+        The reduction is split into `M * nblocks` tasks: each of the `M`
+        output elements is reduced by `nblocks` tasks over consecutive
+        blocks of its `K` input elements. The partial results are combined
+        in the order of the blocks, so the result does not depend on the
+        scheduling of the threads. There are just enough blocks to use all
+        the threads, unless config.deterministic is 'more': then the
+        blocks have a fixed size, and the result does not depend on the
+        number of threads either.
+
+        Parameters
+        ----------
+        inputs
+            List of (C name, C dtype, broadcastable pattern) of the input
+            arrays. Their element of the current iteration is named
+            `red_in0`, `red_in1`, ...
+        map_code
+            C code computing the value to accumulate.
+        mapped
+            C name of the value to accumulate.
+        mapped_dtype
+            Dtype of the value to accumulate.
+        dims
+            C expressions of the sizes of the dimensions of the inputs.
+        kept, reduced
+            The dimensions of the inputs kept in the output and reduced.
+        parallel
+            C expression telling whether to use OpenMP, if self.openmp.
+
+        """
+        fail = gof.cc.failure_code(sub, use_goto=False)
+        sub_nogoto = dict(sub, fail=fail)
+        acc_dtype = getattr(self, 'acc_dtype', None)
+        if acc_dtype is None:
+            acc_dtype = self._output_dtype(mapped_dtype)
+        # Accumulate one value
+        task_code = self.scalar_op.c_code(
+            Apply(self.scalar_op,
+                  [get_scalar_type(dtype=mapped_dtype).make_variable()
+                   for i in range(2)],
+                  [get_scalar_type(dtype=acc_dtype).make_variable()]),
+            None, ["red_acc", mapped], ["red_acc"], sub_nogoto)
+        # Combine two partial results
+        combine_code = self.scalar_op.c_code(
+            Apply(self.scalar_op,
+                  [get_scalar_type(dtype=acc_dtype).make_variable()
+                   for i in range(2)],
+                  [get_scalar_type(dtype=acc_dtype).make_variable()]),
+            None, ["red_acc", "red_part"], ["red_acc"], sub_nogoto)
+
+        nk = len(kept)
+        nr = len(reduced)
+        last = nr - 1
+        init = ""
+        decl = "npy_intp red_rdims[%(nr)d];\n" % locals()
+        locate = ""
+        locate_in = ""
+        start = ""
+        fast_cond = []
+        fast_read = ""
+        read = ""
+        step = ""
+        carry = ""
+        if nk:
+            decl += "npy_intp red_kdims[%(nk)d], red_kostr[%(nk)d];\n" % locals()
+        for k, (iname, ctype, bcast) in enumerate(inputs):
+            decl += "npy_intp red_rstr%(k)d[%(nr)d];\n" % locals()
+            if nk:
+                decl += "npy_intp red_kistr%(k)d[%(nk)d];\n" % locals()
+                locate_in += "ip%(k)d += q * red_kistr%(k)d[j];\n" % locals()
+            for j, d in enumerate(kept):
+                stride = ("0" if bcast[d] else
+                          "PyArray_STRIDES(%s)[%d]" % (iname, d))
+                init += "red_kistr%(k)d[%(j)d] = %(stride)s;\n" % locals()
+            for j, d in enumerate(reduced):
+                stride = ("0" if bcast[d] else
+                          "PyArray_STRIDES(%s)[%d]" % (iname, d))
+                init += "red_rstr%(k)d[%(j)d] = %(stride)s;\n" % locals()
+            locate += "char* ip%(k)d = PyArray_BYTES(%(iname)s);\n" % locals()
+            start += "ip%(k)d += ridx[j] * red_rstr%(k)d[j];\n" % locals()
+            locate += ("const npy_intp s%(k)d = red_rstr%(k)d[%(last)d];\n"
+                       % locals())
+            fast_cond.append("s%(k)d == sizeof(%(ctype)s)" % locals())
+            fast_read += ("%(ctype)s red_in%(k)d = "
+                          "((const %(ctype)s*)ip%(k)d)[i];\n" % locals())
+            read += ("%(ctype)s red_in%(k)d = "
+                     "*(const %(ctype)s*)(ip%(k)d + i * s%(k)d);\n" % locals())
+            step += "ip%(k)d += n * s%(k)d;\n" % locals()
+            carry += ("ip%(k)d += red_rstr%(k)d[j - 1] - "
+                      "red_rdims[j] * red_rstr%(k)d[j];\n" % locals())
+        fast_cond = " && ".join(fast_cond)
+        for j, d in enumerate(kept):
+            init += """
+            red_kdims[%(j)d] = %(dim)s;
+            red_kostr[%(j)d] = PyArray_STRIDES(%(aname)s)[%(j)d];
+            red_M *= red_kdims[%(j)d];
+            """ % dict(locals(), dim=dims[d])
+        for j, d in enumerate(reduced):
+            init += """
+            red_rdims[%(j)d] = %(dim)s;
+            red_K *= red_rdims[%(j)d];
+            """ % dict(locals(), dim=dims[d])
+        # The position of an output element in the output, and in the
+        # inputs
+        locate_out = ""
+        if nk:
+            locate_out = """
+            for (int j = %(nk)d - 1; j >= 0; j--) {
+                npy_intp q = r %% red_kdims[j];
+                r /= red_kdims[j];
+                op += q * red_kostr[j];
+                %(locate_in)s
+            }
+            """
+            locate_in = locate_out % locals()
+            locate_out = locate_out % dict(nk=nk, locate_in="")
+        if not self.openmp:
+            nblocks = "1"
+            pragma = ""
+            pragma_out = ""
+            nthreads = ""
+        else:
+            if config.deterministic == 'more':
+                nblocks = "(red_K + %d - 1) / %d" % (self.openmp_block,
+                                                     self.openmp_block)
+            else:
+                nblocks = ("red_M == 0 || red_M >= red_nthreads ? 1 : "
+                           "(red_nthreads + red_M - 1) / red_M")
+            pragma = ("#pragma omp parallel for schedule(static) "
+                      "if(red_parallel)")
+            pragma_out = ("#pragma omp parallel for schedule(static) "
+                          "if(red_parallel && red_M > 1)")
+            nthreads = """
+            int red_parallel = (%(parallel)s);
+            if (red_parallel)
+                red_nthreads = omp_get_max_threads();
+            """ % locals()
+        return """
+        {
+            npy_intp red_M = 1, red_K = 1;
+            %(decl)s
+            %(init)s
+            npy_intp red_nthreads = 1;
+            %(nthreads)s
+            npy_intp red_nblocks = %(nblocks)s;
+            if (red_nblocks > red_K)
+                red_nblocks = red_K;
+            if (red_nblocks < 1)
+                red_nblocks = 1;
+            npy_intp red_block = (red_K + red_nblocks - 1) / red_nblocks;
+            %(adtype)s* red_partials = NULL;
+            if (red_nblocks > 1) {
+                red_partials = (%(adtype)s*)malloc(
+                    red_M * red_nblocks * sizeof(%(adtype)s));
+                if (red_partials == NULL) {
+                    PyErr_NoMemory();
+                    %(fail)s
+                }
+            }
+            %(pragma)s
+            for (npy_intp w = 0; w < red_M * red_nblocks; w++) {
+                npy_intp r = w / red_nblocks;
+                npy_intp b = w %% red_nblocks;
+                char* op = PyArray_BYTES(%(aname)s);
+                %(locate)s
+                %(locate_in)s
+                npy_intp k = b * red_block;
+                npy_intp kend = std::min(red_K, k + red_block);
+                %(adtype)s red_acc = %(identity)s;
+                if (k < kend) {
+                    npy_intp ridx[%(nr)d];
+                    r = k;
+                    for (int j = %(nr)d - 1; j >= 0; j--) {
+                        ridx[j] = r %% red_rdims[j];
+                        r /= red_rdims[j];
+                        %(start)s
+                    }
+                    while (k < kend) {
+                        npy_intp n = std::min(
+                            red_rdims[%(last)d] - ridx[%(last)d], kend - k);
+                        if (%(fast_cond)s) {
+                            for (npy_intp i = 0; i < n; i++) {
+                                %(fast_read)s
+                                %(map_code)s
+                                %(task_code)s
+                            }
+                        } else {
+                            for (npy_intp i = 0; i < n; i++) {
+                                %(read)s
+                                %(map_code)s
+                                %(task_code)s
+                            }
+                        }
+                        k += n;
+                        %(step)s
+                        ridx[%(last)d] += n;
+                        for (int j = %(last)d;
+                             j > 0 && ridx[j] == red_rdims[j]; j--) {
+                            %(carry)s
+                            ridx[j] = 0;
+                            ridx[j - 1]++;
+                        }
+                    }
+                }
+                if (red_nblocks > 1)
+                    red_partials[w] = red_acc;
+                else
+                    *(%(adtype)s*)op = red_acc;
+            }
+            if (red_nblocks > 1) {
+                %(pragma_out)s
+                for (npy_intp m = 0; m < red_M; m++) {
+                    npy_intp r = m;
+                    char* op = PyArray_BYTES(%(aname)s);
+                    %(locate_out)s
+                    %(adtype)s red_acc = red_partials[m * red_nblocks];
+                    for (npy_intp b = 1; b < red_nblocks; b++) {
+                        %(adtype)s red_part = red_partials[m * red_nblocks + b];
+                        %(combine_code)s
+                    }
+                    *(%(adtype)s*)op = red_acc;
+                }
+                free(red_partials);
+            }
+        }
+        """ % dict(locals(), fail=sub['fail'])
+
     def c_code(self, node, name, inames, onames, sub):
         code = "\n".join(self._c_all(node, name, inames, onames, sub))
         return code
 
     def c_headers(self):
         # Sometimes, Elemwise's c_code is returned, so we need its headers
-        return ['<vector>', '<algorithm>']
+        return ['<vector>', '<algorithm>'] + super(CAReduce, self).c_headers()
+
+    def _c_code_openmp_version(self):
+        """
+        Return the part of the C code cache version that depends on the
+        OpenMP parallelization of the reduction.
+
+        """
+        version = [('openmp', self.openmp)]
+        if self.openmp:
+            # The threshold is in the C code, but not in the key of the
+            # module as the flag is not in_c_key.
+            version.append(('openmp_careduce_minsize',
+                            config.openmp_careduce_minsize))
+            version.append(('deterministic', config.deterministic))
+        return version
 
     def c_code_cache_version_apply(self, node):
         # the version corresponding to the c code in this Op
-        version = [8]
+        version = [11]
 
         # now we insert versions for the ops on which we depend...
         scalar_node = Apply(
@@ -1578,6 +1936,7 @@ class CAReduce(Op):
         for i in node.inputs + node.outputs:
             version.append(
                 get_scalar_type(dtype=i.type.dtype).c_code_cache_version())
+        version.extend(self._c_code_openmp_version())
         if all(version):
             return tuple(version)
         else:
@@ -2099,3 +2458,284 @@ class ProdWithoutZeros(CAReduceDtype):
             "If `a` is guaranteed to contains no zeros, use "
             "`product(a, no_zeros_in_input=True)`.")
         return [a_grad]
+
+
+class FusedCAReduce(CAReduce):
+    """
+    Reduce the result of an elemwise scalar op without allocating it.
+
+    ``FusedCAReduce(scalar_op, axis, pre_scalar_op, dtype, acc_dtype)(*inputs)``
+    computes the same result as reducing ``Elemwise(pre_scalar_op)(*inputs)``
+    with ``scalar_op`` over `axis`, accumulating in `acc_dtype` and
+    returning `dtype`. Each element of the elemwise op is computed in the
+    loop of the reduction, so the intermediate tensor is never stored.
+
+    It is introduced by the optimization `local_careduce_fusion`, for
+    instance for ``sum(sqr(x - y))`` or ``max(abs(x))``. It has no gradient.
+
+    Parameters
+    ----------
+    scalar_op
+        A binary scalar op with only one output.
+        It must be commutative and associative.
+    axis
+        The dimensions to reduce, or None to reduce all of them. There must
+        be at least one.
+    pre_scalar_op
+        The scalar op, often a Composite, applied elementwise to the inputs
+        before the reduction. It must have one output.
+    dtype
+        The dtype of the output.
+    acc_dtype
+        The dtype of the accumulator. If None, `dtype` is used.
+    openmp
+        Use OpenMP to reduce inputs of at least
+        config.openmp_careduce_minsize elements. If None, use
+        config.openmp.
+
+    """
+
+    __props__ = ("scalar_op", "axis", "pre_scalar_op", "dtype", "acc_dtype")
+
+    def __init__(self, scalar_op, axis, pre_scalar_op, dtype,
+                 acc_dtype=None, openmp=None):
+        if pre_scalar_op.nout != 1:
+            raise NotImplementedError(
+                "FusedCAReduce only supports pre_scalar_op with a single "
+                "output.")
+        CAReduce.__init__(self, scalar_op, axis, openmp=openmp)
+        if self.axis is not None and len(self.axis) == 0:
+            raise ValueError("FusedCAReduce needs a dimension to reduce.")
+        self.pre_scalar_op = pre_scalar_op
+        self.dtype = dtype
+        if acc_dtype is None:
+            acc_dtype = dtype
+        self.acc_dtype = acc_dtype
+
+    def _output_dtype(self, input_dtype):
+        return self.dtype
+
+    def __str__(self):
+        name = "%s{%s}" % (self.__class__.__name__, self.scalar_op)
+        if self.axis is not None:
+            name += "{%s}" % ", ".join(str(x) for x in self.axis)
+        return "%s{pre=%s}" % (name, self.pre_scalar_op)
+
+    def make_node(self, *inputs):
+        inputs = [as_tensor_variable(i) for i in inputs]
+        ndim = inputs[0].type.ndim
+        if any(i.type.ndim != ndim for i in inputs):
+            raise TypeError(
+                "All the inputs of FusedCAReduce must have the same number "
+                "of dimensions.", [i.type for i in inputs])
+        if ndim == 0:
+            raise ValueError("FusedCAReduce needs a dimension to reduce.")
+        axis = self.axis
+        if axis is None:
+            axis = list(range(ndim))
+        if any(a < 0 or a >= ndim for a in axis):
+            raise ValueError(
+                'Not enough dimensions on %s to reduce on axis %s'
+                % (inputs[0], axis))
+        # The scalar op raises a TypeError if it does not accept the inputs.
+        self.pre_scalar_op.output_types(
+            [get_scalar_type(dtype=i.type.dtype) for i in inputs])
+        broadcastable = [all(i.type.broadcastable[d] for i in inputs)
+                         for d in xrange(ndim) if d not in axis]
+        output = TensorType(dtype=self.dtype, broadcastable=broadcastable)()
+        return Apply(self, inputs, [output])
+
+    def _pre_node(self, node):
+        # The scalar node of the elemwise op
+        return Apply(
+            self.pre_scalar_op,
+            [get_scalar_type(dtype=i.type.dtype).make_variable()
+             for i in node.inputs],
+            [get_scalar_type(dtype=t.dtype).make_variable()
+             for t in self.pre_scalar_op.output_types(
+                 [get_scalar_type(dtype=i.type.dtype)
+                  for i in node.inputs])])
+
+    def prepare_node(self, node, storage_map, compute_map, impl):
+        super(FusedCAReduce, self).prepare_node(node, storage_map,
+                                                compute_map, impl)
+        self.pre_scalar_op.prepare_node(self._pre_node(node), None, None,
+                                        impl)
+
+    def perform(self, node, inputs, out):
+        mapped_dtype = self._pre_node(node).outputs[0].type.dtype
+        if len(inputs) >= 32:
+            # NumPy ufuncs support up to 31 inputs.
+            out_shape = tuple(0 if 0 in dims else max(dims)
+                              for dims in izip(*[i.shape for i in inputs]))
+            mapped, = _perform_loop(self.pre_scalar_op, inputs, out_shape,
+                                    [mapped_dtype])
+        else:
+            ufunc = np.frompyfunc(self.pre_scalar_op.impl, len(inputs), 1)
+            mapped = np.asarray(ufunc(*inputs), dtype=mapped_dtype)
+        super(FusedCAReduce, self).perform(node, [mapped], out)
+
+    def infer_shape(self, node, shapes):
+        axis = self.axis
+        if axis is None:
+            return (),
+        out_shape = []
+        for d in xrange(node.inputs[0].type.ndim):
+            if d in axis:
+                continue
+            for i, shape in zip(node.inputs, shapes):
+                if not i.type.broadcastable[d]:
+                    out_shape.append(shape[d])
+                    break
+            else:
+                out_shape.append(1)
+        return out_shape,
+
+    def c_code(self, node, name, inames, onames, sub):
+        oname, = onames
+        ndim = node.inputs[0].type.ndim
+        axis = self.axis
+        if axis is None:
+            axis = list(range(ndim))
+        kept = [d for d in xrange(ndim) if d not in axis]
+        nk = max(len(kept), 1)
+        fail = sub['fail']
+        pre_node = self._pre_node(node)
+        mapped_dtype = pre_node.outputs[0].type.dtype
+        inputs = [(iname, i.type.dtype_specs()[1], i.type.broadcastable)
+                  for iname, i in izip(inames, node.inputs)]
+
+        # The shape of the loop, checked against all the inputs
+        shape = ""
+        for d in xrange(ndim):
+            first = None
+            for k, (iname, ctype, bcast) in enumerate(inputs):
+                if bcast[d]:
+                    continue
+                if first is None:
+                    first = k
+                    shape += "red_dims[%(d)d] = PyArray_DIMS(%(iname)s)[%(d)d];\n" % locals()
+                else:
+                    shape += """
+                    if (PyArray_DIMS(%(iname)s)[%(d)d] != red_dims[%(d)d]) {
+                        PyErr_Format(PyExc_ValueError,
+                            "Input dimension mis-match. (input[%(first)d].shape[%(d)d] = %%lld, input[%(k)d].shape[%(d)d] = %%lld)",
+                            (long long int) red_dims[%(d)d],
+                            (long long int) PyArray_DIMS(%(iname)s)[%(d)d]);
+                        %(fail)s
+                    }
+                    """ % locals()
+            if first is None:
+                shape += "red_dims[%(d)d] = 1;\n" % locals()
+        if not hasattr(self.scalar_op, 'identity'):
+            scal_name = self.scalar_op.name
+            for d in axis:
+                shape += """
+                if (red_dims[%(d)d] == 0) {
+                    PyErr_Format(PyExc_ValueError,
+                        "Input of CAReduce{%(scal_name)s} has zero-size on axis %(d)d");
+                    %(fail)s
+                }
+                """ % locals()
+
+        # Allocate the output, and the accumulator if it is different
+        odims = ""
+        check_odims = "PyArray_NDIM(%s) != %d" % (oname, len(kept))
+        for j, d in enumerate(kept):
+            odims += "red_odims[%(j)d] = red_dims[%(d)d];\n" % locals()
+            check_odims += " || PyArray_DIMS(%(oname)s)[%(j)d] != red_odims[%(j)d]" % locals()
+        otypenum = node.outputs[0].type.dtype_specs()[2]
+        odtype = node.outputs[0].type.dtype_specs()[1]
+        acc_type = TensorType(dtype=self.acc_dtype,
+                              broadcastable=node.outputs[0].broadcastable)
+        adtype = acc_type.dtype_specs()[1]
+        tasks_sub = sub
+        if adtype != odtype:
+            aname = "red_acc_array"
+            decl_acc = "PyArrayObject* %s = NULL;" % aname
+            atypenum = acc_type.dtype_specs()[2]
+            alloc_acc = """
+            %(aname)s = (PyArrayObject*)PyArray_EMPTY(
+                %(ndim_out)d, red_odims, %(atypenum)s, 0);
+            if (%(aname)s == NULL) {
+                %(fail)s
+            }
+            """ % dict(locals(), ndim_out=len(kept))
+            copy_acc = """
+            int red_copy_err = PyArray_CopyInto(%(oname)s, %(aname)s);
+            Py_DECREF(%(aname)s);
+            if (red_copy_err) {
+                %(fail)s
+            }
+            """ % locals()
+            # The reduction releases the accumulator when it fails.
+            tasks_sub = dict(sub, fail="{Py_XDECREF(%s); %s}" % (
+                aname, sub['fail']))
+        else:
+            aname = oname
+            decl_acc = ""
+            alloc_acc = ""
+            copy_acc = ""
+
+        # The elementwise scalar op
+        map_code = self.pre_scalar_op.c_code(
+            pre_node, name + '_pre_',
+            ["red_in%d" % k for k in xrange(len(inputs))], ["red_in"],
+            dict(sub, fail=gof.cc.failure_code(sub, use_goto=False)))
+        map_code = """
+        %s red_in;
+        %s
+        """ % (pre_node.outputs[0].type.dtype_specs()[1], map_code)
+
+        tasks = self._c_reduce_tasks(
+            inputs, map_code, "red_in", mapped_dtype,
+            ["red_dims[%d]" % d for d in xrange(ndim)], aname, adtype,
+            kept, list(axis), self._c_identity(mapped_dtype), tasks_sub,
+            "red_M * red_K >= %d" % config.openmp_careduce_minsize)
+
+        return """
+        {
+            npy_intp red_dims[%(ndim)d];
+            npy_intp red_odims[%(nk)d];
+            %(decl_acc)s
+            %(shape)s
+            %(odims)s
+            if (%(oname)s == NULL || %(check_odims)s) {
+                Py_XDECREF(%(oname)s);
+                %(oname)s = (PyArrayObject*)PyArray_EMPTY(
+                    %(ndim_out)d, red_odims, %(otypenum)s, 0);
+                if (%(oname)s == NULL) {
+                    %(fail)s
+                }
+            }
+            %(alloc_acc)s
+            %(tasks)s
+            %(copy_acc)s
+        }
+        """ % dict(locals(), ndim_out=len(kept))
+
+    def c_support_code(self):
+        return self.pre_scalar_op.c_support_code()
+
+    def c_support_code_apply(self, node, name):
+        return self.pre_scalar_op.c_support_code_apply(self._pre_node(node),
+                                                       name + '_pre_')
+
+    def c_code_cache_version_apply(self, node):
+        version = [3]
+        pre_node = self._pre_node(node)
+        version.append(self.pre_scalar_op.c_code_cache_version_apply(
+            pre_node))
+        scalar_node = Apply(
+            self.scalar_op,
+            [pre_node.outputs[0].type.make_variable()] * 2,
+            [get_scalar_type(dtype=self.acc_dtype).make_variable()])
+        version.append(self.scalar_op.c_code_cache_version_apply(scalar_node))
+        for i in node.inputs + node.outputs:
+            version.append(
+                get_scalar_type(dtype=i.type.dtype).c_code_cache_version())
+        version.extend(self._c_code_openmp_version())
+        if all(version):
+            return tuple(version)
+        else:
+            return ()
@@ -245,17 +245,71 @@ def make_loop(loop_orders, dtypes, loop_tasks, sub, openmp=None):
     return "{%s}" % s
 
 
+def make_loop_order(init_loop_orders, olv_index, sub, name):
+    """Produce code sorting the loops for memory access as contiguous as
+    possible.
+
+    The loops are sorted by decreasing sum of the absolute values of the
+    strides, in bytes, of all the variables, so the inner-most loop is the
+    one where the variables are the closest to contiguous overall. The
+    dimensions of length 1 are ignored. Ties are broken with the strides of
+    the output (the variable of index olv_index), so the loops follow its
+    layout when all the variables have the same one.
+
+    The code declares the vector `name` of ((sum of the strides, stride of
+    the output), index in the initial loop order) pairs, the outer-most
+    loop first.
+
+    """
+    nnested = len(init_loop_orders[0])
+    code = """
+    std::vector< std::pair<std::pair<npy_intp, npy_intp>, int> > %(name)s(%(nnested)i);
+    """ % locals()
+
+    def stride(j, index):
+        # The stride of the jth variable in its dimension index, if it is
+        # not broadcasted.
+        var = sub['lv%i' % j]
+        return ("(PyArray_DIMS(%(var)s)[%(index)s] > 1 ? "
+                "abs(PyArray_STRIDES(%(var)s)[%(index)s]) : 0)" % locals())
+
+    for i in xrange(nnested):
+        total = " + ".join(stride(j, loop_order[i])
+                           for j, loop_order in enumerate(init_loop_orders)
+                           if loop_order[i] != 'x') or "0"
+        ostride = "0"
+        if init_loop_orders[olv_index][i] != 'x':
+            ostride = stride(olv_index, init_loop_orders[olv_index][i])
+        code += """
+        %(name)s[%(i)i].first.first = %(total)s;
+        %(name)s[%(i)i].first.second = %(ostride)s;
+        %(name)s[%(i)i].second = %(i)i;
+        """ % locals()
+    # rbegin and rend are reversed iterators, so this sorts in decreasing
+    # order: the outer-most loop has the largest strides.
+    code += """
+    std::sort(%(name)s.rbegin(), %(name)s.rend());
+    """ % locals()
+    return code
+
+
 def make_reordered_loop(init_loop_orders, olv_index, dtypes, inner_task, sub,
-                        openmp=None):
+                        openmp=None, tile=0):
     """A bit like make_loop, but when only the inner-most loop executes code.
 
-    All the loops will be reordered so that the loops over the output tensor
-    are executed with memory access as contiguous as possible.
-    For instance, if the output tensor is c_contiguous, the inner-most loop
-    will be on its rows; if it's f_contiguous, it will be on its columns.
+    All the loops will be reordered at runtime so that the variables are
+    accessed with memory access as contiguous as possible, see
+    make_loop_order. For instance, if all the tensors are c_contiguous, the
+    inner-most loop will be on their rows; if they are f_contiguous, it
+    will be on their columns.
 
     The output tensor's index among the loop variables is indicated by olv_index.
 
+    If `tile` is not 0 and a variable would rather have the two inner-most
+    loops in the other order, like when adding a matrix to a transposed
+    one, these loops are done by blocks of `tile` x `tile` iterations, so
+    that the rows of all the variables read by a block stay in the cache.
+
     """
 
     # Number of variables
@@ -266,38 +320,8 @@ def make_reordered_loop(init_loop_orders, olv_index, dtypes, inner_task, sub,
     # This is the var from which we'll get the loop order
     ovar = sub['lv%i' % olv_index]
 
-    # The loops are ordered by (decreasing) absolute values of ovar's strides.
-    # The first element of each pair is the absolute value of the stride
-    # The second element correspond to the index in the initial loop order
-    order_loops = """
-    std::vector< std::pair<int, int> > %(ovar)s_loops(%(nnested)i);
-    std::vector< std::pair<int, int> >::iterator %(ovar)s_loops_it = %(ovar)s_loops.begin();
-    """ % locals()
-
-    # Fill the loop vector with the appropriate <stride, index> pairs
-    for i, index in enumerate(init_loop_orders[olv_index]):
-        if index != 'x':
-            order_loops += """
-            %(ovar)s_loops_it->first = abs(PyArray_STRIDES(%(ovar)s)[%(index)i]);
-            """ % locals()
-        else:
-            # Stride is 0 when dimension is broadcastable
-            order_loops += """
-            %(ovar)s_loops_it->first = 0;
-            """ % locals()
-
-        order_loops += """
-        %(ovar)s_loops_it->second = %(i)i;
-        ++%(ovar)s_loops_it;
-        """ % locals()
-
-    # We sort in decreasing order so that the outermost loop (loop 0)
-    # has the largest stride, and the innermost loop (nnested - 1) has
-    # the smallest stride.
-    order_loops += """
-    // rbegin and rend are reversed iterators, so this sorts in decreasing order
-    std::sort(%(ovar)s_loops.rbegin(), %(ovar)s_loops.rend());
-    """ % locals()
+    order_loops = make_loop_order(init_loop_orders, olv_index, sub,
+                                  "%s_loops" % ovar)
 
     # Get the (sorted) total number of iterations of each loop
     # Get totals in the initial order
@@ -324,14 +348,9 @@ def make_reordered_loop(init_loop_orders, olv_index, dtypes, inner_task, sub,
 
     # Sort totals to match the new order that was computed by sorting
     # the loop vector. One integer variable per loop is declared.
-    declare_totals += """
-    %(ovar)s_loops_it = %(ovar)s_loops.begin();
-    """ % locals()
-
     for i in xrange(nnested):
         declare_totals += """
-        int TOTAL_%(i)i = init_totals[%(ovar)s_loops_it->second];
-        ++%(ovar)s_loops_it;
+        int TOTAL_%(i)i = init_totals[%(ovar)s_loops[%(i)i].second];
         """ % locals()
 
     # Get sorted strides
@@ -364,19 +383,11 @@ def make_reordered_loop(init_loop_orders, olv_index, dtypes, inner_task, sub,
                                      if len(lo) > 0))
 
     # Declare (sorted) stride and for each variable
-    # we iterate from innermost loop to outermost loop
-    declare_strides += """
-    std::vector< std::pair<int, int> >::reverse_iterator %(ovar)s_loops_rit;
-    """ % locals()
-
     for i in xrange(nvars):
         var = sub["lv%i" % i]
-        declare_strides += """
-        %(ovar)s_loops_rit = %(ovar)s_loops.rbegin();""" % locals()
         for j in reversed(xrange(nnested)):
             declare_strides += """
-            int %(var)s_stride_l%(j)i = init_strides[%(i)i][%(ovar)s_loops_rit->second];
-            ++%(ovar)s_loops_rit;
+            int %(var)s_stride_l%(j)i = init_strides[%(i)i][%(ovar)s_loops[%(j)i].second];
             """ % locals()
 
     declare_iter = ""
@@ -384,6 +395,27 @@ def make_reordered_loop(init_loop_orders, olv_index, dtypes, inner_task, sub,
         var = sub["lv%i" % i]
         declare_iter += "%(var)s_iter = (%(dtype)s*)(PyArray_DATA(%(var)s));\n" % locals()
 
+    # Tiling of the two inner-most loops. Without tiles, the blocks are the
+    # rows of the inner-most loop, so the loops are unchanged.
+    tiled = tile and nnested >= 2
+    declare_tiles = ""
+    if tiled:
+        a = nnested - 2
+        b = nnested - 1
+        cond = " || ".join(
+            "(%(var)s_stride_l%(a)i != 0 && "
+            "abs(%(var)s_stride_l%(a)i) < abs(%(var)s_stride_l%(b)i))"
+            % dict(var=sub["lv%i" % i], a=a, b=b)
+            for i in xrange(nvars))
+        declare_tiles = """
+        int TILE_%(a)i = 1;
+        int TILE_%(b)i = std::max(TOTAL_%(b)i, 1);
+        if (TOTAL_%(a)i > %(tile)i && TOTAL_%(b)i > %(tile)i && (%(cond)s)) {
+            TILE_%(a)i = %(tile)i;
+            TILE_%(b)i = %(tile)i;
+        }
+        """ % locals()
+
     pointer_update = ''
     for j, dtype in enumerate(dtypes):
         var = sub["lv%i" % j]
@@ -394,6 +426,12 @@ def make_reordered_loop(init_loop_orders, olv_index, dtypes, inner_task, sub,
             pointer_update += "+%(var)s_stride_l%(i)i*%(iterv)s" % locals()
         pointer_update += ");\n"
 
+    # The outer-most loop is run in parallel
+    pragma = ""
+    if openmp:
+        openmp_elemwise_minsize = theano.config.openmp_elemwise_minsize
+        pragma = """#pragma omp parallel for if( TOTAL_0 >=%(openmp_elemwise_minsize)s)\n""" % locals()
+
     loop = inner_task
     for i in reversed(range(nnested)):
         iterv = 'ITER_%i' % i
@@ -403,11 +441,14 @@ def make_reordered_loop(init_loop_orders, olv_index, dtypes, inner_task, sub,
         # The pointers are defined only in the most inner loop
         if i == nnested - 1:
             update = pointer_update
-        if i == 0:
-            if openmp:
-                openmp_elemwise_minsize = theano.config.openmp_elemwise_minsize
-                forloop += """#pragma omp parallel for if( %(total)s >=%(openmp_elemwise_minsize)s)\n""" % locals()
-        forloop += "for(int %(iterv)s = 0; %(iterv)s<%(total)s; %(iterv)s++)" % locals()
+        if tiled and i >= nnested - 2:
+            # The loops inside a block
+            forloop = ("for(int %(iterv)s = BLOCK_%(i)i; %(iterv)s<END_%(i)i; "
+                       "%(iterv)s++)" % locals())
+        else:
+            if i == 0:
+                forloop += pragma
+            forloop += "for(int %(iterv)s = 0; %(iterv)s<%(total)s; %(iterv)s++)" % locals()
 
         loop = """
         %(forloop)s
@@ -417,14 +458,126 @@ def make_reordered_loop(init_loop_orders, olv_index, dtypes, inner_task, sub,
         } // end loop %(i)i
         """ % locals()
 
+        if tiled and i == nnested - 2:
+            # The loops over the blocks
+            if i != 0:
+                pragma_a = ""
+            else:
+                pragma_a = pragma
+            loop = """
+            %(pragma_a)sfor(int BLOCK_%(a)i = 0; BLOCK_%(a)i<TOTAL_%(a)i; BLOCK_%(a)i+=TILE_%(a)i)
+            for(int BLOCK_%(b)i = 0; BLOCK_%(b)i<TOTAL_%(b)i; BLOCK_%(b)i+=TILE_%(b)i)
+            {
+                int END_%(a)i = std::min(BLOCK_%(a)i + TILE_%(a)i, TOTAL_%(a)i);
+                int END_%(b)i = std::min(BLOCK_%(b)i + TILE_%(b)i, TOTAL_%(b)i);
+                %(loop)s
+            }
+            """ % locals()
+
     return '\n'.join(['{',
                       order_loops,
                       declare_totals,
                       declare_strides,
                       declare_iter,
+                      declare_tiles,
                       loop,
                       '}\n'])
 
+
+def make_packed_loop(init_loop_orders, olv_index, dtypes, inner_task, sub,
+                     openmp=None):
+    """Like make_reordered_loop, but with the data pointers and the strides
+    of the variables packed in arrays.
+
+    make_reordered_loop declares a stride per variable and per loop, and
+    recomputes the address of each variable from all the loop indices in
+    the inner-most loop. Here each loop advances an array of pointers with
+    an array of strides, so the size of the code and the number of local
+    variables only grow with the number of variables, which lets a fused
+    Elemwise have any number of inputs.
+
+    The loops are ordered like in make_reordered_loop.
+
+    """
+    nvars = len(init_loop_orders)
+    nnested = len(init_loop_orders[0])
+
+    order_loops = make_loop_order(init_loop_orders, olv_index, sub,
+                                  "pk_loops")
+
+    # The number of iterations and the byte strides of the variables,
+    # in the initial order
+    totals = []
+    for candidates in zip(*init_loop_orders):
+        for j, candidate in enumerate(candidates):
+            if candidate != 'x':
+                var = sub['lv%i' % j]
+                totals.append("PyArray_DIMS(%(var)s)[%(candidate)s]"
+                              % locals())
+                break
+        else:
+            totals.append('1')
+    strides = []
+    for i, loop_order in enumerate(init_loop_orders):
+        var = sub['lv%i' % i]
+        strides.append(', '.join(
+            "PyArray_STRIDES(%s)[%s]" % (var, index)
+            if index != 'x' else '0'
+            for index in loop_order))
+    data = ', '.join("PyArray_BYTES(%s)" % sub['lv%i' % i]
+                     for i in xrange(nvars))
+    declare = """
+    const npy_intp pk_init_totals[%(nnested)i] = {%(totals)s};
+    const npy_intp pk_init_strides[%(nvars)i][%(nnested)i] = {
+        {%(strides)s}
+    };
+    char* const pk_data[%(nvars)i] = {%(data)s};
+    npy_intp pk_totals[%(nnested)i];
+    npy_intp pk_strides[%(nnested)i][%(nvars)i];
+    for (int j = 0; j < %(nnested)i; j++) {
+        pk_totals[j] = pk_init_totals[pk_loops[j].second];
+        for (int k = 0; k < %(nvars)i; k++)
+            pk_strides[j][k] = pk_init_strides[k][pk_loops[j].second];
+    }
+    """ % dict(locals(), totals=', '.join(totals),
+               strides='},\n        {'.join(strides))
+
+    # The inner-most loop binds the current element of each variable
+    last = nnested - 1
+    base = "pk_ptr%i" % (last - 1) if last else "pk_data"
+    bind = ""
+    for k, dtype in enumerate(dtypes):
+        var = sub["lv%i" % k]
+        bind += ("%(dtype)s &%(var)s_i = *(%(dtype)s*)(%(base)s[%(k)i] + "
+                 "ITER_%(last)i * pk_strides[%(last)i][%(k)i]);\n" % locals())
+    loop = """
+    for (npy_intp ITER_%(last)i = 0; ITER_%(last)i < pk_totals[%(last)i];
+         ITER_%(last)i++) {
+        %(bind)s
+        %(inner_task)s
+    }
+    """ % locals()
+    # The outer loops advance the pointers of the loop inside them
+    for i in reversed(xrange(last)):
+        base = "pk_ptr%i" % (i - 1) if i else "pk_data"
+        forloop = ""
+        if i == 0 and openmp:
+            openmp_elemwise_minsize = theano.config.openmp_elemwise_minsize
+            forloop = ("#pragma omp parallel for "
+                       "if(pk_totals[0] >= %(openmp_elemwise_minsize)s)\n"
+                       % locals())
+        loop = """
+        %(forloop)sfor (npy_intp ITER_%(i)i = 0; ITER_%(i)i < pk_totals[%(i)i];
+             ITER_%(i)i++) {
+            char* pk_ptr%(i)i[%(nvars)i];
+            for (int k = 0; k < %(nvars)i; k++)
+                pk_ptr%(i)i[k] = %(base)s[k] + ITER_%(i)i * pk_strides[%(i)i][k];
+            %(loop)s
+        }
+        """ % locals()
+
+    return '\n'.join(['{', order_loops, declare, loop, '}\n'])
+
 # print make_declare(((0, 1, 2, 3), ('x', 1, 0, 3), ('x', 'x', 'x', 0)),
 #                    ('double', 'int', 'float'),
 #                    dict(lv0='x', lv1='y', lv2='z', fail="FAIL;"))
@@ -4,6 +4,7 @@ Abstract conv interface
 from __future__ import absolute_import, print_function, division
 
 import logging
+import pkgutil
 from six import reraise, integer_types
 import sys
 from fractions import gcd
@@ -21,9 +22,10 @@ import warnings
 import numpy as np
 
 try:
-    from scipy.signal.signaltools import _valfrommode, _bvalfromboundary, convolve
-    from scipy.signal.sigtools import _convolve2d
-    imported_scipy_signal = True
+    # scipy.signal is long to import (it imports scipy.stats), so it is
+    # only imported by the python implementation of the convolutions. This
+    # only checks that it is installed, see have_scipy_signal.
+    imported_scipy_signal = pkgutil.find_loader('scipy.signal') is not None
 except ImportError:
     imported_scipy_signal = False
 
@@ -31,6 +33,29 @@ except ImportError:
 __docformat__ = "restructuredtext en"
 _logger = logging.getLogger("theano.tensor.nnet.abstract_conv")
 
+_have_scipy_signal = None
+
+
+def have_scipy_signal():
+    """
+    Return True if the scipy.signal helpers used by the python
+    implementation of the convolutions can be imported.
+
+    scipy.signal is long to import (it imports scipy.stats), so it is
+    only imported the first time this is called.
+
+    """
+    global _have_scipy_signal
+    if _have_scipy_signal is None:
+        try:
+            from scipy.signal.signaltools import (  # noqa
+                _valfrommode, _bvalfromboundary)
+            from scipy.signal.sigtools import _convolve2d  # noqa
+            _have_scipy_signal = True
+        except ImportError:
+            _have_scipy_signal = False
+    return _have_scipy_signal
+
 
 def get_conv_output_shape(image_shape, kernel_shape,
                           border_mode, subsample,
@@ -2173,10 +2198,13 @@ class BaseAbstractConv(Op):
         """
         Basic slow Python 2D or 3D convolution for DebugMode
         """
-        if not imported_scipy_signal:
+        if not have_scipy_signal():
             raise NotImplementedError(
                 "AbstractConv perform requires the python package"
                 " for scipy.signal to be installed.")
+        from scipy.signal.signaltools import (_valfrommode, _bvalfromboundary,
+                                              convolve)
+        from scipy.signal.sigtools import _convolve2d
         if not (mode in ('valid', 'full')):
             raise ValueError(
                 'invalid mode {}, which must be either '
@@ -22,16 +22,10 @@ from theano.tensor import (as_tensor_variable, blas, get_scalar_constant_value,
                            patternbroadcast, NotScalarConstantError)
 from theano.gof import Apply
 from theano.tensor.nnet.abstract_conv import (get_conv_output_shape,
-                                              get_conv_shape_1axis)
-
-try:
-    # TODO: move these back out to global scope when they no longer
-    # cause an atexit error
-    from scipy.signal.signaltools import _valfrommode, _bvalfromboundary
-    from scipy.signal.sigtools import _convolve2d
-    imported_scipy_signal = True
-except ImportError:
-    imported_scipy_signal = False
+                                              get_conv_shape_1axis,
+                                              have_scipy_signal)
+# Read by code that checks if scipy.signal is installed.
+from theano.tensor.nnet.abstract_conv import imported_scipy_signal  # noqa
 
 __docformat__ = "restructuredtext en"
 _logger = logging.getLogger("theano.tensor.nnet.conv")
@@ -695,15 +689,15 @@ class ConvOp(OpenMPOp):
         """
         img2d, filtersflipped = inp
         z, = out
-        if not imported_scipy_signal:
+        if not have_scipy_signal():
             raise theano.gof.utils.MethodNotDefined(
                 "c_headers", type(self), self.__class__.__name__,
                 "Need the python package for scipy.signal to be installed "
                 "for the python implementation. You can use the C"
                 " implementation instead.")
+        from scipy.signal.signaltools import _valfrommode, _bvalfromboundary
+        from scipy.signal.sigtools import _convolve2d
 
-        # TODO: move these back out to global scope when they no longer
-        #       cause an atexit error
         imshp = self.imshp
         if any(x is None for x in imshp):
             imshp = tuple(img2d.shape[1:])
@@ -26,7 +26,8 @@ from theano.gof.opt import copy_stack_trace, in2out
 from theano.gof.utils import MethodNotDefined
 from theano.gradient import DisconnectedType
 from theano import config
-from theano.tensor.elemwise import Elemwise, DimShuffle
+from theano.tensor.elemwise import (Elemwise, DimShuffle, CAReduce,
+                                    FusedCAReduce)
 from theano.tensor.subtensor import (get_idx_list, get_canonical_form_slice,
                                      Subtensor, IncSubtensor, make_constant,
                                      AdvancedIncSubtensor1,
@@ -172,6 +173,16 @@ class InplaceElemwiseOptimizer(Optimizer):
             for n in sorted(ndim.keys()):
                 print(blanc, n, ndim[n], file=stream)
 
+    @staticmethod
+    def profile_to_dict(prof):
+        d = dict((k, prof[k]) for k in ['node_before', 'nb_call_replace',
+                                        'nb_call_validate',
+                                        'nb_inconsistent'])
+        d.update(optimizer='InplaceElemwiseOptimizer',
+                 name=str(prof['opt'].op),
+                 ndim=dict((str(n), v) for n, v in iteritems(prof['ndim'])))
+        return d
+
     def apply(self, fgraph):
         """
         Usage: InplaceElemwiseOptimizer(op).optimize(fgraph)
@@ -7077,8 +7088,10 @@ def local_elemwise_fusion_op(OP, max_input_fct=lambda node: 32,
         limit how many ops we fuse together to avoid busting
         that 256 limit.
 
-        On the CPU we limit to 32 input variables
-        since that is the maximum numpy support.
+        On the CPU, we limit to config.tensor.elemwise_fusion_max_inputs
+        input variables to bound the size of the C code. Without a C
+        compiler we limit to 31 input variables since that is the
+        maximum numpy ufuncs support.
 
     """
     if maker is None:
@@ -7111,13 +7124,8 @@ def local_elemwise_fusion_op(OP, max_input_fct=lambda node: 32,
 
         # TODO: Related: Support composites with multiple outputs
 
-        # TODO: Use Composite to combine Elemwise and Reduce
-        # operations.  We have to loop over the data anyway... might
-        # as well sum it up while we're at it (this can be trickier
-        # than i'm making it seound here. The data-traversal should be
-        # done contiguously, and the summing-up might not be easy or
-        # worthwhile if the summation axis doesn't line up with a
-        # contiguous dimension)
+        # The Elemwise consumed by a reduction are fused into it by
+        # local_careduce_fusion.
 
         if type(node.op) is not OP:
             return False
@@ -7306,10 +7314,13 @@ your code will run correctly, but may be slower.""")
 
 def elemwise_max_input_fct(node):
     # The Elemwise.perform use numpy ufunc and they are limited to 31
-    # inputs.
+    # inputs. Past that, it loops in Python.
+    # The C code packs the pointers and the strides of the inputs in
+    # arrays when there are many of them. Its size still grows with the
+    # number of inputs, so we keep a ceiling to bound the compilation time.
     if not theano.config.cxx:
         return 31
-    return 1024
+    return theano.config.tensor.elemwise_fusion_max_inputs
 
 
 local_elemwise_fusion = local_elemwise_fusion_op(T.Elemwise,
@@ -7392,6 +7403,19 @@ class FusionOptimizer(Optimizer):
                     print(blanc, "     ", i)
         print(blanc, " time_toposort", prof[7], file=stream)
 
+    @staticmethod
+    def profile_to_dict(prof):
+        return {'optimizer': 'FusionOptimizer',
+                'name': 'FusionOptimizer',
+                'iterations': prof[1],
+                'replacements': prof[2],
+                'inconsistent_replacements': prof[3],
+                'validate_time': prof[4],
+                'callback_time': prof[5],
+                'callbacks_time': dict((str(k), v)
+                                       for k, v in iteritems(prof[6])),
+                'toposort_time': prof[7]}
+
 
 def local_add_mul_fusion(node):
     """Fuse consecutive add or mul in one such node with more inputs.
@@ -7439,6 +7463,61 @@ def local_add_mul_fusion(node):
                 return output2
         return [output]
 
+
+def local_careduce_fusion(node):
+    """
+    Fuse an Elemwise into the reduction that is its only client.
+
+    For instance, ``sum(sqr(x - y))`` becomes a FusedCAReduce computing
+    the Composite ``sqr(x - y)`` in the loop of the sum, so the
+    intermediate tensor is not allocated nor read back.
+
+    """
+    # Mean and the GPU reductions are subclasses of CAReduce with another
+    # perform or C code.
+    if (type(node.op) not in (CAReduce, T.elemwise.CAReduceDtype,
+                              T.elemwise.Sum, T.elemwise.Prod,
+                              T.elemwise.ProdWithoutZeros,
+                              T.elemwise.All, T.elemwise.Any) or
+            not theano.config.cxx):
+        return False
+    inp, = node.inputs
+    if not (inp.owner and
+            type(inp.owner.op) is Elemwise and
+            len(inp.owner.outputs) == 1 and
+            # Do not compute the elemwise operation twice.
+            len(inp.clients) == 1 and
+            inp.ndim > 0 and
+            node.op.axis != ()):
+        return False
+    elemwise = inp.owner
+    if any(v.dtype == 'float16' for v in elemwise.inputs + node.outputs):
+        return False
+    scalar_op = elemwise.op.scalar_op
+    try:
+        node.op._c_identity(inp.dtype)
+        s_node = gof.Apply(
+            scalar_op,
+            [scalar.get_scalar_type(i.dtype).make_variable()
+             for i in elemwise.inputs],
+            [scalar.get_scalar_type(inp.dtype).make_variable()])
+        scalar_op.c_code(s_node, "test_presence_of_c_code",
+                         ["x" for x in elemwise.inputs], ["z"],
+                         {"fail": "%(fail)s"})
+    except (MethodNotDefined, NotImplementedError, TypeError):
+        return False
+
+    acc_dtype = getattr(node.op, 'acc_dtype', None)
+    new_op = FusedCAReduce(node.op.scalar_op, node.op.axis, scalar_op,
+                           dtype=node.outputs[0].dtype, acc_dtype=acc_dtype,
+                           openmp=node.op.openmp)
+    out = new_op(*elemwise.inputs)
+    if out.type != node.outputs[0].type:
+        return False
+    copy_stack_trace(node.outputs + elemwise.outputs, out)
+    return [out]
+
+
 if config.tensor.local_elemwise_fusion:
     _logger.debug("enabling optimization fusion elemwise in fast_run")
     # Must be after gpu(48.5) and before AddDestroyHandler(49.5)
@@ -7449,6 +7528,9 @@ if config.tensor.local_elemwise_fusion:
     fuse_seqopt.register('composite_elemwise_fusion',
                          FusionOptimizer(local_elemwise_fusion),
                          1, 'fast_run', 'fusion')
+    fuse_seqopt.register('local_careduce_fusion',
+                         FusionOptimizer(local_careduce_fusion),
+                         2, 'fast_run', 'fusion')
     compile.optdb.register('elemwise_fusion',
                            fuse_seqopt, 49,
                            'fast_run', 'fusion', 'local_elemwise_fusion',
@@ -17,7 +17,7 @@ from theano import tensor
 from theano.tensor import TensorType, as_tensor_variable
 from theano.compile.mode import get_default_mode, Mode
 from theano.tensor.elemwise import (CAReduce, Elemwise, DimShuffle,
-                                    Prod, ProdWithoutZeros)
+                                    FusedCAReduce, Prod, ProdWithoutZeros)
 from theano.tests import unittest_tools
 from theano.tests.unittest_tools import attr
 import theano.tests.unittest_tools as utt
@@ -563,6 +563,41 @@ class test_CAReduce(unittest_tools.InferShapeTester):
             self.with_mode(Mode(linker='c'), scalar.and_, dtype=dtype)
             self.with_mode(Mode(linker='c'), scalar.xor, dtype=dtype)
 
+    def test_c_openmp(self):
+        if not theano.config.cxx:
+            raise SkipTest("G++ not available, so we need to skip this test.")
+        for deterministic in ['default', 'more']:
+            with theano.change_flags(openmp=True,
+                                     openmp_careduce_minsize=0,
+                                     deterministic=deterministic):
+                for dtype in ["bool", "floatX", "complex64", "int8"]:
+                    self.with_mode(Mode(linker='c'), scalar.add, dtype=dtype)
+                    self.with_mode(Mode(linker='c'), scalar.mul, dtype=dtype)
+                for dtype in ["floatX", "uint8"]:
+                    self.with_mode(Mode(linker='c'), scalar.minimum,
+                                   dtype=dtype)
+                    self.with_mode(Mode(linker='c'), scalar.maximum,
+                                   dtype=dtype)
+                    self.with_mode(Mode(linker='c'), scalar.and_, dtype=dtype,
+                                   tensor_op=tensor.all)
+                    self.with_mode(Mode(linker='c'), scalar.or_, dtype=dtype,
+                                   tensor_op=tensor.any)
+
+    def test_openmp_strides(self):
+        # The OpenMP code handles any strides, and splits the reductions
+        # over a few output elements between the threads.
+        if not theano.config.cxx:
+            raise SkipTest("G++ not available, so we need to skip this test.")
+        rng = np.random.RandomState(utt.fetch_seed())
+        xv = rng.rand(3, 40000, 5).astype(config.floatX)
+        x = tensor.tensor3()
+        for axis in [None, (1,), (0, 2), (1, 2)]:
+            with theano.change_flags(openmp=True):
+                e = self.op(scalar.add, axis=axis)(x)
+            f = theano.function([x], e, mode=Mode(linker='c'))
+            for v in [xv, xv[:, ::-3], np.asfortranarray(xv)]:
+                utt.assert_allclose(f(v), v.sum(axis=axis))
+
     @attr('slow')
     def test_c_nan(self):
         if not theano.config.cxx:
@@ -1222,6 +1257,132 @@ class TestElemwise(unittest_tools.InferShapeTester):
                             mode=theano.compile.Mode(linker='py'))
         g(*[np.zeros(2 ** 11, config.floatX) for i in xrange(6)])
 
+    def test_many_inputs(self):
+        # More inputs than NumPy ufuncs support: perform loops in Python,
+        # and the C code packs the pointers and strides in arrays.
+        rng = np.random.RandomState(utt.fetch_seed())
+        n = 40
+        inputs = [tensor.dmatrix() for i in xrange(n - 1)] + [tensor.drow()]
+        values = [rng.rand(3, 4) for i in xrange(n - 1)] + [rng.rand(1, 4)]
+        # Transposed inputs use other strides than the output.
+        values[0] = rng.rand(4, 3).T
+        expected = sum(values[1:], values[0])
+        for linker in ['py', 'c']:
+            if linker == 'c' and not theano.config.cxx:
+                continue
+            f = theano.function(inputs, Elemwise(scalar.add)(*inputs),
+                                mode=Mode(linker=linker))
+            utt.assert_allclose(f(*values), expected)
+            self.assertRaises(ValueError, f,
+                              *([rng.rand(3, 5)] + values[1:]))
+
+    def test_layouts(self):
+        # The C code orders the loops with the strides of all the inputs
+        # and outputs, and tiles them when they disagree.
+        if not theano.config.cxx:
+            raise SkipTest("No compiler given")
+        rng = np.random.RandomState(utt.fetch_seed())
+        x = tensor.dmatrix()
+        y = tensor.dmatrix()
+        r = tensor.drow()
+        f = theano.function([x, y, r], [x + y, x * r],
+                            mode=Mode(linker='c', optimizer=None))
+        n, m = Elemwise.loop_tile + 3, Elemwise.loop_tile + 1
+        for xv, yv in [(rng.rand(n, m), rng.rand(m, n).T),
+                       (rng.rand(m, n).T, rng.rand(n, m)),
+                       (rng.rand(m, n).T, rng.rand(m, n).T),
+                       (rng.rand(n, 2 * m)[:, ::2], rng.rand(m, n).T)]:
+            rv = rng.rand(1, m)
+            out_add, out_mul = f(xv, yv, rv)
+            utt.assert_allclose(out_add, xv + yv)
+            utt.assert_allclose(out_mul, xv * rv)
+
+        x3 = tensor.dtensor3()
+        y3 = tensor.dtensor3()
+        f = theano.function([x3, y3], x3 - y3,
+                            mode=Mode(linker='c', optimizer=None))
+        xv = rng.rand(4, 5, 6)
+        for axes in [(0, 1, 2), (2, 1, 0), (1, 0, 2), (0, 2, 1)]:
+            yv = rng.rand(*[xv.shape[a] for a in axes]).transpose(
+                np.argsort(axes))
+            utt.assert_allclose(f(xv, yv), xv - yv)
+            utt.assert_allclose(f(yv, xv), yv - xv)
+
+
+class TestFusedCAReduce(unittest_tools.InferShapeTester):
+    def setUp(self):
+        super(TestFusedCAReduce, self).setUp()
+        x = scalar.float64()
+        y = scalar.float64()
+        self.sqr_diff = scalar.Composite([x, y], [scalar.sqr(x - y)])
+
+    def test_perform_c(self):
+        rng = np.random.RandomState(utt.fetch_seed())
+        x = tensor.dtensor3()
+        y = TensorType('float64', (False, True, False))()
+        xv = rng.rand(4, 5, 6)
+        yv = rng.rand(4, 1, 6)
+        for axis in [None, (0,), (1,), (2,), (0, 2), (1, 2)]:
+            op = FusedCAReduce(scalar.add, axis, self.sqr_diff, 'float64')
+            expected = ((xv - yv) ** 2).sum(axis=axis)
+            for linker in ['py', 'c']:
+                if linker == 'c' and not theano.config.cxx:
+                    continue
+                f = theano.function([x, y], op(x, y),
+                                    mode=Mode(linker=linker))
+                utt.assert_allclose(f(xv, yv), expected)
+                utt.assert_allclose(f(xv[:, ::-1], yv),
+                                    ((xv[:, ::-1] - yv) ** 2).sum(axis=axis))
+                self.assertRaises(ValueError, f, xv[:3], yv)
+
+    def test_many_inputs(self):
+        # More inputs than NumPy ufuncs support.
+        rng = np.random.RandomState(utt.fetch_seed())
+        n = 40
+        inputs = [tensor.dmatrix() for i in xrange(n - 1)] + [tensor.drow()]
+        values = [rng.rand(3, 4) for i in xrange(n - 1)] + [rng.rand(1, 4)]
+        expected = sum(values[1:], values[0]).sum(axis=1)
+        op = FusedCAReduce(scalar.add, (1,), scalar.add, 'float64')
+        for linker in ['py', 'c']:
+            if linker == 'c' and not theano.config.cxx:
+                continue
+            f = theano.function(inputs, op(*inputs),
+                                mode=Mode(linker=linker))
+            utt.assert_allclose(f(*values), expected)
+            self.assertRaises(ValueError, f,
+                              *([rng.rand(3, 5)] + values[1:]))
+
+    def test_acc_dtype(self):
+        x = tensor.fvector()
+        xv = np.arange(1e5, dtype='float32')
+        op = FusedCAReduce(scalar.add, None, scalar.sqr, 'float32',
+                           acc_dtype='float64')
+        f = theano.function([x], op(x))
+        assert f(xv).dtype == 'float32'
+        utt.assert_allclose(f(xv), (xv.astype('float64') ** 2).sum())
+
+    def test_zero_size(self):
+        x = tensor.dmatrix()
+        xv = np.zeros((3, 0))
+        f = theano.function([x], FusedCAReduce(
+            scalar.add, (1,), scalar.sqr, 'float64')(x))
+        utt.assert_allclose(f(xv), np.zeros(3))
+        f = theano.function([x], FusedCAReduce(
+            scalar.maximum, (1,), scalar.sqr, 'float64')(x))
+        self.assertRaises(ValueError, f, xv)
+
+    def test_infer_shape(self):
+        x = tensor.dtensor3()
+        y = TensorType('float64', (False, True, False))()
+        xv = np.random.rand(4, 5, 6)
+        yv = np.random.rand(4, 1, 6)
+        for axis in [None, (0,), (1,), (0, 2)]:
+            self._compile_and_check(
+                [x, y],
+                [FusedCAReduce(scalar.add, axis, self.sqr_diff,
+                               'float64')(x, y)],
+                [xv, yv], FusedCAReduce)
+
 
 def test_gt_grad():
     # A user test that failed.
@@ -59,7 +59,7 @@ from theano.tensor import (
     TensorType,
     tile
     )
-from theano.tensor.elemwise import DimShuffle
+from theano.tensor.elemwise import DimShuffle, FusedCAReduce
 from theano.tensor.type import values_eq_approx_remove_nan
 from theano.tests import unittest_tools as utt
 from theano.gof.opt import check_stack_trace, out2in
@@ -1205,6 +1205,26 @@ class test_fusion(unittest.TestCase):
         # Test it on some dummy values
         f(*[list(range(i, 4 + i)) for i in xrange(35)])
 
+    def test_fusion_many_inputs(self):
+        # Past 32 operands, the C code keeps the pointers and the strides
+        # of the operands in arrays, so the expression tree is still fused
+        # into a single loop.
+        if not theano.config.cxx:
+            raise SkipTest("no c compiler, so can't use big elemwise!")
+        nb_inputs = 48
+        inpts = [tensor.dmatrix('i%i' % i) for i in xrange(nb_inputs)]
+        out = tensor.add(*[tensor.sin(i) for i in inpts])
+
+        f = function(inpts, out, mode=self.mode)
+        topo = [n for n in f.maker.fgraph.toposort()
+                if not isinstance(n.op, self.topo_exclude)]
+        assert len(topo) == 1
+        assert len(topo[0].inputs) == nb_inputs
+        vals = [np.random.rand(2, 3) for i in xrange(nb_inputs)]
+        # A transposed input is not handled by the contiguous loop.
+        vals[0] = np.random.rand(3, 2).T
+        utt.assert_allclose(f(*vals), np.sin(vals).sum(axis=0))
+
     def test_pickle_big_fusion(self):
         # In the past, pickle of Composite generated in that case
         # crashed with max recusion limit. So we where not able to
@@ -1295,6 +1315,69 @@ class test_fusion(unittest.TestCase):
                               assert_len_topo=False, slice=s, nb_repeat=100))
 
 
+class TestCAReduceFusion(unittest.TestCase):
+    def setUp(self):
+        if not theano.config.cxx:
+            raise SkipTest("The fusion of the reductions needs a C compiler")
+        self.mode = theano.compile.mode.get_default_mode().including(
+            'fusion')
+        if self.mode.optimizer is None:
+            raise SkipTest("The mode does not optimize")
+        rng = np.random.RandomState(utt.fetch_seed())
+        self.xv = rng.rand(30, 20)
+        self.yv = rng.rand(30, 20)
+
+    def test_fused(self):
+        x, y = dmatrices('xy')
+        r = T.drow('r')
+        xv, yv, rv = self.xv, self.yv, self.yv[:1]
+        for expr, expected in [
+                (T.sum(T.sqr(x - y)), ((xv - yv) ** 2).sum()),
+                (T.sum(T.sqr(x - y), axis=0), ((xv - yv) ** 2).sum(0)),
+                (T.max(abs(x - r), axis=1), abs(xv - rv).max(1)),
+                (T.prod(1 + x * y, axis=1), (1 + xv * yv).prod(1)),
+                (T.any(x > y), (xv > yv).any())]:
+            f = function([x, y, r], expr, mode=self.mode,
+                         on_unused_input='ignore')
+            topo = f.maker.fgraph.toposort()
+            assert len(topo) == 1, topo
+            assert isinstance(topo[0].op, FusedCAReduce)
+            utt.assert_allclose(f(xv, yv, rv), expected)
+            assert check_stack_trace(f, ops_to_check=FusedCAReduce)
+
+    def test_not_fused(self):
+        # The result of the elemwise operation is needed elsewhere.
+        x, y = dmatrices('xy')
+        d = T.sqr(x - y)
+        f = function([x, y], [d, T.sum(d)], mode=self.mode)
+        assert not any(isinstance(n.op, FusedCAReduce)
+                       for n in f.maker.fgraph.toposort())
+        utt.assert_allclose(f(self.xv, self.yv)[1],
+                            ((self.xv - self.yv) ** 2).sum())
+
+        mode = self.mode.excluding('local_careduce_fusion')
+        f = function([x, y], T.sum(d), mode=mode)
+        assert not any(isinstance(n.op, FusedCAReduce)
+                       for n in f.maker.fgraph.toposort())
+
+    def test_no_intermediate(self):
+        # The fused reduction does not allocate the result of sqr(x - y).
+        x, y = dmatrices('xy')
+        mode = theano.Mode(linker=theano.gof.vm.VM_Linker(use_cloop=True),
+                           optimizer='fast_run')
+        allocated = {}
+        for name, m in [('fused', mode),
+                        ('not fused', mode.excluding('local_careduce_fusion'))]:
+            with theano.change_flags({'profiling.measure_memory': True}):
+                p = theano.ProfileStats(False, gpu_checks=False)
+                f = function([x, y], T.sum(T.sqr(x - y)), mode=m, profile=p)
+            utt.assert_allclose(f(self.xv, self.yv),
+                                ((self.xv - self.yv) ** 2).sum())
+            allocated[name] = sum(p.measured_memory.node_allocated.values())
+        assert allocated['fused'] < self.xv.nbytes, allocated
+        assert allocated['not fused'] >= self.xv.nbytes, allocated
+
+
 class TimesN(theano.scalar.basic.UnaryScalarOp):
     """
     Used in test TestCompositeCodegen
@@ -5231,8 +5314,8 @@ class T_local_sum_prod(unittest.TestCase):
     Test sum/prod opts in opt.py
     """
     def setUp(self):
-        self.mode = theano.compile.get_default_mode().including('canonicalize',
-                                                                'specialize')
+        self.mode = theano.compile.get_default_mode().including(
+            'canonicalize', 'specialize').excluding('local_careduce_fusion')
 
     def test_local_sum_prod_mul_by_scalar(self):
         # Test the optimization local_sum_prod_mul_by_scalar for both Sum and
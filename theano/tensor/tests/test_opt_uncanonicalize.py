@@ -46,7 +46,7 @@ class T_min_max(unittest.TestCase):
     def setUp(self):
         utt.seed_rng()
         self.mode = theano.compile.mode.get_default_mode().including(
-            'canonicalize', 'fast_run')
+            'canonicalize', 'fast_run').excluding('local_careduce_fusion')
 
     def test_optimization_max(self):
         data = np.asarray(np.random.rand(2, 3), dtype=config.floatX)